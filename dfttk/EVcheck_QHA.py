@@ -7,7 +7,6 @@ from copy import deepcopy
 from atomate.vasp.database import VaspCalcDb
 from atomate.utils.utils import env_chk
 from dfttk.utils import sort_x_by_y, mark_adopted, consistent_check_db, check_relax_path
-from itertools import combinations
 from pymatgen.analysis.eos import EOS
 from fireworks import FiretaskBase, LaunchPad, Workflow, Firework
 from fireworks.utilities.fw_utilities import explicit_serialize
@@ -178,6 +177,108 @@ def update_err(temperror, error, verbose, ind, **kwargs):
     elif temperror < error: return temperror, temp_ind
     else: return error, ind
 
+def eos_outlier_search(volumes, energies, tolerance, ind=None, min_points=4, error=1e10, verbose=False):
+    """
+    Search the subset of the volume-energy points to be fitted within the tolerance by
+    removing one point a time, it replaces the search over all the combinations
+
+    The points are ranked by the linear (in parameters) 3rd order Birch-Murnaghan EOS,
+    E = a + b*V^(-2/3) + c*V^(-4/3) + d*V^(-2), for which the fitting error after removing
+    the i-th point is known from one least squares fit by the leave-one-out relation
+    SSE_i = SSE - e_i^2/(1-h_ii), where e_i is the residual and h_ii the leverage. The point
+    giving the largest reduction is dropped. Only the nested subsets on the way, at most
+    len(ind)-min_points+1 of them, are fitted by the nonlinear Vinet EOS to be judged by
+    the same error as before.
+
+    Parameter
+    ---------
+        volumes: list
+            The volumes
+        energies: list
+            The energies, len(energies)=len(volumes)
+        tolerance: float
+            The acceptable error by eosfit_stderr
+        ind: index list
+            The indices of the points to start with, default: all
+        min_points: int
+            The minimum number of points to be kept, default: 4
+        error: float
+            The error of the best subset found before
+        verbose: bool
+            Print(True) the informations or not(False)
+    Return
+    ------
+        error: float
+            The minimum error, it is the input error if no subset is better
+        ind: index list
+            The subset with the minimum error, None if no subset is better than the input error
+        eos_fit: pymatgen.analysis.eos.fit class
+            The Vinet fitting of the subset
+        dropped: list of dict
+            The points not in the subset, with keys index, volume, energy, residual (of the
+            linear EOS fitting when the point was dropped) and reason
+    """
+    if ind is None: ind = range(len(volumes))
+    keep = list(ind)
+    best_ind = None
+    eos_fit = None
+    steps = []
+    eos = EOS('vinet')
+    while True:
+        volume = np.array([volumes[i] for i in keep], dtype=float)
+        energy = np.array([energies[i] for i in keep], dtype=float)
+        try:
+            fit = eos.fit(volume, energy)
+            temperror = eosfit_stderr(fit, volume, energy)
+            if verbose:
+                print('error = %.4f in %s ' %(temperror, keep))
+            if temperror < error:
+                error, best_ind, eos_fit = temperror, list(keep), fit
+        except Exception:
+            if verbose:
+                print('Fitting error in: ', keep, '. If you can not achieve QHA result, try to run far negative deformations.')
+        if error <= tolerance or len(keep) <= min_points: break
+        x = (volume/np.mean(volume))**(-2./3.)
+        q, _ = np.linalg.qr(np.vander(x, 4, increasing=True))
+        residuals = energy - q @ (q.T @ energy)
+        leverage = np.minimum(np.sum(q*q, axis=1), 1.0-1.e-12)
+        gain = residuals**2/(1.0-leverage)
+        j = int(np.argmax(gain))
+        steps.append({'index': int(keep[j]), 'volume': float(volume[j]), 'energy': float(energy[j]),
+            'residual': float(residuals[j]), 'reason': 'largest leave-one-out reduction of the linear '
+            'EOS fitting error among {} points'.format(len(keep))})
+        keep.pop(j)
+    dropped = []
+    if best_ind is not None:
+        dropped = [step for step in steps if step['index'] not in best_ind]
+    return error, best_ind, eos_fit, dropped
+
+def dropped_points(ind, volumes, energies, reasons):
+    """
+    Report the points not in the selected index list ind
+
+    Parameter
+    ---------
+        ind: index list
+            The selected points
+        volumes, energies: list
+            All the points
+        reasons: dict
+            The dropping record of the points by index, see eos_outlier_search
+    Return
+    ------
+        dropped: list of dict with keys index, volume, energy, residual and reason
+    """
+    dropped = []
+    for i in range(len(volumes)):
+        if i in ind: continue
+        d = {'index': int(i), 'volume': float(volumes[i]), 'energy': float(energies[i]), 'residual': None,
+            'reason': 'not selected'}
+        d.update(reasons.get(i, {}))
+        dropped.append(d)
+        print('Dropped point %s: volume = %s, energy = %s, %s' %(i, volumes[i], energies[i], d['reason']))
+    return dropped
+
 
 @explicit_serialize
 class EVcheck_QHA(FiretaskBase):
@@ -299,10 +400,11 @@ class EVcheck_QHA(FiretaskBase):
         else:
             self.correct = True
             self.error = 1e10
+            self.dropped = []
 
         EVcheck_result = init_evcheck_result(append_run_num=run_num, correct=self.correct, volumes=volumes,
                          energies=energies, eos_tolerance=eos_tolerance, threshold=threshold, vol_spacing=vol_spacing,
-                         error=self.error, metadata=metadata)
+                         error=self.error, metadata=metadata, dropped=self.dropped)
 
         if self.correct:
             vol_orig = structure.volume
@@ -378,7 +480,8 @@ class EVcheck_QHA(FiretaskBase):
                     too_many_run_error()
             else:  # No need to do more VASP calculation, QHA could be running
                 print('Success in Volumes-Energies checking, enter QHA ...')
-                debye_fw = Firework(QHAAnalysis(phonon=phonon, t_min=t_min, t_max=t_max, t_step=t_step, db_file=self.get('db_file', DB_FILE), tag=tag, metadata=metadata),
+                debye_fw = Firework(QHAAnalysis(phonon=phonon, t_min=t_min, t_max=t_max, t_step=t_step, db_file=self.get('db_file', DB_FILE), tag=tag, metadata=metadata,
+                    batch=(settings or {}).get('qha_batch', False)),
                                     name="{}-qha_analysis".format(structure.composition.reduced_formula))
                 fws.append(debye_fw)
                 '''
@@ -426,6 +529,7 @@ class EVcheck_QHA(FiretaskBase):
         num = np.arange(len(volumes))
         comb = num
         limit = len(volumes) * del_limited
+        reasons = {}
 
         # For len(num) > threshold case, do a whole number fitting to pass numbers delete if met tolerance
         for i in range(1):     # To avoid the codes after except running, ?
@@ -453,31 +557,20 @@ class EVcheck_QHA(FiretaskBase):
             num = sort_x_by_y(num, errors)
             errors = sorted(errors)
             for m in range(min(len(errors) - threshold, 1)):
+                reasons[num[-1]] = {'residual': float(errors[-1]),
+                    'reason': 'largest residual of the Vinet fitting of {} points'.format(len(num))}
                 errors.pop(-1)
                 num.pop(-1)
             temperror = cal_stderr(errors)
             error, comb = update_err(temperror=temperror, error=error, verbose=verbose, ind=comb, temp_ind=num)
 
-        # combinations
-        len_comb = len(comb)
-        if (error > eos_tolerance) and (len_comb <= threshold):
-            comb_source = comb
-            while (error > eos_tolerance) and (len_comb >= 4):
-                print('Combinations in "%s"...' %len_comb)
-                combination = combinations(comb_source, len_comb)
-                for combs in combination:
-                    print(volumes)
-                    print(energies)
-                    volume, energy = gen_volenergdos(combs, volumes, energies)
-                    try:
-                        self.check_fit(volume, energy)
-                    except:
-                        if verbose:
-                            print('Fitting error in: ', combs, '. If you can not achieve QHA result, try to run far negative deformations.')
-                        continue
-                    temperror = eosfit_stderr(self.eos_fit, volume, energy)
-                    error, comb = update_err(temperror=temperror, error=error, verbose=verbose, ind=comb, temp_ind=combs)
-                len_comb -= 1
+        # remove the outliers one by one
+        if (error > eos_tolerance) and (len(comb) <= threshold):
+            temperror, temp_ind, _, dropped = eos_outlier_search(volumes, energies, eos_tolerance,
+                ind=comb, error=error, verbose=verbose)
+            if temp_ind is not None:
+                error, comb = temperror, temp_ind
+                reasons.update({d['index']: d for d in dropped})
 
         print('Minimum error = %s' %error, comb)
         if error <= eos_tolerance:
@@ -486,6 +579,7 @@ class EVcheck_QHA(FiretaskBase):
         comb.sort()
         self.points = comb
         self.error = error
+        self.dropped = dropped_points(comb, volumes, energies, reasons)
 
     def check_vol_coverage(self, volume, vol_spacing, vol_orig, run_num, energy, structure,
         dos_objects, phonon, db_file, tag, t_min, t_max, t_step, EVcheck_result):
@@ -701,7 +795,8 @@ class Crosscom_EVcheck_QHA(FiretaskBase):
                 if not test: lpad.add_wf(wfs)
         else:  # No need to do more VASP calculation, QHA could be running
             print('Success in Volumes-Energies checking, enter QHA ...')
-            debye_fw = Firework(QHAAnalysis(phonon=phonon, t_min=t_min, t_max=t_max, t_step=t_step, db_file=self.get('db_file', DB_FILE), tag=tag, metadata=metadata),
+            debye_fw = Firework(QHAAnalysis(phonon=phonon, t_min=t_min, t_max=t_max, t_step=t_step, db_file=self.get('db_file', DB_FILE), tag=tag, metadata=metadata,
+                    batch=(settings or {}).get('qha_batch', False)),
                 name="{}-qha_analysis".format(structure.composition.reduced_formula))
             fws=[debye_fw]
 
@@ -807,8 +902,9 @@ class PreEV_check(FiretaskBase):
         volumes, energies = self.get_orig_EV_structure(db_file, tag)
         self.check_points(db_file, metadata, tolerance, 0.1, del_limited, volumes, energies, verbose)
 
-        EVcheck_result = init_evcheck_result(run_num, self.correct, volumes, energies, tolerance,
-                                             threshold, vol_spacing, self.error, metadata)
+        EVcheck_result = init_evcheck_result(append_run_num=run_num, correct=self.correct, volumes=volumes,
+                         energies=energies, tolerance=tolerance, threshold=threshold, vol_spacing=vol_spacing,
+                         error=self.error, metadata=metadata, dropped=self.dropped)
 
         structure.scale_lattice(self.minE_value)
         if site_properties:
@@ -923,6 +1019,7 @@ class PreEV_check(FiretaskBase):
         num = np.arange(len(volumes))
         comb = num
         limit = len(volumes) * del_limited
+        reasons = {}
 
         # For len(num) > threshold case, do a whole number fitting to pass numbers delete if met tolerance
         for i in range(1):     # To avoid the codes after except running
@@ -950,6 +1047,8 @@ class PreEV_check(FiretaskBase):
             num = sort_x_by_y(num, errors)
             errors = sorted(errors)
             for m in range(min(len(errors) - threshold, 1)):
+                reasons[num[-1]] = {'residual': float(errors[-1]),
+                    'reason': 'largest residual of the Vinet fitting of {} points'.format(len(num))}
                 errors.pop(-1)
                 num.pop(-1)
             temperror = cal_stderr(errors)
@@ -960,30 +1059,14 @@ class PreEV_check(FiretaskBase):
                 comb = num
                 self.minE_value = self.eos_fit.v0
 
-        # combinations
-
-        len_comb = len(comb)
-        if (error > tolerance) and (len_comb <= threshold):
-            comb_source = comb
-            while (error > tolerance) and (len_comb >= 4):
-                print('Combinations in "%s"...' %len_comb)
-                combination = combinations(comb_source, len_comb)
-                for combs in combination:
-                    volume, energy = gen_volenergdos(combs, volumes, energies)
-                    try:
-                        self.check_fit(volume, energy)
-                    except:
-                        if verbose:
-                            print('Fitting error in: ', comb)
-                        continue
-                    temperror = eosfit_stderr(self.eos_fit, volume, energy)
-                    if verbose:
-                        print('error = %.4f in %s ' %(temperror, combs))
-                    if temperror < error:
-                        error = temperror
-                        comb = combs
-                        self.minE_value = self.eos_fit.v0
-                len_comb -= 1
+        # remove the outliers one by one
+        if (error > tolerance) and (len(comb) <= threshold):
+            temperror, temp_ind, eos_fit, dropped = eos_outlier_search(volumes, energies, tolerance,
+                ind=comb, error=error, verbose=verbose)
+            if temp_ind is not None:
+                error, comb = temperror, temp_ind
+                self.minE_value = eos_fit.v0
+                reasons.update({d['index']: d for d in dropped})
 
         print('Minimum error = %s' %error, comb)
         if error <= tolerance:
@@ -993,6 +1076,7 @@ class PreEV_check(FiretaskBase):
         comb.sort()
         self.points = comb
         self.error = error
+        self.dropped = dropped_points(comb, volumes, energies, reasons)
 
     def check_vol_coverage(self, volume, vol_spacing, vol_orig, run_num, energy, structure,
         phonon, db_file, tag, t_min, t_max, t_step, EVcheck_result):
@@ -18,6 +18,7 @@ import scipy.constants as scipy_constants
 
 from scipy.integrate import quadrature
 from scipy.stats import gmean
+from scipy.special import bernoulli, factorial
 
 from pymatgen.analysis.eos import EOS
 
@@ -25,6 +26,74 @@ from pymatgen.analysis.eos import EOS
 __author__ = "Kiran Mathew, Brandon Bocklund"
 __credits__ = "Cormac Toher"
 
+# coefficients B_n/((n+3) n!) of the small y series of int_0^y x^3/(e^x-1) dx
+_NSERIES = 40
+_SERIES = bernoulli(_NSERIES)/((np.arange(_NSERIES+1)+3)*factorial(np.arange(_NSERIES+1)))
+_SERIES[3::2] = 0.0 # the odd Bernoulli numbers beyond B_1 vanish
+_Y_SERIES = 2.0
+_Y_MAX = 155.0
+_PI4_15 = scipy_constants.pi**4/15.
+
+
+def debye_integral_3(y):
+    """
+    int_0^y x^3/(e^x-1) dx for an array of y
+
+    The Bernoulli series x/(e^x-1) = sum B_n x^n/n! is used for y < 2 and
+    pi^4/15 - sum_k e^(-ky) (y^3/k + 3y^2/k^2 + 6y/k^3 + 6/k^4) beyond, which both
+    converge to the double precision with the number of terms used
+
+    Args:
+        y (array): upper limit
+
+    Returns:
+        array: the integral
+    """
+    y = np.asarray(y, dtype=float)
+    result = np.empty(y.shape)
+    small = y < _Y_SERIES
+    ys = y[small]
+    result[small] = ys**3*np.polyval(_SERIES[::-1], ys)
+    yl = y[~small]
+    tail = np.zeros(yl.shape)
+    for k in range(1, 40):
+        z = k*yl
+        tail += np.exp(-z)*(((z + 3.)*z + 6.)*z + 6.)/k**4
+    result[~small] = _PI4_15 - tail
+    return result
+
+
+def debye_function(y):
+    """
+    Debye integral 3/y^3 int_0^y x^3/(e^x-1) dx for an array of y. Eq(5) in doi.org/10.1016/j.comphy.2003.12.001
+
+    Args:
+        y (array): debye temperature/T, upper limit
+
+    Returns:
+        array: unitless
+    """
+    y = np.asarray(y, dtype=float)
+    return 3./y**3*np.where(y < _Y_MAX, debye_integral_3(np.minimum(y, _Y_MAX)), _PI4_15)
+
+
+def debye_cv_function(y):
+    """
+    3/y^3 int_0^y x^4 e^x/(e^x-1)^2 dx for an array of y, the heat capacity integral
+    given by parts as 3/y^3 (4 int_0^y x^3/(e^x-1) dx - y^4/(e^y-1))
+
+    Args:
+        y (array): debye temperature/T, upper limit
+
+    Returns:
+        array: unitless
+    """
+    y = np.asarray(y, dtype=float)
+    _y = np.minimum(y, _Y_MAX)
+    integral = 4.*debye_integral_3(_y) - _y**4/np.expm1(_y)
+    return 3./y**3*np.where(y < _Y_MAX, integral, 4.*_PI4_15)
+
+
 
 class DebyeModel(object):
     """
@@ -99,23 +168,30 @@ class DebyeModel(object):
         self.ev_eos_fit = self.eos.fit(volumes, energies)
         self.bulk_modulus = self.ev_eos_fit.b0_GPa  # in GPa
 
+        self._debye_temperatures = {}
+
         self.calculate_F_el()
 
     def calculate_F_el(self):
         """
         Calculate the Helmholtz vibrational free energy
 
+        All volumes and temperatures are handled together on the (V, T) grid
+        of y = debye temperature/T by the array Debye functions
+
         """
-        self.F_vib = np.zeros((len(self.volumes), self.temperatures.size ))
-        self.S_vib = np.zeros((len(self.volumes), self.temperatures.size ))
-        self.C_vib = np.zeros((len(self.volumes), self.temperatures.size ))
-        self.D_vib = np.zeros((len(self.volumes)))
-        for v_idx, vol in enumerate(self.volumes):
-            self.D_vib[v_idx] = self.debye_temperature(vol)
-            for t_idx, temp in enumerate(self.temperatures):
-                self.F_vib[v_idx, t_idx] = self.vibrational_free_energy(temp, vol)
-                self.S_vib[v_idx, t_idx] = self.vibrational_entropy(temp, vol)
-                self.C_vib[v_idx, t_idx] = self.vibrational_heat_capacity(temp, vol)
+        T = np.asarray(self.temperatures, dtype=float)
+        self.D_vib = np.array([self.debye_temperature(vol) for vol in self.volumes], dtype=float)
+        debye = np.broadcast_to(self.D_vib[:,None], (len(self.volumes), T.size))
+        kn = self.kb * self.natoms
+        positive = T > 0.0
+        _T = np.where(positive, T, 1.0)
+        y = debye/_T[None,:]
+        log1mexp = np.log(-np.expm1(-y))
+        D = debye_function(y)
+        self.F_vib = np.where(positive, kn * _T * (9./8. * y + 3 * log1mexp - D), kn * debye * 9./8.)
+        self.S_vib = np.where(positive, kn * ( -3 * log1mexp + 4*D), 0.0)
+        self.C_vib = np.where(positive, 3*kn * debye_cv_function(y), 0.0)
 
 
     def vibrational_free_energy(self, temperature, volume):
@@ -207,6 +283,15 @@ class DebyeModel(object):
 
         """
 
+        if volume in self._debye_temperatures: return self._debye_temperatures[volume]
+        debye = self.calc_debye_temperature(volume)
+        self._debye_temperatures[volume] = debye
+        return debye
+
+    def calc_debye_temperature(self, volume):
+        """
+        Calculates the debye temperature without the cache of debye_temperature
+        """
         hbar = scipy_constants.hbar #1.054571817e-34
         kB = scipy_constants.Boltzmann #1.38064852e-23
         pi = scipy_constants.pi
@@ -63,11 +63,21 @@ class Quasiharmonic(object):
         value and 1 is the low temperature value. Defaults to 1.
     vib_kwargs : dict
         Additional keyword arguments to pass to the vibrational calculator
+    batch : bool
+        If True, minimize G(V) for all temperatures together by fitting a polynomial in V^(-1/3)
+        (the BMvol4/BMvol5 form of pythelec) as one least-squares problem. Defaults to False,
+        i.e., an EOS fit and minimization for each temperature.
+    batch_order : int
+        Number of parameters of the polynomial used for batch. Defaults to 5.
+    batch_tol : float
+        Temperatures whose root-mean-square residual of the polynomial fit exceeds batch_tol (eV),
+        or whose minimum can not be located within the volume range, fall back to the
+        EOS fit. Defaults to 1e-4.
     """
     def __init__(self, energies, volumes, structure, dos_objects=None, F_vib=None, S_vib=None, C_vib=None,
                  t_min=5, t_step=5,
                  t_max=2000.0, eos="vinet", pressure=0.0, poisson=0.25,
-                 bp2gru=2./3., vib_kwargs=None):
+                 bp2gru=2./3., vib_kwargs=None, batch=False, batch_order=5, batch_tol=1.e-4):
         self.energies = np.array(energies)
         self.volumes = np.array(volumes)
         self.natoms = len(structure)
@@ -76,6 +86,9 @@ class Quasiharmonic(object):
         self.pressure = pressure
         self.gpa_to_ev_ang = 1./160.21766208  # 1 GPa in ev/Ang^3
         self.eos = EOS(eos)
+        self.batch = batch
+        self.batch_order = batch_order
+        self.batch_tol = batch_tol
 
         # get the vibrational properties as a function of V and T
         if F_vib is None:  # use the Debye model
@@ -118,11 +131,60 @@ class Quasiharmonic(object):
         Note: The data points for which the equation of state fitting fails
             are skipped.
         """
+        if self.batch:
+            G_opts, V_opts = self.batch_optimizer()
         for temp_idx in range(self.temperatures.size):
-            G_opt, V_opt = self.optimizer(temp_idx)
+            if self.batch and np.isfinite(V_opts[temp_idx]):
+                G_opt, V_opt = G_opts[temp_idx], V_opts[temp_idx]
+            else:
+                G_opt, V_opt = self.optimizer(temp_idx)
             self.gibbs_free_energy.append(float(G_opt))
             self.optimum_volumes.append(float(V_opt))
 
+    def batch_optimizer(self, niter=20):
+        """
+        Minimize G(V, T, P) wrt V for all temperatures together.
+
+        G is fitted by G = sum_k a_k x^k, x = V^(-1/3), for all temperature columns of self.G
+        by one least-squares solution with multiple right-hand sides. The minimum is located
+        on a dense x grid and then refined by Newton iterations on dG/dx = 0.
+
+        Args:
+            niter : int
+            Number of Newton iterations
+
+        Returns:
+            array, array: G_opt(V_opt, T, P) in eV and V_opt in Ang^3 for each temperature.
+            Both are nan for the temperatures that should fall back to optimizer, i.e., the
+            fit residual is beyond self.batch_tol or the minimum is not inside the volume range.
+        """
+        nV, nT = self.G.shape
+        order = min(self.batch_order, nV)
+        x = self.volumes**(-1./3.)
+        a, _, _, _ = np.linalg.lstsq(np.vander(x, order, increasing=True), self.G, rcond=None)
+        rms = np.sqrt(np.mean((self.G - np.vander(x, order, increasing=True)@a)**2, axis=0))
+
+        # polynomial coefficients of dG/dx and d2G/dx2
+        k = np.arange(order)[:,None]
+        da = (k*a)[1:]
+        dda = (k[:-1]*da)[1:]
+
+        xgrid = np.linspace(x.min(), x.max(), 20*nV)
+        igrid = np.argmin(np.vander(xgrid, order, increasing=True)@a, axis=0)
+        inside = (igrid > 0) & (igrid < len(xgrid)-1)
+        xopt = xgrid[igrid]
+        for i in range(niter):
+            d1 = np.sum(da*xopt**np.arange(order-1)[:,None], axis=0)
+            d2 = np.sum(dda*xopt**np.arange(order-2)[:,None], axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                xopt = xopt - np.where(d2 > 0.0, d1/d2, 0.0)
+        d2 = np.sum(dda*xopt**np.arange(order-2)[:,None], axis=0)
+        G_opt = np.sum(a*xopt**k, axis=0)
+        V_opt = xopt**(-3.)
+
+        good = inside & (rms <= self.batch_tol) & (d2 > 0.0) & (xopt >= x.min()) & (xopt <= x.max())
+        return np.where(good, G_opt, np.nan), np.where(good, V_opt, np.nan)
+
     def optimizer(self, temp_idx):
         """
         Evaluate G(V, T, P) at the given temperature(and pressure) and
@@ -19,8 +19,20 @@ def get_non_isotropic_strain(c1, c2):
     return np.linalg.norm(transmat(c1, c2) - np.eye(3))
 
 
-def get_bond_distance_change(initial_structure, final_structure):
-    """Square root of sum of square distance matrices (controlling for cell shape change)"""
+def get_bond_distance_change(initial_structure, final_structure, block_size=256):
+    """Square root of sum of square distance matrices (controlling for cell shape change)
+
+    The nearest image distances are evaluated for block_size rows of the distance matrices a time,
+    so that the memory is bounded by block_size*len(structure) instead of len(structure)**2
+    """
+    n = len(initial_structure)
+    initial_frac = initial_structure.frac_coords
+    final_frac = final_structure.frac_coords
+    sum_sq = 0.0
+    for start in range(0, n, block_size):
+        d_initial = initial_structure.lattice.get_all_distances(initial_frac[start:start+block_size], initial_frac)
+        d_final = final_structure.lattice.get_all_distances(final_frac[start:start+block_size], final_frac)
+        sum_sq += np.sum((d_initial - d_final)**2)
     # Divides by 2 because the bonds are double counted in the symmetric distance matrix
-    bond = np.linalg.norm((initial_structure.distance_matrix - final_structure.distance_matrix)/2)/len(initial_structure)
+    bond = np.sqrt(sum_sq)/2/n
     return bond
@@ -7,6 +7,9 @@ import os, fnmatch
 from shutil import move
 import copy
 import time
+import pickle
+import hashlib
+import multiprocessing
 import datetime
 import numpy as np
 from scipy.optimize import linprog
@@ -28,7 +31,7 @@ from scipy.optimize import brentq
 from scipy.integrate import cumtrapz, trapz, simps
 from pymatgen.core import Structure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
-from dfttk.analysis.ywutils import get_expt, formula2composition, get_melting_temperature
+from dfttk.analysis.ywutils import get_expt, formula2composition, get_melting_temperature, load_fvib
 
 import re
 import json
@@ -569,8 +572,6 @@ class thermoplot:
         self.fig,self.ax=plt.subplots()
         self.fig.set_size_inches(12,9)
         self.ax.yaxis.set_ticks_position('both')
-        self.cwd = os.getcwd()
-        os.chdir( folder )
 
         self.folder = folder
         self.thermodynamicproperty = thermodynamicproperty
@@ -623,10 +624,9 @@ class thermoplot:
         self.ax.legend(loc=0, prop={'size': 24})
         #plt.legend(loc=0, prop={'size': 24})
 
-        self.fig.savefig(self.fname,bbox_inches='tight')
+        self.fig.savefig(os.path.join(folder, self.fname),bbox_inches='tight')
         plt.close(self.fig)
 
-        os.chdir( self.cwd )
         head,tail = os.path.split(folder)
         figures.update({self.thermodynamicproperty:os.path.join(tail,self.fname)})
 
@@ -861,6 +861,112 @@ class thermoplot:
             plt.gca().set_ylim(bottom=0)
 
 
+THERMOPLOT_STYLE = 1
+THERMOPLOT_CACHE = '.thermoplot_cache.json'
+
+
+def thermoplot_key(args, kwargs):
+    """hash of the thermoplot arguments (the data) and of the plotting style"""
+    h = hashlib.sha256()
+    h.update(pickle.dumps((THERMOPLOT_STYLE, matplotlib.__version__, args, sorted(kwargs.items())), protocol=4))
+    return h.hexdigest()
+
+
+def _render_thermoplot(spec):
+    """
+    Returns
+    -------
+    (thermodynamicproperty, file name, None), or (thermodynamicproperty, None, error message)
+    if the figure failed, so that one figure does not abort the others
+    """
+    args, kwargs = spec
+    try:
+        fig = thermoplot(*args, **kwargs)
+        return fig.thermodynamicproperty, fig.fname, None
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return args[1], None, '{}: {}'.format(type(e).__name__, e).split('\n')[0]
+
+
+class ThermoplotQueue:
+    """
+    collect the thermoplot figures and render them at once, in a process pool if jobs > 1
+
+    A figure is skipped if the file rendered earlier from the same arguments and style is still there,
+    as recorded by the hash of the arguments in THERMOPLOT_CACHE of the figure folder
+    """
+    def __init__(self, jobs=1):
+        self.jobs = jobs
+        self.specs = []
+        self.failed = []
+
+    def add(self, *args, **kwargs):
+        """the arguments of thermoplot"""
+        self.specs.append((args, kwargs))
+
+    def render(self):
+        """
+        A failed figure is reported and left out of the cache and the figure record, the others
+        are kept. The failures of the last call are in self.failed as (thermodynamicproperty, message)
+
+        Returns
+        -------
+        list of (thermodynamicproperty, file name) of the figures, rendered or skipped,
+        the file name is None for the failed ones
+        """
+        specs, self.specs = self.specs, []
+        caches = {}
+        results = [None]*len(specs)
+        todo = []
+        for i, (args, kwargs) in enumerate(specs):
+            cache = caches.setdefault(args[0], _load_thermoplot_cache(args[0]))
+            key = thermoplot_key(args, kwargs)
+            fname = cache.get(key)
+            if fname is not None and os.path.exists(os.path.join(args[0], fname)):
+                results[i] = (args[1], fname)
+            else:
+                todo.append((i, key))
+        if self.jobs > 1 and len(todo) > 1:
+            with multiprocessing.Pool(processes=min(self.jobs, len(todo))) as pool:
+                done = pool.map(_render_thermoplot, [specs[i] for i, _ in todo])
+        else:
+            done = [_render_thermoplot(specs[i]) for i, _ in todo]
+        self.failed = []
+        for (i, key), (prp, fname, message) in zip(todo, done):
+            results[i] = (prp, fname)
+            if fname is None:
+                self.failed.append((prp, message))
+                continue
+            cache = caches[specs[i][0][0]]
+            #the figures previously in the same file are overwritten
+            for k in [k for k, f in cache.items() if f==fname]: del cache[k]
+            cache[key] = fname
+        for folder, cache in caches.items():
+            _save_thermoplot_cache(folder, cache)
+        for (args, kwargs), (prp, fname) in zip(specs, results):
+            if fname is None: continue
+            head,tail = os.path.split(args[0])
+            figures.update({prp:os.path.join(tail,fname)})
+        if len(self.failed) > 0:
+            print("\n", len(self.failed), "of", len(specs), "figures failed:")
+            for prp, message in self.failed: print("   ", prp, ":", message)
+        return results
+
+
+def _load_thermoplot_cache(folder):
+    try:
+        with open(os.path.join(folder, THERMOPLOT_CACHE)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_thermoplot_cache(folder, cache):
+    with open(os.path.join(folder, THERMOPLOT_CACHE), 'w') as fp:
+        json.dump(cache, fp)
+
+
 def plot_theory (theory, ax):
     #global mindex
     lindex = -1
@@ -1125,7 +1231,7 @@ def prety_formula(_els,_nat):
   return form
 
 
-def Genergy(thermofile,dir0):
+def Genergy(thermofile,dir0,jobs=1):
   tmelt = 9999.
   ele = threcord.get("Elements")
   if ele!=None:
@@ -1154,7 +1260,9 @@ def Genergy(thermofile,dir0):
     sys.exit()
 
 
-  thermo = np.loadtxt(thermofile, comments="#", dtype=np.float)
+  #the thermoplot figures are rendered together, see ThermoplotQueue
+  figs = ThermoplotQueue(jobs=jobs)
+  thermo, _ = load_fvib(thermofile)
   thermo[np.isnan(thermo)] = 0.0
   for i,cp in enumerate(thermo[:,6]):
     if cp > CpMax: break
@@ -1173,7 +1281,7 @@ def Genergy(thermofile,dir0):
 
   zthermo.update({"temperature (K)":list(thermo[:,0])})
   zthermo.update({"atomic volume ($\AA^3$)":list(thermo[:,1])})
-  thermoplot(folder,"atomic volume ($\AA^3$)",list(thermo[:,0]),list(thermo[:,1]))
+  figs.add(folder,"atomic volume ($\AA^3$)",list(thermo[:,0]),list(thermo[:,1]))
   zthermo.update({"Gibbs energy (eV/atom)":list(thermo[:,2])})
   zthermo.update({"enthalpy (J/mol-atom)":list(thermo[:,4])})
   zthermo.update({"entropy (J/mol-atom K)":list(thermo[:,3])})
@@ -1185,35 +1293,37 @@ def Genergy(thermofile,dir0):
     g,h,s,c,x=proStoichiometricG()
 
   threcord.update({"SGTE fitting":SGTErec})
-  thermoplot(folder,"Gibbs energy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,2]*eVtoJ-H298),fitted=list(SGTE(x,g)), xT=list(x))
-  thermoplot(folder,"enthalpy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,4]-H298), fitted=list(SGTEH(x,h)), xT=list(x))
-  #thermoplot(folder,"enthalpy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,4]-H298), fitted=list(SGTE(x,g)+x*SGTES(x,s)), xT=list(x))
-  thermoplot(folder,"entropy (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,3]),yzero=0.0, fitted=list(SGTES(x,s)), xT=list(x))
+  figs.add(folder,"Gibbs energy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,2]*eVtoJ-H298),fitted=list(SGTE(x,g)), xT=list(x))
+  figs.add(folder,"enthalpy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,4]-H298), fitted=list(SGTEH(x,h)), xT=list(x))
+  #figs.add(folder,"enthalpy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,4]-H298), fitted=list(SGTE(x,g)+x*SGTES(x,s)), xT=list(x))
+  figs.add(folder,"entropy (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,3]),yzero=0.0, fitted=list(SGTES(x,s)), xT=list(x))
 
   zthermo.update({"LTC (1/K)":list(thermo[:,5])})
-  thermoplot(folder,"LTC (1/K)",list(thermo[:,0]),list(thermo[:,5]),yzero=0.0)
+  figs.add(folder,"LTC (1/K)",list(thermo[:,0]),list(thermo[:,5]),yzero=0.0)
   zthermo.update({"Cv (J/mol-atom K)":list(thermo[:,14])})
   zthermo.update({"Cv,ion (J/mol-atom K)":list(thermo[:,7])})
   Cele = [round(c,6) for c in thermo[:,14]-thermo[:,7]]
   zthermo.update({"Cele (J/mol-atom K)":Cele})
   ncols = [6,14,7]
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]),fitted=list(SGTEC(x,c)), xT=list(x))
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]),fitted=list(SGTEC(x,c)), xT=list(x))
   ncols = [6,8]
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), expt=expt)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=300,expt=expt)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=70,expt=expt)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=100,expt=expt, CoT=True)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=1000,expt=expt, CoT=True)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=10000,expt=expt, CoT=True)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), elonly=300, expt=expt)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), elonly=300, expt=expt, CoT=True)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), elonly=70, expt=expt)
-  thermoplot(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), elonly=70, expt=expt, CoT=True)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), expt=expt)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=300,expt=expt)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=70,expt=expt)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=100,expt=expt, CoT=True)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=1000,expt=expt, CoT=True)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), xlim=10000,expt=expt, CoT=True)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), elonly=300, expt=expt)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), elonly=300, expt=expt, CoT=True)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), elonly=70, expt=expt)
+  figs.add(folder,"heat capacities ((J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xT=list(x), elonly=70, expt=expt, CoT=True)
   zthermo.update({"Debye temperature (K)":list(thermo[:,13])})
-  thermoplot(folder,"Debye temperature (K)",list(thermo[:,0]),list(thermo[:,13]),yzero=0.0)
-  thermoplot(folder,"Debye temperature (K)",list(thermo[:,0]),list(thermo[:,13]),yzero=0.0, xlim=70)
+  figs.add(folder,"Debye temperature (K)",list(thermo[:,0]),list(thermo[:,13]),yzero=0.0)
+  figs.add(folder,"Debye temperature (K)",list(thermo[:,0]),list(thermo[:,13]),yzero=0.0, xlim=70)
   zthermo.update({"bulk modulus (GPa)":list(thermo[:,15])})
-  thermoplot(folder,"bulk modulus (GPa)",list(thermo[:,0]),list(thermo[:,15]),yzero=0.0)
+  figs.add(folder,"bulk modulus (GPa)",list(thermo[:,0]),list(thermo[:,15]),yzero=0.0)
+
+  figs.render()
 
   threcord.update({"zthermodynamic properies":zthermo})
   threcord.update({"Atomic volume at 298.15 K ($\AA^3$)":round(V298,6)})
@@ -1931,7 +2041,7 @@ def getdoslim(e, dos, xlim):
 def plotAPI(readme, thermofile, volumes=None, energies=None,
     expt=None, xlim=None, _fitCp=True,
     formula=None, debug=False, vtof=None, poscar=None, vdos=None,
-    doscar=None, natoms=1, plotlabel=None, local=None):
+    doscar=None, natoms=1, plotlabel=None, local=None, jobs=1):
   if plotlabel!=None:
       if plotlabel.lower().startswith("find_or_"):
           if "pseudo_potential" in readme.keys():
@@ -1941,6 +2051,8 @@ def plotAPI(readme, thermofile, volumes=None, energies=None,
   else:
       plotlabel = 'DFT'
   if expt!=None: expt =get_expt(expt, formula)
+  #the thermoplot figures are rendered together at return
+  figs = ThermoplotQueue(jobs=jobs)
 
 
   global fitCp
@@ -1955,18 +2067,20 @@ def plotAPI(readme, thermofile, volumes=None, energies=None,
   print("All figures will be outputed into: ", folder, "  with T uplimt:", xlim, "\n\nEnjoy!\n")
   if not os.path.exists(folder):
     os.mkdir(folder)
-  if volumes is not None: thermoplot(folder,"0 K total energies (eV/atom)",volumes, energies, plottitle=plottitle)
+  if volumes is not None: figs.add(folder,"0 K total energies (eV/atom)",volumes, energies, plottitle=plottitle)
 
-  thermo = np.loadtxt(thermofile, comments="#", dtype=float)
+  thermo, _ = load_fvib(thermofile)
   thermo[np.isnan(thermo)] = 0.0
   _single = len(set(thermo[:,1])) == 1
   if len (thermo) < 1:
       print("\nCorrupted thermofile for", thermofile, "Please check it!")
+      figs.render()
       return False
 
   if vtof is not None:
-    thermoplot(folder,"Helmholtz energy (eV/atom)",list(thermo[:,1]),list(thermo[:,2]), reflin=vtof,plottitle=plottitle)
-    thermoplot(folder,"Helmholtz energy analysis (eV/atom)",list(thermo[:,1]),list(thermo[:,2]), reflin=vtof,plottitle=plottitle)
+    figs.add(folder,"Helmholtz energy (eV/atom)",list(thermo[:,1]),list(thermo[:,2]), reflin=vtof,plottitle=plottitle)
+    figs.add(folder,"Helmholtz energy analysis (eV/atom)",list(thermo[:,1]),list(thermo[:,2]), reflin=vtof,plottitle=plottitle)
+    figs.render()
     return
 
 
@@ -2035,7 +2149,7 @@ def plotAPI(readme, thermofile, volumes=None, energies=None,
               break
       g = g[ix:]
       t = t[ix:]
-      thermoplot(folder,"Gruneisen coefficient",list(t),list(g), yzero=Gmin, expt=expt, xlim=xlim, label=plotlabel, single=vdos!=None,plottitle=plottitle)
+      figs.add(folder,"Gruneisen coefficient",list(t),list(g), yzero=Gmin, expt=expt, xlim=xlim, label=plotlabel, single=vdos!=None,plottitle=plottitle)
       try:
         Plot298(folder, V298, volumes, debug=debug, plottitle=plottitle, local=local)
       except:
@@ -2075,40 +2189,40 @@ def plotAPI(readme, thermofile, volumes=None, energies=None,
   """
 
   if volumes is not None:
-    thermoplot(folder,"Atomic volume ($\AA^3$)",list(thermo[:,0]),list(thermo[:,1]), xlim=xlim, label=plotlabel,plottitle=plottitle)
+    figs.add(folder,"Atomic volume ($\AA^3$)",list(thermo[:,0]),list(thermo[:,1]), xlim=xlim, label=plotlabel,plottitle=plottitle)
   if T0 <= thermo[-1,0] :
-    thermoplot(folder,"Gibbs energy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,2]*eVtoJ-H298), xlim=xlim,plottitle=plottitle)
-    thermoplot(folder,"Enthalpy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,4]-H298),
+    figs.add(folder,"Gibbs energy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,2]*eVtoJ-H298), xlim=xlim,plottitle=plottitle)
+    figs.add(folder,"Enthalpy-H298 (J/mol-atom)",list(thermo[:,0]),list(thermo[:,4]-H298),
       expt=expt, xlim=xlim,plottitle=plottitle)
-  thermoplot(folder,"Entropy (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,3]),yzero=0.0, expt=expt,
+  figs.add(folder,"Entropy (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,3]),yzero=0.0, expt=expt,
       xlim=xlim,plottitle=plottitle)
 
   if volumes is not None:
-    thermoplot(folder,"LTC (1/K)",list(thermo[:,0]),list(thermo[:,5]),yzero=0.0, expt=expt, xlim=xlim, label=plotlabel,plottitle=plottitle)
-    #thermoplot(folder,"LTC analysis (1/K)",list(thermo[:,0]),list(thermo[:,5]),reflin=list(thermo[:,22]), yzero=0.0, xlim=xlim, label=plotlabel,plottitle=plottitle)
+    figs.add(folder,"LTC (1/K)",list(thermo[:,0]),list(thermo[:,5]),yzero=0.0, expt=expt, xlim=xlim, label=plotlabel,plottitle=plottitle)
+    #figs.add(folder,"LTC analysis (1/K)",list(thermo[:,0]),list(thermo[:,5]),reflin=list(thermo[:,22]), yzero=0.0, xlim=xlim, label=plotlabel,plottitle=plottitle)
   ncols = [6,8]
-  thermoplot(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), expt=expt, xlim=xlim, label=plotlabel, single=_single,plottitle=plottitle)
-  thermoplot(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xlim=300,expt=expt, label=plotlabel, single=_single,plottitle=plottitle)
-  thermoplot(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xlim=100,expt=expt, CoT=True, label=plotlabel, single=_single,plottitle=plottitle)
-  thermoplot(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xlim=1000,expt=expt, CoT=True, label=plotlabel, single=_single,plottitle=plottitle)
+  figs.add(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), expt=expt, xlim=xlim, label=plotlabel, single=_single,plottitle=plottitle)
+  figs.add(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xlim=300,expt=expt, label=plotlabel, single=_single,plottitle=plottitle)
+  figs.add(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xlim=100,expt=expt, CoT=True, label=plotlabel, single=_single,plottitle=plottitle)
+  figs.add(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), xlim=1000,expt=expt, CoT=True, label=plotlabel, single=_single,plottitle=plottitle)
   tmp = 0.0
   for i,v in enumerate(thermo[:,0]):
     if v >300: break
     tmp = max(tmp, thermo[i,6]-thermo[i,8])
   if tmp>1.e-2:
-    thermoplot(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), elonly=300, expt=expt, CoT=True, label=plotlabel,plottitle=plottitle)
-  thermoplot(folder,"Debye temperature (K)",list(thermo[:,0]),list(thermo[:,10]),yzero=0.0, xlim=xlim, label=plotlabel,plottitle=plottitle)
-  thermoplot(folder,"Debye temperature (K)",list(thermo[:,0]),list(thermo[:,10]),yzero=0.0, xlim=70, label=plotlabel,plottitle=plottitle)
+    figs.add(folder,"Heat capacities (J/mol-atom K)",list(thermo[:,0]),list(thermo[:,ncols]), elonly=300, expt=expt, CoT=True, label=plotlabel,plottitle=plottitle)
+  figs.add(folder,"Debye temperature (K)",list(thermo[:,0]),list(thermo[:,10]),yzero=0.0, xlim=xlim, label=plotlabel,plottitle=plottitle)
+  figs.add(folder,"Debye temperature (K)",list(thermo[:,0]),list(thermo[:,10]),yzero=0.0, xlim=70, label=plotlabel,plottitle=plottitle)
   if volumes is not None:
     bs = np.ones((len(thermo[:,9])), dtype=float)
     bs[1:] = thermo[1:,6]/thermo[1:,7]*thermo[1:,9]
-    thermoplot(folder,"Bulk modulus (GPa)",list(thermo[:,0]),list(thermo[:,9]), reflin=list(bs) , expt=expt, yzero=0.0,xlim=xlim, label=plotlabel,plottitle=plottitle)
-  thermoplot(folder,"Seebeck coefficients (μV/K)",list(thermo[:,0]),list(thermo[:,16]),xlim=xlim, label=plotlabel,plottitle=plottitle)
-  thermoplot(folder,"Lorenz number ($WΩK^{−2}$)",list(thermo[:,0]),list(thermo[:,17]),xlim=xlim, label=plotlabel,plottitle=plottitle)
-  thermoplot(folder,"Absolute thermal electric force (V)",list(thermo[:,0]),list(thermo[:,15]), xlim=xlim, label=plotlabel,plottitle=plottitle)
-  thermoplot(folder,"Effective charge carrier concentration ($e/cm^{3}$)",list(thermo[:,0]),
+    figs.add(folder,"Bulk modulus (GPa)",list(thermo[:,0]),list(thermo[:,9]), reflin=list(bs) , expt=expt, yzero=0.0,xlim=xlim, label=plotlabel,plottitle=plottitle)
+  figs.add(folder,"Seebeck coefficients (μV/K)",list(thermo[:,0]),list(thermo[:,16]),xlim=xlim, label=plotlabel,plottitle=plottitle)
+  figs.add(folder,"Lorenz number ($WΩK^{−2}$)",list(thermo[:,0]),list(thermo[:,17]),xlim=xlim, label=plotlabel,plottitle=plottitle)
+  figs.add(folder,"Absolute thermal electric force (V)",list(thermo[:,0]),list(thermo[:,15]), xlim=xlim, label=plotlabel,plottitle=plottitle)
+  figs.add(folder,"Effective charge carrier concentration ($e/cm^{3}$)",list(thermo[:,0]),
       list(thermo[:,18]/thermo[:,1]*1e24), label=plotlabel,plottitle=plottitle)
-  thermoplot(folder,"Effective charge carrier concentration ($e/cm^{3}$)",list(thermo[:,0]),
+  figs.add(folder,"Effective charge carrier concentration ($e/cm^{3}$)",list(thermo[:,0]),
       list(thermo[:,18]/thermo[:,1]*1e24), xlim=100, label=plotlabel,plottitle=plottitle)
   if len(gamma_phonons)!=0: readme['gamma phonons (cm^{-1})']= gamma_phonons
   if doscar!=None:
@@ -2120,32 +2234,33 @@ def plotAPI(readme, thermofile, volumes=None, energies=None,
           if Eg <0.0: Eg=0.
           xlim = [-0.1, Eg+0.1]
           xx, yy = getdoslim(dos_energies, vaspEdos, xlim)
-          thermoplot(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
+          figs.add(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
               xlabel="Band energy (eV)", label=plotlabel,plottitle=plottitle)
           xlim = [-0.2, Eg+0.2]
           xx, yy = getdoslim(dos_energies, vaspEdos, xlim)
-          thermoplot(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
+          figs.add(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
               xlabel="Band energy (eV)", label=plotlabel,plottitle=plottitle)
           xlim = [-0.5, Eg+0.5]
           xx, yy = getdoslim(dos_energies, vaspEdos, xlim)
-          thermoplot(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
+          figs.add(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
               xlabel="Band energy (eV)", label=plotlabel,plottitle=plottitle)
           xlim = [-1.0, Eg+1.0]
           xx, yy = getdoslim(dos_energies, vaspEdos, xlim)
-          thermoplot(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
+          figs.add(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
               xlabel="Band energy (eV)", label=plotlabel,plottitle=plottitle)
           xlim = [-2.0, Eg+2.0]
           xx, yy = getdoslim(dos_energies, vaspEdos, xlim)
-          thermoplot(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
+          figs.add(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
               xlabel="Band energy (eV)", label=plotlabel,plottitle=plottitle)
           xlim = [-5.0, Eg+5.0]
           xx, yy = getdoslim(dos_energies, vaspEdos, xlim)
-          thermoplot(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
+          figs.add(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
               xlabel="Band energy (eV)", label=plotlabel,plottitle=plottitle)
           xlim = [-10., Eg+10.]
           xx, yy = getdoslim(dos_energies, vaspEdos, xlim)
-          thermoplot(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
+          figs.add(folder,"Electron DOS (States/Atom/eV)",list(xx),list(np.array(yy)/natoms), xlim=xlim,
               xlabel="Band energy (eV)", label=plotlabel,plottitle=plottitle)
+  figs.render()
   return True
 
 
@@ -2162,7 +2277,7 @@ def plotCMD(thermofile, volumes=None, energies=None, expt=None, xlim=None, _fitC
     os.mkdir(folder)
   if volumes is not None: thermoplot(folder,"0 K total energies (eV/atom)",volumes, energies)
 
-  thermo = np.loadtxt(thermofile, comments="#", dtype=np.float)
+  thermo, _ = load_fvib(thermofile)
   thermo[np.isnan(thermo)] = 0.0
   if len (thermo) < 1:
       print("\nCorrupted thermofile for", thermofile, "Please check it!")
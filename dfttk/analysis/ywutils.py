@@ -7,6 +7,7 @@ from fractions import Fraction
 from dfttk.utils import sort_x_by_y
 import os
 import json
+import zlib
 from pymatgen.ext.matproj import MPRester, Structure
 from atomate.vasp.database import VaspCalcDb
 import xml.etree.ElementTree as ET
@@ -246,19 +247,98 @@ def get_Magnetic_State(calc):
     else: return ""
     
 
+"""fields of the task documents needed for the static calculations, calcs_reversed is left
+in the database except for the GridFS id of the DOS and the VASP version
+"""
+STATIC_PROJECTION = {'_id':0, 'task_id':1, 'metadata':1, 'adopted':1, 'orig_inputs':1,
+    'input.structure':1, 'input.incar':1, 'input.pseudo_potential':1, 'input.is_hubbard':1, 'input.hubbards':1,
+    'output.energy':1, 'output.structure':1, 'output.stress':1, 'output.bandgap':1, 'tdos':1,
+    'dos_fs_id': {'$arrayElemAt': ['$calcs_reversed.dos_fs_id', 0]},
+    'vasp_version': {'$arrayElemAt': ['$calcs_reversed.vasp_version', 0]}}
+
+
+"""build the volume sorted record of static calculations from the projected task documents
+calcs - list of task documents projected by STATIC_PROJECTION in the database order
+tag - metadata tag value
+return: dict with the documents ('calcs') and the arrays of volumes, energies, stresses,
+    lattices, bandgaps, magmoms, natoms, task_ids, dos_fs_ids, and the masks
+    adopted, constrained (metadata has more than the tag) and plain (metadata is exactly the tag),
+    as well as 'order', the database order of the documents, and 'vasp_versions'
+"""
+def static_record(calcs, tag):
+    vasp_versions = [c['vasp_version'] for c in calcs if c.get('vasp_version') is not None]
+    calcs = [c for c in calcs if 'lattice' in c.get('output', {}).get('structure', {})]
+    volumes = np.array([c['output']['structure']['lattice']['volume'] for c in calcs], dtype=float)
+    order = np.argsort(volumes, kind='stable')
+    calcs = [calcs[i] for i in order]
+    rec = {'tag':tag, 'calcs':calcs, 'order':order, 'vasp_versions':vasp_versions}
+    rec['volumes'] = volumes[order]
+    rec['energies'] = np.array([c['output']['energy'] for c in calcs], dtype=float)
+    rec['stresses'] = [c['output'].get('stress') for c in calcs]
+    rec['lattices'] = np.array([c['output']['structure']['lattice']['matrix'] for c in calcs], dtype=float).reshape(-1,3,3)
+    rec['bandgaps'] = np.array([c['output'].get('bandgap', 0.0) for c in calcs], dtype=float)
+    magmoms = []
+    for c in calcs:
+        try:
+            magmoms.append([{s['label']:s['properties']['magmom']} for s in c['output']['structure']['sites']])
+        except:
+            magmoms.append(None)
+    rec['magmoms'] = magmoms
+    rec['natoms'] = np.array([len(c['output']['structure']['sites']) for c in calcs], dtype=int)
+    rec['task_ids'] = [c.get('task_id') for c in calcs]
+    rec['dos_fs_ids'] = [c.get('dos_fs_id') for c in calcs]
+    rec['adopted'] = np.array([c.get('adopted', False) is True for c in calcs], dtype=bool)
+    rec['constrained'] = np.array([len(c['metadata'])>1 for c in calcs], dtype=bool)
+    rec['plain'] = np.array([c['metadata']=={'tag':tag} for c in calcs], dtype=bool)
+    return rec
+
+
+"""fetch all static calculations of a metadata tag by a single projected aggregation
+vasp_db - MonggoDB database connection
+tag - metadata tag value
+return: volume sorted record, see static_record
+"""
+def load_static_calculations(vasp_db, tag):
+    calcs = list(vasp_db.collection.aggregate([{'$match': {'metadata.tag': tag}},
+        {'$project': STATIC_PROJECTION}]))
+    return static_record(calcs, tag)
+
+
+"""read the DOS of several calculations by a single query of the GridFS chunks
+vasp_db - MonggoDB database connection
+task_ids - task ids of the calculations
+dos_fs_ids - GridFS ids of the DOS, as in the record by load_static_calculations
+return: list of CompleteDos objects
+"""
+def get_dos_bulk(vasp_db, task_ids, dos_fs_ids):
+    from pymatgen.electronic_structure.dos import CompleteDos
+    if len(task_ids)==0: return []
+    if getattr(vasp_db, '_maggma_store_type', None) is not None or any([i is None for i in dos_fs_ids]):
+        return [vasp_db.get_dos(task_id) for task_id in task_ids]
+    chunks = {}
+    for c in vasp_db.db['dos_fs.chunks'].find({'files_id': {'$in': list(set(dos_fs_ids))}},
+        {'_id':0, 'files_id':1, 'n':1, 'data':1}):
+        chunks.setdefault(c['files_id'], []).append((c['n'], c['data']))
+    dos_objs = []
+    for fs_id in dos_fs_ids:
+        data = b''.join([d for n, d in sorted(chunks[fs_id], key=lambda x: x[0])])
+        dos_objs.append(CompleteDos.from_dict(json.loads(zlib.decompress(data).decode())))
+    return dos_objs
+
+
 """return E-V data information from MonggoDB database of static calculations
 vasp_db - MonggoDB database connection
 m - metadata tag value
+rec - record of the static calculations by load_static_calculations, loaded if None
 return: E-V, strain, stresses, bandgap etc
 """
-def get_rec_from_metatag(vasp_db,m, test=False):
-    if vasp_db.collection.count_documents({'$and':[ {'metadata.tag': m}, {'adopted': True}, \
-            {'output.structure.lattice.volume': {'$exists': True}}]}) <= 5:
-        static_calculations = vasp_db.collection.find({'$and':[ {'metadata.tag': m}, \
-            {'output.structure.lattice.volume': {'$exists': True} }]})
+def get_rec_from_metatag(vasp_db,m, test=False, rec=None):
+    if rec is None: rec = load_static_calculations(vasp_db, m)
+    calcs = rec['calcs']
+    if np.sum(rec['adopted']) <= 5:
+        selected = list(range(len(calcs)))
     else:
-        static_calculations = vasp_db.collection.\
-            find({'$and':[ {'metadata': {'tag':m}}, {'adopted': True} ]})
+        selected = list(np.nonzero(rec['adopted'] & rec['plain'])[0])
     gapfound = False
     energies = []
     volumes = []  
@@ -269,16 +349,13 @@ def get_rec_from_metatag(vasp_db,m, test=False):
     magmoms = []
     emin = 1.e36
     kpoints = None
-    for calc in static_calculations:
-        vol = calc['output']['structure']['lattice']['volume']
+    for i in sorted(selected, key=lambda i: rec['order'][i]):
+        calc = calcs[i]
+        vol = float(rec['volumes'][i])
         if kpoints is None: kpoints = calc['orig_inputs']['kpoints']['kpoints']
         if vol_within(vol, volumes, thr=1.e-6): continue
-        natoms = len(calc['output']['structure']['sites'])
-        try:
-            sites = calc['output']['structure']['sites']
-            magmoms.append([{s['label']:s['properties']['magmom']} for s in sites])
-        except:
-            pass
+        natoms = int(rec['natoms'][i])
+        if rec['magmoms'][i] is not None: magmoms.append(rec['magmoms'][i])
         lat = calc['output']['structure']['lattice']['matrix']
         sts = calc['output']['stress']
         ene = calc['output']['energy']
@@ -302,18 +379,14 @@ def get_rec_from_metatag(vasp_db,m, test=False):
         dvolumes = tvolumes[1:] - tvolumes[0:-1]
         dvolumes = sorted(dvolumes)
         if abs(dvolumes[-1]-dvolumes[-2]) > 0.01*dvolumes[-1]:
-            all_static_calculations = vasp_db.collection.\
-                find({'$and':[ {'metadata.tag': m}, {'adopted': True} ]})
-            for calc in all_static_calculations:
-                if len(calc['metadata'])<=1:continue # only check constrained calculation
-                vol = calc['output']['structure']['lattice']['volume']
+            # only check constrained calculation
+            constrained = np.nonzero(rec['adopted'] & rec['constrained'])[0]
+            for i in sorted(constrained, key=lambda i: rec['order'][i]):
+                calc = calcs[i]
+                vol = float(rec['volumes'][i])
                 if vol_within(vol, volumes, thr=1.e-6): continue
-                natoms = len(calc['output']['structure']['sites'])
-                try:
-                    sites = calc['output']['structure']['sites']
-                    magmoms.append([{s['label']:s['properties']['magmom']} for s in sites])
-                except:
-                    pass
+                natoms = int(rec['natoms'][i])
+                if rec['magmoms'][i] is not None: magmoms.append(rec['magmoms'][i])
                 lat = calc['output']['structure']['lattice']['matrix']
                 sts = calc['output']['stress']
                 ene = calc['output']['energy']
@@ -337,7 +410,6 @@ def get_rec_from_metatag(vasp_db,m, test=False):
                 if sts!=None: pressures.append((sts[0][0]+sts[1][1]+sts[2][2])/3.)
                 else: pressures.append(None)
                 if not gapfound: gapfound = float(gap) > 0.0
-
     energies = sort_x_by_y(energies, volumes)
     pressures = sort_x_by_y(pressures, volumes)
     stresses = sort_x_by_y(stresses, volumes)
@@ -443,3 +515,129 @@ def get_code_version(xml='vasprun.xml'):
             if codename!="" and version!="": return codename, version
     return "Unknown", "0"
 
+
+
+FVIB_NPZ_SUFFIX = '.npz'
+
+
+def write_fvib_npz(fname, data, columns, units=None, **attrs):
+    """
+    write a thermodynamic table as columnar binary, uncompressed so that load_fvib can map it without copy
+
+    Parameters
+    ----------
+    fname : output file, '.npz' is appended if missing
+    data : array of (nT, len(columns))
+    columns : names of the columns
+    units : units of the columns
+    attrs : provenance, such as the command options or the software version, saved as json
+    """
+    if not fname.endswith(FVIB_NPZ_SUFFIX): fname += FVIB_NPZ_SUFFIX
+    data = np.asarray(data, dtype=float).reshape(-1, len(columns))
+    if units is None: units = ['']*len(columns)
+    tmp = fname[0:-len(FVIB_NPZ_SUFFIX)]+'.tmp'+FVIB_NPZ_SUFFIX
+    np.savez(tmp, data=data, columns=np.array(columns, dtype=str), units=np.array(units, dtype=str),
+        attrs=np.array(json.dumps(attrs, default=str)))
+    os.replace(tmp, fname)
+    return fname
+
+
+def fvib_file(thermofile):
+    """
+    return the file holding the thermodynamic table thermofile, thermofile+'.npz' if it is not older than
+    the text table, thermofile if only the text exists, or None
+    """
+    if thermofile.endswith(FVIB_NPZ_SUFFIX):
+        return thermofile if os.path.exists(thermofile) else None
+    npz = thermofile+FVIB_NPZ_SUFFIX
+    if os.path.exists(npz):
+        if not os.path.exists(thermofile) or os.path.getmtime(npz) >= os.path.getmtime(thermofile): return npz
+    if os.path.exists(thermofile): return thermofile
+    return None
+
+
+def _npz_memmap(fname, key):
+    """map the member key of an uncompressed npz file as a copy-on-write array, None if it is compressed"""
+    import zipfile
+    with zipfile.ZipFile(fname) as zf:
+        info = zf.getinfo(key+'.npy')
+    if info.compress_type != zipfile.ZIP_STORED: return None
+    with open(fname, 'rb') as fp:
+        #the local file header is 30 bytes followed by the file name and the extra field
+        fp.seek(info.header_offset+26)
+        n = int.from_bytes(fp.read(2), 'little')
+        m = int.from_bytes(fp.read(2), 'little')
+        fp.seek(info.header_offset+30+n+m)
+        version = np.lib.format.read_magic(fp)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+        offset = fp.tell()
+    if dtype.hasobject: return None
+    #plain ndarray view of the map, so that the derived arrays are not memmap
+    return np.asarray(np.memmap(fname, dtype=dtype, mode='c', offset=offset, shape=shape,
+        order='F' if fortran_order else 'C'))
+
+
+def load_fvib(thermofile):
+    """
+    load the thermodynamic table written by thelecMDB.calc_thermodynamics, from the binary thermofile+'.npz'
+    when it is up to date (see fvib_file), else by np.loadtxt from the text table
+
+    Returns
+    -------
+    data : array of (nT, ncolumns), the binary data are mapped copy-on-write rather than read
+    info : dict with 'columns', 'units' and 'attrs' for the binary file, empty for the text table
+    """
+    fname = fvib_file(thermofile)
+    if fname is None: raise FileNotFoundError(thermofile)
+    if not fname.endswith(FVIB_NPZ_SUFFIX):
+        return np.loadtxt(fname, comments="#", dtype=float), {}
+    data = _npz_memmap(fname, 'data')
+    with np.load(fname) as npz:
+        if data is None: data = npz['data']
+        info = {'columns':list(npz['columns']), 'units':list(npz['units']),
+            'attrs':json.loads(str(npz['attrs']))}
+    return data, info
+
+
+def write_fvib_csv(fname, data=None, header=None):
+    """
+    write fname+'_sm.csv' smoothed by the Savitzky-Golay filter and fname+'.csv', data and header
+    are read from the text table fname if not given. Nothing is written for less than 11 temperatures
+    """
+    if data is None:
+        data = np.loadtxt(fname, comments="#", dtype=float)
+        with open(fname, 'r') as fin:
+            header = [line for line in fin.readlines() if line.startswith('#')]
+    data = np.array(data, dtype=float)
+    data_orig = data.copy()
+    nSmooth = 11
+    if data.shape[0] < nSmooth: return
+    from scipy.signal import savgol_filter
+    data[:,1:] = savgol_filter(data[:,1:], nSmooth, 3, axis=0)
+
+    for suffix, d in (('_sm.csv', data), ('.csv', data_orig)):
+        with open(fname+suffix, 'w') as fout:
+            for line in header: print(line.strip(), file=fout)
+            for row in d:
+                fout.write(', '.join(['{}'.format(x) for x in row])+'\n')
+
+
+def write_fvib_text(thermofile, fname=None, csv=False):
+    """
+    write the text table of the binary thermofile+'.npz' on demand, into fname or thermofile,
+    together with the csv copies (see write_fvib_csv) if csv
+    """
+    if thermofile.endswith(FVIB_NPZ_SUFFIX): thermofile = thermofile[0:-len(FVIB_NPZ_SUFFIX)]
+    data, info = load_fvib(thermofile+FVIB_NPZ_SUFFIX)
+    if fname is None: fname = thermofile
+    header = info['attrs'].get('header', [])
+    with open(fname, 'w') as fp:
+        for line in header:
+            fp.write(line+'\n')
+        for row in data:
+            fp.write(' '.join(['{}'.format(x) for x in row])+'\n')
+    if csv: write_fvib_csv(fname, data=data, header=header)
+    return fname
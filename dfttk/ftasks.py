@@ -28,6 +28,7 @@ from dfttk.analysis.phonon import get_f_vib_phonopy, get_phonon_band_dos, phonon
 from dfttk.analysis.relaxing import get_non_isotropic_strain, get_bond_distance_change
 from dfttk.analysis.quasiharmonic import Quasiharmonic
 from dfttk.utils import sort_x_by_y, update_pos_by_symbols, update_pot_by_symbols, check_symmetry
+from dfttk.utils import encode_force_constants, decode_force_constants, metadata_filter
 from dfttk.custodian_jobs import ATATWalltimeHandler, ATATInfDetJob
 from atomate import __version__ as atomate_ver
 from dfttk import __version__ as dfttk_ver
@@ -229,6 +230,8 @@ class CalculatePhononThermalProperties(FiretaskBase):
             = get_f_vib_phonopy(unitcell, supercell_matrix, vasprun_path='vasprun.xml', t_min=self['t_min'], t_max=self['t_max'], t_step=self['t_step'])
         if isinstance(supercell_matrix, np.ndarray):
             supercell_matrix = supercell_matrix.tolist()  # make serializable
+        db_file = env_chk(self["db_file"], fw_spec)
+        vasp_db = VaspCalcDb.from_db_file(db_file, admin=True)
         thermal_props_dict = {
             'vasp_version': code_version,
             'force_constant_factor': 1.0,
@@ -237,7 +240,7 @@ class CalculatePhononThermalProperties(FiretaskBase):
             'CV_vib': cv_vib.tolist(),
             'S_vib': s_vib.tolist(),
             'temperatures': temperatures.tolist(),
-            'force_constants': force_constants.tolist(),
+            'force_constants': encode_force_constants(force_constants, vasp_db=vasp_db),
             'metadata': metadata,
             'unitcell': unitcell.as_dict(),
             'supercell_matrix': supercell_matrix,
@@ -245,8 +248,6 @@ class CalculatePhononThermalProperties(FiretaskBase):
         }
 
         # insert into database
-        db_file = env_chk(self["db_file"], fw_spec)
-        vasp_db = VaspCalcDb.from_db_file(db_file, admin=True)
         vasp_db.db['phonon'].insert_one(thermal_props_dict)
 
 
@@ -277,6 +278,8 @@ class QHAAnalysis(FiretaskBase):
     bp2gru : float
         Debye model fitting parameter for dBdP in the Gruneisen parameter. 2/3 is the high temperature
         value and 1 is the low temperature value. Defaults to 1.
+    batch : bool
+        If True, minimize the Gibbs energy of all temperatures together, see Quasiharmonic. Defaults to False.
 
     Notes
     -----
@@ -285,7 +288,7 @@ class QHAAnalysis(FiretaskBase):
 
     required_params = ["phonon", "db_file", "t_min", "t_max", "t_step", "tag"]
 
-    optional_params = ["poisson", "bp2gru", "metadata", "test", "admin", "everyT"]
+    optional_params = ["poisson", "bp2gru", "metadata", "test", "admin", "everyT", "batch"]
 
     def run_task(self, fw_spec):
         # handle arguments and database setup
@@ -334,17 +337,18 @@ class QHAAnalysis(FiretaskBase):
 
         poisson = self.get('poisson', 0.363615)
         bp2gru = self.get('bp2gru', 2./3.)
+        batch = self.get('batch', False)
 
         # phonon properties
         # check if phonon calculations existed
         #always perform phonon calculations when when enough phonon calculations found
         #to perform a quasiharmonic phonon calculations, one needs at least phonon results five volumes
         #phonon_calculations= list(vasp_db.db['phonon'].find({'$and':[ {'metadata.tag': tag}, {'adopted': True} ]}))     
-        phonon_calculations= list(vasp_db.db['phonon'].find({'$and':[ {'metadata': {'tag':tag}}, {'adopted': True}, {'S_vib': {'$exists': True}} ]}))     
+        phonon_calculations= list(vasp_db.db['phonon'].find({'$and':[ metadata_filter({'tag':tag}), {'adopted': True}, {'S_vib': {'$exists': True}} ]}))     
         num_phonon_finished = len(phonon_calculations)       
         qha_result['has_phonon'] = num_phonon_finished >= 5
         if not qha_result['has_phonon']:
-            phonon_calculations= list(vasp_db.db['phonon'].find({'$and':[ {'metadata': {'tag':tag}}, {'S_vib': {'$exists': True}} ]}))     
+            phonon_calculations= list(vasp_db.db['phonon'].find({'$and':[ metadata_filter({'tag':tag}), {'S_vib': {'$exists': True}} ]}))     
             num_phonon_finished = len(phonon_calculations)       
             qha_result['has_phonon'] = num_phonon_finished >= 5
         #if self['phonon']:
@@ -389,7 +393,7 @@ class QHAAnalysis(FiretaskBase):
 
             qha = Quasiharmonic(energies, volumes, structure, dos_objects=dos_objs, F_vib=f_vib,
                                 t_min=self['t_min'], t_max=self['t_max'], t_step=self['t_step'],
-                                poisson=poisson, bp2gru=bp2gru)
+                                poisson=poisson, bp2gru=bp2gru, batch=batch)
             qha_result['phonon'] = qha.get_summary_dict()
             qha_result['phonon']['entropies'] = vol_s_vib
             qha_result['phonon']['heat_capacities'] = vol_c_vib
@@ -398,7 +402,7 @@ class QHAAnalysis(FiretaskBase):
         # calculate the Debye model results no matter what
         qha_debye = Quasiharmonic(energies, volumes, structure, dos_objects=dos_objs, F_vib=None,
                                   t_min=self['t_min'], t_max=self['t_max'], t_step=self['t_step'],
-                                  poisson=poisson, bp2gru=bp2gru)
+                                  poisson=poisson, bp2gru=bp2gru, batch=batch)
 
         # fit 0 K EOS for good measure
         eos = Vinet(volumes, energies)
@@ -1166,7 +1170,7 @@ class GetElectronicDosFromDb(FiretaskBase):
     def run_task(self, fw_spec):
         self.db_file = env_chk(self.get('db_file'), fw_spec)
         vasp_db = VaspCalcDb.from_db_file(self.db_file, admin=True)
-        dos_items = vasp_db.db['tasks'].find({'metadata': self.metadata}).sort('_id', -1)
+        dos_items = vasp_db.db['tasks'].find(metadata_filter(self.metadata)).sort('_id', -1)
         dos_result = []
         volumes = []
         for dos_item in dos_items:            
@@ -1200,7 +1204,7 @@ class GetPhononDosFromDb(FiretaskBase):
 
         self.db_file = env_chk(self.get('db_file'), fw_spec)
         vasp_db = VaspCalcDb.from_db_file(self.db_file, admin=True)
-        phonon_items = vasp_db.db['phonon'].find({'metadata': self.metadata}).sort('_id', -1)
+        phonon_items = vasp_db.db['phonon'].find(metadata_filter(self.metadata)).sort('_id', -1)
 
         phonon_tdos = []
         volumes = []
@@ -1211,7 +1215,7 @@ class GetPhononDosFromDb(FiretaskBase):
             formula = structure.composition.reduced_formula
 
             supercell_matrix = phonon['supercell_matrix']
-            force_constants = phonon['force_constants']
+            force_constants = decode_force_constants(phonon['force_constants'], vasp_db=vasp_db)
 
             phonon_tdos = get_phonon_band_dos(structure, supercell_matrix, force_constants, qpoint_mesh=qpoint_mesh, 
                                                    phonon_dos=True, phonon_band=False, phonon_pdos=False, save_data=False, save_fig=False)
@@ -17,7 +17,7 @@ from dfttk.ftasks import WriteVaspFromIOSetPrevStructure, SupercellTransformatio
     Crosscom_Calculation
 from atomate import __version__ as atomate_ver
 from dfttk import __version__ as dfttk_ver
-from dfttk.run_task_ext import run_task_ext
+from dfttk.run_task_ext import run_task_ext, TotalDosToDb
 
 STORE_VOLUMETRIC_DATA = ("chgcar", "aeccar0", "aeccar2", "elfcar", "locpot")
 
@@ -283,6 +283,7 @@ class StaticFW(Firework):
             t.append(VaspToDb(db_file=">>db_file<<", parse_dos=True, additional_fields={"task_label": name, "metadata": metadata,
                                 "version_atomate": atomate_ver, "version_dfttk": dfttk_ver, "adopted": True, "tag": tag},
                                 store_volumetric_data=store_volumetric_data))
+            t.append(TotalDosToDb(db_file=">>db_file<<", tag=tag))
             run_task_ext(t,vasp_cmd,">>db_file<<",structure,tag,self.override_default_vasp_params,self.vasp_input_set)
 
         t.append(CheckSymmetryToDb(db_file=">>db_file<<", tag=tag, site_properties=site_properties))
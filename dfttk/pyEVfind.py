@@ -9,7 +9,7 @@ from dfttk.wflows import get_wf_gibbs
 from dfttk.utils import recursive_glob
 from dfttk.structure_builders.parse_anrl_prototype import multi_replace
 from monty.serialization import loadfn, dumpfn
-from dfttk.pythelec import thelecMDB, vol_within
+from dfttk.pythelec import thelecMDB, vol_within, write_superfij
 import warnings
 import copy
 import os
@@ -21,8 +21,8 @@ from fireworks.fw_config import config_to_dict
 from atomate.vasp.database import VaspCalcDb
 from dfttk.analysis.ywutils import formula2composition, reduced_formula
 from dfttk.analysis.ywplot import myjsonout, thermoplot
-from dfttk.utils import sort_x_by_y
-from dfttk.analysis.ywutils import get_rec_from_metatag, get_used_pot
+from dfttk.utils import sort_x_by_y, decode_force_constants
+from dfttk.analysis.ywutils import get_rec_from_metatag, get_used_pot, load_static_calculations
 
 class EVfindMDB ():
     """
@@ -180,7 +180,8 @@ class EVfindMDB ():
                     if self.hit_count[mm] < self.nV: continue
             if count[i]<self.nV: continue
             if self.skipby(phases[i], mm): continue
-            EV, POSCAR, INCAR = get_rec_from_metatag(self.vasp_db, mm)
+            self.static_rec = load_static_calculations(self.vasp_db, mm)
+            EV, POSCAR, INCAR = get_rec_from_metatag(self.vasp_db, mm, rec=self.static_rec)
             metadata = {'tag':mm}
             pname = phases[i].split('#')
             if len(pname)>1: phases[i] = pname[0]+potname[i]+EV['MagState']+'#'+pname[1]
@@ -259,10 +260,8 @@ class EVfindMDB ():
             os.mkdir(phdir)
 
         self.num_Born = self.get_dielecfij(phdir, tag)
-        vasp_version = list(self.vasp_db.db['tasks'].find({'$and':[ {'metadata.tag': tag}, { 'calcs_reversed': { '$exists': True } }]}))
         self.static_vasp_version = None
-        for i in vasp_version:
-            v = i['calcs_reversed'][0]['vasp_version']
+        for v in self.static_rec['vasp_versions']:
             #print ("xxxxxxxx", v)
             if self.static_vasp_version is None: self.static_vasp_version = v
             """
@@ -326,31 +325,11 @@ class EVfindMDB ():
 
         with open (os.path.join(voldir,'OSZICAR'),'w') as out:
             out.write('   1 F= xx E0= {}\n'.format(energies[(list(volumes)).index(i['volume'])]))
+        force_constant_matrix = decode_force_constants(i['force_constants'], vasp_db=self.vasp_db)
         with open (os.path.join(voldir,'superfij.out'),'w') as out:
-            for line in range (2,5):
-                out.write('{}\n'.format(unitcell_l[line]))
-            for line in range (2,5):
-                out.write('{}\n'.format(supercell_l[line]))
-            out.write('{} {}\n'.format(natoms, natoms//natom))
-            for line in range (7,natoms+8):
-                out.write('{}\n'.format(supercell_l[line]))
-            force_constant_matrix = np.array(i['force_constants'])
-            hessian_matrix = np.empty((natoms*3, natoms*3), dtype=float)
-
-            for ii in range(natoms):
-               for jj in range(natoms):
-                    for x in range(3):
-                        for y in range(3):
-                            hessian_matrix[ii*3+x, jj*3+y] = -force_constant_matrix[ii,jj,x,y]
-
-            hessian_matrix *= self.force_constant_factor
-            if self.force_constant_factor!=1.0: 
-                print ("\n force constant matrix has been rescaled by :", self.force_constant_factor)
-
-            for xx in range(natoms*3):
-                for yy in range(natoms*3-1):
-                    out.write('{} '.format(hessian_matrix[xx,yy]))
-                out.write('{}\n'.format(hessian_matrix[xx,natoms*3-1]))
+            write_superfij(out, unitcell_l, supercell_l, natom, force_constant_matrix, self.force_constant_factor)
+        if self.force_constant_factor!=1.0: 
+            print ("\n force constant matrix has been rescaled by :", self.force_constant_factor)
         return voldir
 
     def get_dielecfij(self, phdir, tag):
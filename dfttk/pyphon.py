@@ -220,23 +220,106 @@ def caclf(_freq, _pdos, T, dmu=0.0, energyunit='J'):
         return u-T*s, u, s, cv, cv_n, sound_ph, u_nn/nn/h, n, nn, debye
 
 
+def caclf_batch(_freq, _pdos, T, dmu=0.0, energyunit='J', nchunk=256):
+    """
+    Batched version of caclf which calculates the phonon thermodynamic properties for all
+    temperatures together from a (T, freq) Bose-Einstein matrix by matrix-vector products
+
+    Parameters
+
+    _freq : phonon frequency
+    _pdos : phonon DOS
+    T : array of temperatures
+    dmu : to be used external phonon chemical potential
+    nchunk : number of temperatures handled at once to bound the memory usage
+
+    Returns
+
+    Tuple of 10 arrays in the same order as caclf
+    """
+
+    T = np.atleast_1d(np.asarray(T, dtype=float))
+    nT = len(T)
+    hmu = h*_freq[np.where(_freq>0.0)]
+    freq = _freq[np.where(_freq>0.0)]
+    pdos = _pdos[np.where(_freq>0.0)]
+    Nmode = trapz(pdos, freq)
+    u0 = trapz(pdos*hmu*0.5, freq)
+
+    # trapz weights so that trapz(pdos*fn, freq) is fn@pw
+    pw = np.zeros(len(freq))
+    pw[:-1] += 0.5*(freq[1:]-freq[:-1])
+    pw[1:] += 0.5*(freq[1:]-freq[:-1])
+    pw *= pdos
+    ex = hmu-dmu
+    low = freq<1e-2*_freq.max()
+
+    results = np.zeros((10, nT))
+    results[0] = u0
+    results[1] = u0
+    for c0 in range(0, nT, nchunk):
+        iT = np.arange(c0, min(c0+nchunk, nT))
+        iT = iT[T[iT]>0]
+        if len(iT)==0: continue
+        _T = T[iT]
+        Beta = 1/(kB*_T)
+        tc = Beta[:,None]*ex[None,:]
+        # the points with tc>=500 are dropped in caclf
+        k1 = np.sum(tc<500, axis=1)
+        inside = np.arange(len(freq))[None,:] < k1[:,None]
+        tf = np.where(inside, 1.0/np.expm1(np.minimum(tc, 500.0)), 0.0)
+        # (1+tf)*log(1+tf)-tf*log(tf) of caclf, with log((1+tf)/tf) = tc
+        ltf = tf*tc + np.log1p(tf)
+
+        active_freq = tf@(pw*ex)/h
+        lowT = active_freq/_freq.max() < 1.e-7
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sel = (inside & low[None,:]).astype(float)
+            cfreq = (sel@pdos)/(sel@(freq*freq))
+        x3 = (kB/h*_T)**3
+
+        nn = tf@pw
+        nn = np.where(lowT, cfreq*x3*2.4041138064, nn)
+        debye = np.where(lowT, cfreq, nn/(x3*2.4041138064))
+        debye = (Nmode*3/debye)**(1/3)*h/kB
+
+        u_nn = tf@(pw*hmu)
+        u = u0+u_nn
+        s = ltf@pw*kB
+
+        tf = tf*(1.0+tf)
+        n = tf@pw
+        n = np.where(lowT, cfreq*x3*pi**2/3, n)
+        u_n = tf@(pw*ex)/n
+        u_n = np.where(lowT, kB*_T*9*2.4041138064/pi**2, u_n)
+        sound_ph = u_n/h
+
+        cv = tf@(pw*ex**2)/kB/_T/_T
+        cv = np.where(lowT, cfreq*kB*x3*4*pi**4/15, cv)
+        s = np.where(lowT, cv/3., s)
+        u = np.where(lowT, u0+cv*_T/4., u)
+        u_nn = np.where(lowT, cv*_T/4., u_nn)
+
+        cv_n = (tf*(ex[None,:]-u_n[:,None])**2)@pw/kB/_T/_T
+        cv_n = np.where(lowT, cv - n*u_n*u_n/kB/_T/_T, cv_n)
+
+        results[:,iT] = np.array([u-_T*s, u, s, cv, cv_n, sound_ph, u_nn/nn/h, n, nn, debye])
+
+    if energyunit=='eV':
+        results[0:5] /= eV
+    return tuple(results)
+
+
 def vibrational_contributions(T, dos_input=sys.stdin, _dmu=0.0, energyunit='J'):
     freq, pdos, quality, natom = getdos(dos_input)
     #print ("eeeeeeee", natom)
-    nT = T.size
-    F_ph = np.zeros(nT)
-    U_ph = np.zeros(nT)
-    S_ph = np.zeros(nT)
-    C_ph_mu = np.zeros(nT) # phonon specific heat at constant mu
-    NN_ph = np.zeros(nT) # total number of phonon
-    N_ph = np.zeros(nT) # total number of thermal Carrier
-    C_ph_n = np.zeros(nT) # phonon specific heat at constant N
-    sound_ph = np.zeros(nT) # phonon seebeck coefficient (freq/k)
-    sound_nn = np.zeros(nT) # averaged phonon frequency
-    debyeT= np.zeros(nT) # averaged phonon frequency
-
-    for i in range(nT):
-        F_ph[i], U_ph[i], S_ph[i], C_ph_mu[i], C_ph_n[i], sound_ph[i], sound_nn[i], N_ph[i], NN_ph[i], debyeT[i] = caclf(freq, pdos, T[i], dmu=_dmu,energyunit=energyunit)
+    # C_ph_mu: phonon specific heat at constant mu
+    # C_ph_n: phonon specific heat at constant N
+    # sound_ph: phonon seebeck coefficient (freq/k)
+    # sound_nn: averaged phonon frequency
+    # N_ph: total number of thermal Carrier
+    # NN_ph: total number of phonon
+    F_ph, U_ph, S_ph, C_ph_mu, C_ph_n, sound_ph, sound_nn, N_ph, NN_ph, debyeT = caclf_batch(freq, pdos, T, dmu=_dmu,energyunit=energyunit)
     #print ("eeeeee",C_ph_mu*96484)
 
     return F_ph, U_ph, S_ph, C_ph_mu, C_ph_n, sound_ph, sound_nn, N_ph, NN_ph, debyeT, quality, natom
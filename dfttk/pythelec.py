@@ -5,6 +5,11 @@ from __future__ import division
 import sys
 import gzip
 import os
+import mmap
+import itertools
+import functools
+import multiprocessing
+from multiprocessing import shared_memory
 import shutil
 from os import walk
 import subprocess
@@ -12,21 +17,26 @@ import math
 import copy
 import json
 import pickle
+from datetime import datetime
 import numpy as np
 from scipy.constants import physical_constants
 import scipy.constants as scipy_constants 
 from scipy.optimize import brentq, curve_fit
 from scipy.integrate import cumtrapz, trapz, simps
-from scipy.interpolate import interp1d, splev, splrep, BSpline
+from scipy.interpolate import interp1d, splev, splrep, BSpline, make_interp_spline
 from scipy.integrate import quadrature
 from scipy.interpolate import UnivariateSpline
+from scipy.special import erf
 from atomate.vasp.database import VaspCalcDb
 from pymatgen.core import Structure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 import dfttk.pyphon as ywpyphon
-from dfttk.utils import sort_x_by_y
+from dfttk.yphoncache import run_yphon
+from dfttk.utils import sort_x_by_y, decode_force_constants, metadata_filter, encode_array, decode_array
 from dfttk.analysis.ywplot import myjsonout
 from dfttk.analysis.ywutils import get_rec_from_metatag, get_used_pot
+from dfttk.analysis.ywutils import load_static_calculations, get_dos_bulk
+from dfttk.analysis.ywutils import write_fvib_npz, load_fvib, write_fvib_csv
 from dfttk.analysis.ywutils import formula2composition, reduced_formula, MM_of_Elements
 from dfttk.analysis.debye import DebyeModel
 import warnings
@@ -60,26 +70,20 @@ def isint(value):
     return False
 
 
-# this is a FORTRAN function (e.g. 1 return value)
-def pregetdos(f): # Line 186
+def dos_layout(lines):
     """
-    to make the code can also handle WIEN2k dos in the unit of eV
+    determine the layout of the DOS file from its first six lines
 
     Parameters
     ----------
-    f : file descriptor for the DOS file
+    lines : list of the first six lines of the DOS file
 
     Returns
     -------
-    xdn : lower energy to integrate over?
-    xup : higher energy to integrate over?
-    vde : band energy intercal
-    e (array): band energy mesh the Fermi energy has been shifted to zero
-    DOS (array) : e dos
+    (layout, nskip, n_dos, eup, edn, eFermi), where layout is "WIEN2k" or "VASP",
+    nskip is the number of header lines before the n_dos data lines, eup, edn and eFermi
+    are None for WIEN2k since the energy range is taken from the data
     """
-    # read the file
-    lines = f.readlines() # read in all lines then determine is it is WIEN2k DOS (in the unit eV) file or VASP DOS file
-    # now the first line should be the one with the data, lets remove the one into its own special line
     tmp = lines[0]
     if substr(tmp,"#  BAND", 0):
         tmp = lines[1]
@@ -87,33 +91,48 @@ def pregetdos(f): # Line 186
         if substr(tmp, "#EF=",0) and substr(tmp1, "# ENERGY",0):
             tmp1 = tmp[31:43].replace("NENRG=","")
             if isint(tmp1):
-                n_dos = int(tmp1)
-                tmp = lines[2]
-                lines = lines[3:n_dos+3]
-                wienEdos = np.zeros(n_dos)
-                ve = np.zeros(n_dos)
-                for i, l in enumerate(lines):
-                    split_l = l.split(' ')
-                    split_l = [k for k in split_l if k != '']
-                    ve[i], wienEdos[i] = (float(split_l[0]), float(split_l[1]))
-                edn = ve[0]
-                eup = ve[n_dos-1]
-                ve = np.linspace(edn, eup, n_dos)
-                vde = (eup - edn)/(n_dos-1) # This appears to be the change of v per electron, so what is v? Voltage in eV?
-                return edn, eup, vde, ve, wienEdos
+                return "WIEN2k", 3, int(tmp1), None, None, None
 
     tmp = lines[5]
     data_line = tmp[0:32].split(' ') #n_dos >10000, no space left before it in VASP
     data_line.extend(tmp[32:].split(' '))
     # filter out empty spaces
     data_line = [k for k in data_line if k != '']
-    #print (data_line)
     eup, edn, n_dos, eFermi = (float(data_line[0]),
                            float(data_line[1]),
                            int(data_line[2]),
                            float(data_line[3])) # we're leaving the last number behind
-    lines = lines[6:n_dos+6]
-    # line 197 goes to line 209
+    return "VASP", 6, n_dos, eup, edn, eFermi
+
+
+def dos_block(text, n_dos):
+    """
+    parse the n_dos data lines of the DOS file in one pass
+
+    Returns
+    -------
+    2D array (n_dos, ncol), ncol is determined by the first data line
+    """
+    if isinstance(text, bytes): text = text.decode()
+    ncol = len(text[:text.find('\n')].split())
+    data = np.fromstring(text, sep=' ')
+    if data.size < n_dos*ncol:
+        raise ValueError("DOS file ends before {} lines of {} columns are read".format(n_dos, ncol))
+    return data[:n_dos*ncol].reshape(n_dos, ncol)
+
+
+def dos_arrays(layout, data, eup, edn, eFermi):
+    """
+    convert the parsed DOS data into the quantities returned by pregetdos
+    """
+    n_dos = data.shape[0]
+    if layout=="WIEN2k":
+        wienEdos = data[:,1].copy()
+        edn = data[0,0]
+        eup = data[n_dos-1,0]
+        ve = np.linspace(edn, eup, n_dos)
+        vde = (eup - edn)/(n_dos-1) # This appears to be the change of v per electron, so what is v? Voltage in eV?
+        return edn, eup, vde, ve, wienEdos
 
     eup = eup - eFermi
     edn = edn - eFermi
@@ -121,30 +140,89 @@ def pregetdos(f): # Line 186
 
     # vectors
     ve = np.linspace(edn, eup, n_dos)
-    vaspEdos = np.zeros(n_dos)
-
-    for i, l in enumerate(lines):
-        # why do we need to do this?
-        split_l = l.split(' ')
-        # filter again
-        split_l = [k for k in split_l if k != '']
-        if len(split_l)>=5: #spin polarized
-            t, vaspEdos[i], y, vdos, x = (float(split_l[0]), float(split_l[1]), float(split_l[2]), float(split_l[3]), float(split_l[4]))
-            vaspEdos[i] += y
-        else:
-            t, vaspEdos[i], vdos = (float(split_l[0]), float(split_l[1]), float(split_l[2]))
+    vaspEdos = data[:,1].copy()
+    if data.shape[1]>=5: #spin polarized
+        vaspEdos += data[:,2]
     _eFermi = CBMtoVBM(ve, vaspEdos)
 
     return edn-_eFermi, eup-_eFermi, vde, ve-_eFermi, vaspEdos
 
 
+def nth_newline(buf, start, n, chunk=1<<20):
+    """
+    position of the n-th newline in the byte buffer buf counted from start,
+    or len(buf) if there are fewer lines
+    """
+    pos = start
+    while pos < len(buf):
+        nl = np.flatnonzero(np.frombuffer(buf[pos:pos+chunk], dtype=np.uint8)==10)
+        if len(nl) >= n: return pos+nl[n-1]
+        n -= len(nl)
+        pos += chunk
+    return len(buf)
+
+
+def pregetdos_mmap(fname):
+    """
+    pregetdos for an uncompressed DOS file through a memory map, only the header and
+    the total DOS block are touched
+    """
+    with open(fname, 'rb') as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            lines = []
+            pos = 0
+            for i in range(6):
+                end = nth_newline(mm, pos, 1)
+                lines.append(mm[pos:end+1].decode())
+                pos = end+1
+            layout, nskip, n_dos, eup, edn, eFermi = dos_layout(lines)
+            start = sum([len(l.encode()) for l in lines[:nskip]])
+            end = nth_newline(mm, start, n_dos)
+            data = dos_block(mm[start:end+1], n_dos)
+    return dos_arrays(layout, data, eup, edn, eFermi)
+
+
+# this is a FORTRAN function (e.g. 1 return value)
+def pregetdos(f): # Line 186
+    """
+    to make the code can also handle WIEN2k dos in the unit of eV
+
+    Only the header and the total DOS block are read, which are parsed in one pass.
+    Spin polarized VASP DOS (five columns) are summed over the spins
+
+    Parameters
+    ----------
+    f : file descriptor for the DOS file, or the file name. Files ending with .gz are
+        read as gzip stream, other files are read through a memory map
+
+    Returns
+    -------
+    xdn : lower energy to integrate over?
+    xup : higher energy to integrate over?
+    vde : band energy intercal
+    e (array): band energy mesh the Fermi energy has been shifted to zero
+    DOS (array) : e dos
+    """
+    if isinstance(f, str):
+        if f.endswith(".gz"):
+            with gzip.open(f, 'rt') as fp:
+                return pregetdos(fp)
+        return pregetdos_mmap(f)
+
+    # read the header, then only the lines of the total DOS, so that a gzip stream
+    # is decompressed no further than needed
+    lines = [f.readline() for i in range(6)]
+    layout, nskip, n_dos, eup, edn, eFermi = dos_layout(lines)
+    text = ''.join(lines[nskip:]) + ''.join(itertools.islice(f, n_dos-(6-nskip)))
+    data = dos_block(text, n_dos)
+    return dos_arrays(layout, data, eup, edn, eFermi)
+
+
 def CBMtoVBM(ve, vaspEdos):
     # move eFermi to VBM if it in CBM
     vde = ve[1] - ve[0]
-    for i, dos in enumerate(vaspEdos):
-        if ve[i] >= -vde: break
-        if dos!=0.0:
-            _eFermi = ve[i]
+    occupied = np.nonzero((ve < -vde) & (vaspEdos != 0.0))[0]
+    _eFermi = ve[occupied[-1]]
     if _eFermi < -3*vde:
         print ("Fermi energy shifted from CBM", 0.0, "to VBM", _eFermi)
         return _eFermi+vde
@@ -202,9 +280,9 @@ def getdos(xdn, xup, dope, NEDOS, gaussian, edn, eup, vde, ve, tdos): # Line 186
 
     e = np.linspace(xdn,xup,NEDOS,dtype=float)
     if gaussian != 0.0:
-      e = remesh(xdn, xup, gaussian, 0.0, eBoF, NEDOS)
+      e = remesh_array(xdn, xup, gaussian, 0.0, eBoF, NEDOS)
 
-    dos = refdos(eBoF, 0.0, vde, edn, e, ve, tdos)
+    dos = refdos_array(eBoF, 0.0, vde, edn, e, ve, tdos)
     ados = cumtrapz(dos, e, initial=0.0)
     idx = closest(e,0.0)
     for idx1 in range(idx-1, 0, -1):
@@ -229,9 +307,9 @@ def getdos(xdn, xup, dope, NEDOS, gaussian, edn, eup, vde, ve, tdos): # Line 186
 
     if gaussian != 0.0 and abs(dope)>0.0001: # why did I do this ***********************
     #if gaussian != 0.0:
-      e = remesh(xdn, xup, gaussian, dF, eBoF, NEDOS)
+      e = remesh_array(xdn, xup, gaussian, dF, eBoF, NEDOS)
 
-    dos = refdos(eBoF, dF, vde, edn, e, ve, tdos)
+    dos = refdos_array(eBoF, dF, vde, edn, e, ve, tdos)
     edos = e*dos
     ados = cumtrapz(dos, e, initial=0.0)
     energy = cumtrapz(edos, e, initial=0.0)
@@ -313,6 +391,92 @@ def refdos(eBoF, dF, vde, edn, e, ve, tdos):
           dos[i] = tdos[kx] + (tdos[kx+1] - tdos[kx])/vde*(tx - ve[kx])
     return dos
 
+def remesh_array(xdn, xup, gaussian, dF, eBoF, NEDOS, maxiter=50):
+    """
+    array version of remesh. The recurrence e[i] = e[i-1]+xde/f1(e[i-1]) of remesh is solved
+    as a whole by Newton iterations, for which each correction is a linear recurrence given in
+    closed form by cumprod/cumsum. The initial guess is the continuous solution of the
+    recurrence, where the integral of f1 is known analytically by erf
+
+    Parameters
+    ----------
+    same as remesh
+    maxiter : maximum number of Newton iterations
+
+    Return
+    ------
+    e : refined e mesh
+    """
+
+    xde = 2.0*(xup - xdn)/(NEDOS-1)
+    if eBoF>0.0:
+        xde = 3.0*(xup - xdn)/(NEDOS-1)
+    sigma = -0.5*(gaussian/(xup-xdn))**2
+    fac = gaussian/(math.sqrt(2.0*math.pi))
+    centers = [0.0]
+    if eBoF>0.0:
+        if dF < eBoF: centers.append(eBoF-dF)
+        else: centers.append(-dF)
+
+    e0 = xdn - dF
+    if sigma==0.0:
+        return e0 + np.arange(NEDOS)*xde
+
+    # continuous solution from the inverse of i(e) = int_e0^e f1(x)/xde dx
+    x = np.linspace(e0, e0+(NEDOS-1)*xde, 4*NEDOS)
+    ix = x - e0
+    a = math.sqrt(-sigma)
+    for c in centers:
+        ix += 0.5*fac*math.sqrt(math.pi)/a*(erf(a*(x-c)) - erf(a*(e0-c)))
+    e = np.interp(np.arange(NEDOS)*xde, ix, x)
+
+    tol = 1.e-14*max(abs(xdn), abs(xup), 1.0)
+    for it in range(maxiter):
+        x = e[:-1]
+        f1 = np.ones(len(x))
+        df1 = np.zeros(len(x))
+        for c in centers:
+            g = fac*np.exp(sigma*(x-c)**2)
+            f1 += g
+            df1 += 2.0*sigma*(x-c)*g
+        r = e[1:] - x - xde/f1
+        # the correction d[i] = (1+h'(e[i-1]))*d[i-1] - r[i-1] with d[0] = 0, h = xde/f1
+        p = np.cumprod(1.0 - xde*df1/(f1*f1))
+        d = p*np.cumsum(-r/p)
+        e[1:] += d
+        if np.max(abs(d)) <= tol: break
+    return e
+
+def refdos_array(eBoF, dF, vde, edn, e, ve, tdos):
+    """
+    array version of refdos, with the band edges handled by masks
+
+    Parameter
+    ---------
+    same as refdos
+
+    Return
+    ------
+    dos : refined e dos
+    """
+
+    ve = np.asarray(ve, dtype=float)
+    tdos = np.asarray(tdos, dtype=float)
+    n_dos = len(tdos)
+    tx = np.asarray(e, dtype=float) + dF
+    kx = np.clip(np.trunc((tx-edn)/vde), 0, n_dos-2).astype(int)
+    t0, t1 = tdos[kx], tdos[kx+1]
+    v0, v1 = ve[kx], ve[kx+1]
+    # near the Top of valence band
+    vbm = (t1==0.0) & (v1>0.0) & (v1<vde)
+    # near the bottom of conduction band
+    cbm = ~vbm & (eBoF > 0.0) & (t0==0.0) & (v1-eBoF<vde) & (v1-eBoF>0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dos = t0 + (t1 - t0)/vde*(tx - v0)
+        dos = np.where(vbm, np.where(tx>=0.0, 0.0, t0*tx/v0), dos)
+        dos = np.where(cbm, np.where(tx<=eBoF, 0.0, t1*(tx-eBoF)/(v1-eBoF)), dos)
+    return dos
+
 def closest(e,val):
     """
     find the index of the band energy which is the close to the energy val
@@ -486,6 +650,248 @@ def caclf(pe, pdos, NELECTRONS, Beta, mu_ref=0.0, dF=0.0, IntegrationFunc=trapz)
     return mu_el, u, -s*k_B, cv*k_B*Beta*Beta, Q_el, Y_el, Q_p, Q_e, c_mu*k_B*Beta*Beta, W_p, W_e, Y_p, Y_e
 
 
+def trapz_weights(pe):
+    """
+    weights w such that trapz(fn, pe, axis=-1) equals fn @ w, so that the trapz integrations
+    for all temperatures reduce to one matrix-vector product
+    """
+    de = pe[1:] - pe[:-1]
+    w = np.zeros(len(pe))
+    w[:-1] += 0.5*de
+    w[1:] += 0.5*de
+    return w
+
+
+def cumtrapz_rows(fn, de, reverse=False):
+    """
+    row-wise cumulative trapz integration of fn on the energy grid with intervals de.
+    cs[:,j] is the integral from the first point to point j, or, for reverse=True,
+    from point j to the last point
+    """
+    seg = 0.5*(fn[:,1:]+fn[:,:-1])*de
+    cs = np.zeros(fn.shape)
+    if reverse:
+        cs[:,:-1] = np.cumsum(seg[:,::-1], axis=1)[:,::-1]
+    else:
+        cs[:,1:] = np.cumsum(seg, axis=1)
+    return cs
+
+
+def edge_trapz(pe, fn, cs, k0, k1, x, below=True, outside=None):
+    """
+    trapz integration from the first point up to x (below=True) or from x to the last
+    point (below=False) with the value at x linearly interpolated, that is, the array form of
+    trapz(np.hstack([fn[pe<x],f(x)]), np.hstack([pe[pe<x],x])) and its counterpart in caclf
+
+    Parameters
+    ----------
+    pe : 1D array (nE) of band energy
+    fn : 2D array (nT, nE) of the integrand
+    cs : cumtrapz_rows of fn, with reverse=not below
+    k0, k1 : 1D int arrays (nT), window [k0, k1) of caclf for each temperature
+    x : 1D array (nT) of the end point
+    outside : value used at x if x is out of the window. None means extrapolate the edge segment
+
+    Returns
+    -------
+    1D array (nT) of the integrals
+    """
+    nE = fn.shape[1]
+    rows = np.arange(fn.shape[0])
+    ihi = k1 - 1
+    jl = np.searchsorted(pe, x, side='left') # number of points with pe<x
+    j = np.clip(np.minimum(jl-1, ihi-1), k0, np.maximum(k0, ihi-1))
+    f0 = fn[rows,j]
+    f1 = fn[rows,np.minimum(j+1,nE-1)]
+    e0 = pe[j]
+    e1 = pe[np.minimum(j+1,nE-1)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fx = np.where(e1!=e0, f0 + (f1-f0)*(x-e0)/(e1-e0), f0)
+    if outside is not None:
+        fx = np.where((x < pe[k0]) | (x > pe[np.maximum(ihi,0)]), outside, fx)
+
+    if below:
+        k = np.clip(jl, k0, k1) - 1 # last point with pe<x
+        has = k >= k0
+        k = np.clip(k, 0, nE-1)
+        result = cs[rows,k] + 0.5*(fn[rows,k]+fx)*(x-pe[k])
+    else:
+        k = np.clip(np.searchsorted(pe, x, side='right'), k0, k1) # first point with pe>x
+        has = k < k1
+        k = np.clip(k, 0, nE-1)
+        result = cs[rows,k] + 0.5*(fx+fn[rows,k])*(pe[k]-x)
+    return np.where(has, result, 0.0)
+
+
+def fermi_window(pe, mu_el, Beta, tcut=50.0):
+    """
+    find the energy points [i0, i1) needed for the given chemical potentials and temperatures.
+    All points below i0 have Beta*(e-mu)<-tcut so that the Fermi-Dirac occupation is 1 and all
+    points from i1 on have Beta*(e-mu)>tcut so that it is 0, both to within exp(-tcut)
+    """
+    i0 = np.searchsorted(pe, np.min(mu_el-tcut/Beta), side='left') - 1
+    i1 = np.searchsorted(pe, np.max(mu_el+tcut/Beta), side='right') + 1
+    return max(i0, 0), min(i1, len(pe))
+
+
+def fermi_occupation(pe, mu_el, Beta):
+    """
+    Fermi-Dirac occupation on the (T, E) grid
+
+    Returns
+    -------
+    tc : Beta*(pe-mu_el)
+    k0 : number of points with tc<-200 for each temperature
+    k1 : number of points with tc<200 for each temperature, the points from k1 on are dropped as in caclf
+    tf : Fermi-Dirac occupation
+    """
+    tc = Beta[:,None]*(pe[None,:]-mu_el[:,None])
+    k0 = np.sum(tc<-200, axis=1)
+    k1 = np.sum(tc<200, axis=1)
+    tf = 1.0/(np.exp(np.minimum(tc, 200.0))+1.0)
+    return tc, k0, k1, tf
+
+
+def gfind_batch(pe, pdos, ados, NELECTRONS, Beta, lo, hi, xtol=1.e-13, maxiter=200):
+    """
+    Solve the chemical potential for all temperatures at once by bracketed Newton/bisection,
+    which is the batched form of calling brentq on gfind temperature by temperature
+
+    Parameters
+    ----------
+    ados : cumtrapz of pdos over pe, used for the fully occupied states
+    lo, hi : 1D arrays (nT) bracketing the chemical potential
+
+    Returns
+    -------
+    1D array (nT) of the electron chemical potential
+    """
+    mu_el = 0.5*(lo+hi)
+    active = np.ones(len(Beta), dtype=bool)
+    for it in range(maxiter):
+        idx = np.nonzero(active)[0]
+        if len(idx)==0: break
+        x = mu_el[idx]
+        B = Beta[idx]
+        i0, i1 = fermi_window(pe, x, B)
+        _pe = pe[i0:i1]
+        _, k0, k1, tf = fermi_occupation(_pe, x, B)
+        w = trapz_weights(_pe)
+        fn = pdos[i0:i1]*tf
+        g = ados[i0] + fn@w - NELECTRONS
+        dg = (fn*(1.0-tf))@w*B
+        _lo = np.where(g<0.0, x, lo[idx])
+        _hi = np.where(g>0.0, x, hi[idx])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xn = x - g/dg
+        bisect = ~(np.isfinite(xn) & (xn>_lo) & (xn<_hi))
+        xn = np.where(bisect, 0.5*(_lo+_hi), xn)
+        lo[idx] = _lo
+        hi[idx] = _hi
+        converged = abs(g) <= 1.e-15*NELECTRONS # g is only known to the rounding error
+        mu_el[idx] = np.where(converged, x, xn)
+        tol = xtol*np.maximum(1.0, abs(x))
+        done = converged | (abs(xn-x) < tol) | (_hi-_lo < tol)
+        active[idx[done]] = False
+    return mu_el
+
+
+def caclf_batch(pe, pdos, NELECTRONS, Beta, dF=0.0, nchunk=64):
+    """
+    Batched version of caclf which calculates the thermal electronic properties for all
+    temperatures together through array reductions over a (T, E) Fermi-Dirac matrix.
+    Only the energy window given by fermi_window enters the matrix, the fully occupied states
+    below it are accounted by cumulative integration
+
+    Parameters
+    ----------
+    pe : band energy array
+    pdos : e DOS
+    NELECTRONS : total number of electrons
+    Beta : array of 1/(kB*T), T must be positive
+    nchunk : number of temperatures handled at once to bound the memory usage
+
+    Returns
+    -------
+    Tuple of 13 arrays in the same order as caclf
+    """
+    pe = np.asarray(pe, dtype=float)
+    pdos = np.asarray(pdos, dtype=float)
+    Beta = np.atleast_1d(np.asarray(Beta, dtype=float))
+    ados = cumtrapz(pdos, pe, initial=0.0)
+    eados = cumtrapz(pdos*pe, pe, initial=0.0)
+    nT = len(Beta)
+    results = np.zeros((13, nT))
+    order = np.argsort(-Beta) # neighboring temperatures share similar energy windows
+    for c0 in range(0, nT, nchunk):
+        iT = order[c0:c0+nchunk]
+        B = Beta[iT]
+        nt = len(B)
+
+        # bracket the chemical potential in the same way as caclf by doubling deltaE
+        deltaE = np.full(nt, 2.0)
+        for i in range(8):
+            g = []
+            for x in (-deltaE, deltaE):
+                i0, i1 = fermi_window(pe, x, B)
+                _pe = pe[i0:i1]
+                _, k0, k1, tf = fermi_occupation(_pe, x, B)
+                g.append(ados[i0] + (pdos[i0:i1]*tf)@trapz_weights(_pe) - NELECTRONS)
+            fail = (g[0]>0.0) | (g[1]<0.0)
+            if not fail.any(): break
+            deltaE[fail] *= 2
+        mu_el = gfind_batch(pe, pdos, ados, NELECTRONS, B, -deltaE, deltaE.copy())
+
+        i0, i1 = fermi_window(pe, mu_el, B)
+        _pe = pe[i0:i1]
+        _pdos = pdos[i0:i1]
+        de = _pe[1:] - _pe[:-1]
+        w = trapz_weights(_pe)
+        tc, k0, k1, tf = fermi_occupation(_pe, mu_el, B)
+        u = eados[i0] + tf@(_pdos*_pe*w)
+
+        # the integrands below vanish outside of the window [k0, k1) of caclf, where
+        # tc[closest(tc,-200):k1] is taken, to far beyond the precision of double
+        tf1 = 1.0 - tf + 1.e-60
+        s = (tf*np.log(tf)+tf1*np.log(tf1))@(_pdos*w)
+
+        fn = _pdos*tf*(1.0-tf)
+        dmu = _pe[None,:]-mu_el[:,None]
+        Q_el = fn@w
+        Y_el = (fn*dmu)@w
+        c_mu = (fn*dmu*dmu)@w
+        with np.errstate(divide='ignore', invalid='ignore'):
+            e_ = np.where(Q_el!=0.0, Y_el/Q_el, 0.0)
+        dmu -= e_[:,None]
+        cv = np.where(Q_el!=0.0, (fn*dmu*dmu)@w, 0.0)
+        rows = np.arange(nt)
+        cs_p = cumtrapz_rows(fn, de)
+        cs_e = cumtrapz_rows(fn, de, reverse=True)
+        kF = np.searchsorted(_pe, dF, side='right') # points with pe<=dF
+        Q_p = np.where(kF>k0, cs_p[rows,np.clip(kF-1, k0, k1-1)], 0.0)
+        Q_e = np.where(kF<k1, cs_e[rows,np.clip(kF, k0, k1-1)], 0.0)
+
+        # hole/electron concentration by effective carrier
+        W_p = edge_trapz(_pe, fn, cs_p, k0, k1, mu_el, below=True)
+        W_e = edge_trapz(_pe, fn, cs_e, k0, k1, mu_el, below=False)
+
+        # hole/electron concentration by alternative difination
+        _dF = np.full(nt, dF)
+        fn = _pdos*(1.0-tf)
+        Y_p = edge_trapz(_pe, fn, cumtrapz_rows(fn, de), k0, k1, _dF, below=True, outside=0.0)
+        fn = _pdos*tf
+        Y_e = edge_trapz(_pe, fn, cumtrapz_rows(fn, de, reverse=True), k0, k1, _dF, below=False, outside=0.0)
+
+        results[:,iT] = np.array([mu_el, u, -s*k_B, cv*k_B*B*B, Q_el, Y_el, Q_p, Q_e,
+            c_mu*k_B*B*B, W_p, W_e, Y_p, Y_e])
+    return tuple(results)
+
+
+# runthelec(batch=True) falls back to caclf where Beta*Q_el, the thermally broadened DOS at the
+# chemical potential, is below this fraction of the mean DOS
+GAP_DOS_RATIO = 0.1
+
+
 def T_remesh(t0, t1, td, _nT=-1):
     T = []
     if td > 0:
@@ -507,7 +913,7 @@ def T_remesh(t0, t1, td, _nT=-1):
 
 
 def runthelec(t0, t1, td, xdn, xup, dope, ndosmx, gaussian, natom,
-    _T=[], dos=sys.stdin, fout=sys.stdout, vol=None, IntegrationFunc=trapz):
+    _T=[], dos=sys.stdin, fout=sys.stdout, vol=None, IntegrationFunc=trapz, batch=False):
     """
     Calculate thermal free energy from electronic density of states (e DOS)
 
@@ -532,10 +938,14 @@ def runthelec(t0, t1, td, xdn, xup, dope, ndosmx, gaussian, natom,
     natom : int
         Default 1. Number of atoms in the unit cell if one wants to renomalize
         the calculated properties in the unit of per atom
-    dos : file description for the DOSCAR or pymatgen dos object
+    dos : file description or file name for the DOSCAR (or the dos.npz by DosArrays.to_npz) or pymatgen dos object
         Filename for VASP DOSCAR
     outf : file description
         Output file description for the calculated properties
+    batch : bool
+        Default False. If True, solve all temperatures together by caclf_batch instead of
+        calling caclf temperature by temperature (only for IntegrationFunc=trapz). The low
+        temperatures with the chemical potential in a band gap are still solved by caclf
 
     Return
     ------
@@ -545,7 +955,8 @@ def runthelec(t0, t1, td, xdn, xup, dope, ndosmx, gaussian, natom,
     Other quantities are for researching purpose
     """
 
-    if hasattr(dos, 'read'):
+    if isinstance(dos, str) and dos.endswith('.npz'): dos = DosArrays.from_npz(dos)
+    if hasattr(dos, 'read') or isinstance(dos, str):
         edn, eup, vde, dos_energies, vaspEdos = pregetdos(dos) # Line 186
     else:
         e_fermi = dos.efermi
@@ -596,13 +1007,42 @@ def runthelec(t0, t1, td, xdn, xup, dope, ndosmx, gaussian, natom,
     seebeck_coefficients = np.zeros(nT)
     U_el[0] = E0
 
-    for i in range(0,nT):
-        if T[i]==0.0: continue
+    def _caclf(i):
         Beta = 1.0e0/(T[i]*k_B)
         M_el[i], U_el[i], S_el[i], C_el[i], Q_el[i],Y_el[i], Q_p[i],Q_e[i],  C_mu[i], W_p[i], W_e[i], Y_p[i], Y_e[i] = caclf(e, dos, NELECTRONS, Beta, M_el[i-1], dF=-dF, IntegrationFunc=IntegrationFunc)
         if Q_el[i]>0.0:
             seebeck_coefficients[i] = -1.0e6*Y_el[i]/Q_el[i]/T[i]
 
+    if batch and IntegrationFunc is trapz:
+        T = np.array(T, dtype=float)
+        # when mu sits in a band gap, dN/dmu = Beta*Q_el is tiny and mu is only defined to the
+        # solver tolerance. The low temperature end is therefore solved by caclf, chained through
+        # M_el[i-1] as in the scalar path, up to the first temperature which is not gapped
+        dos_gap = GAP_DOS_RATIO*trapz(dos, e)/(e[-1]-e[0])
+        n0 = 0
+        while n0<nT:
+            n0 += 1
+            if T[n0-1]==0.0: continue
+            _caclf(n0-1)
+            if Q_el[n0-1]/(T[n0-1]*k_B) >= dos_gap: break
+        iT = T!=0.0
+        iT[0:n0] = False
+        if iT.any():
+            M_el[iT], U_el[iT], S_el[iT], C_el[iT], Q_el[iT], Y_el[iT], Q_p[iT], Q_e[iT], C_mu[iT], W_p[iT], W_e[iT], Y_p[iT], Y_e[iT] = caclf_batch(e, dos, NELECTRONS, 1.0e0/(T[iT]*k_B), dF=-dF)
+            # a gapped temperature above the first ungapped one is rare; fall back to caclf up to it
+            with np.errstate(divide='ignore', invalid='ignore'):
+                gapped = np.nonzero(iT & (Q_el/(T*k_B) < dos_gap))[0]
+            if len(gapped)!=0:
+                for i in range(n0, gapped[-1]+1):
+                    if T[i]!=0.0: _caclf(i)
+                iT[0:gapped[-1]+1] = False
+            iT &= Q_el>0.0
+            seebeck_coefficients[iT] = -1.0e6*Y_el[iT]/Q_el[iT]/T[iT]
+    else:
+        for i in range(0,nT):
+            if T[i]==0.0: continue
+            _caclf(i)
+
     F_el_atom = (U_el - T * S_el - E0) / natom  # electronic free energy per atom
     S_el_atom = S_el / natom  # entropy per atom
     #dU_dT = np.gradient(U_el, td) # gradient on U_el with step size of td
@@ -661,6 +1101,135 @@ def thelecAPI(t0, t1, td, xdn, xup, dope, ndosmx, gaussian, natom, outf, doscar)
             if Q_el[i] > 1.e-16: L = C_el_atom[i]/Q_el[i]*k_B
             fvib.write('{} {} {} {} {} {} {} {} {} {} {} {} {} {} {}\n'.format(T[i], F_el_atom[i], S_el_atom[i], C_el_atom[i], M_el[i], seebeck_coefficients[i], L, Q_el[i], Q_p[i], Q_e[i], C_mu[i], W_p[i], W_e[i], Y_p[i], Y_e[i]))
 
+class DosArrays():
+    """
+    compact total DOS, a picklable stand-in of pymatgen Dos with only the arrays used by
+    runthelec, so that the DOS can be stored, cached and sent to the worker processes cheaply
+
+    Parameters
+    ----------
+    dos : pymatgen Dos (the projected DOS of CompleteDos are dropped) or any object with
+        efermi, energies and get_densities()
+    efermi, energies, densities : used if dos is None, densities is of shape (ispin, nedos)
+    """
+    def __init__(self, dos=None, efermi=None, energies=None, densities=None):
+        if dos is not None:
+            efermi = dos.efermi
+            energies = dos.energies
+            if isinstance(getattr(dos, 'densities', None), dict):
+                densities = [dos.densities[spin] for spin in sorted(dos.densities, key=lambda x: -int(x))]
+            else:
+                densities = [dos.get_densities()]
+        self.efermi = float(efermi)
+        self.energies = np.array(energies, dtype=float)
+        self.densities = np.array(densities, dtype=float).reshape(-1, len(self.energies))
+
+    @property
+    def ispin(self):
+        return len(self.densities)
+
+    def get_densities(self):
+        return self.densities.sum(axis=0)
+
+    def as_dict(self, dtype='float64', compression='gzip'):
+        """
+        encode the arrays by dfttk.utils.encode_array to be stored in MongoDB
+        """
+        return {'efermi': self.efermi, 'ispin': self.ispin,
+            'energies': encode_array(self.energies, dtype=dtype, compression=compression),
+            'densities': encode_array(self.densities, dtype=dtype, compression=compression)}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(efermi=d['efermi'], energies=decode_array(d['energies']),
+            densities=decode_array(d['densities']))
+
+    def to_npz(self, fname):
+        np.savez(fname, efermi=self.efermi, energies=self.energies, densities=self.densities)
+
+    @classmethod
+    def from_npz(cls, fname):
+        with np.load(fname) as d:
+            return cls(efermi=d['efermi'], energies=d['energies'], densities=d['densities'])
+
+
+class LazyDos():
+    """
+    DOS handle which calls loader() to get the DOS on the first access of efermi,
+    energies or get_densities()
+    """
+    def __init__(self, loader):
+        self.loader = loader
+        self._dos = None
+
+    @property
+    def dos(self):
+        if self._dos is None: self._dos = self.loader()
+        return self._dos
+
+    @property
+    def efermi(self):
+        return self.dos.efermi
+
+    @property
+    def energies(self):
+        return self.dos.energies
+
+    def get_densities(self):
+        return self.dos.get_densities()
+
+
+def runthelec_shared(job):
+    """
+    worker of runthelec_pool. Calculate one volume and write the results into the
+    shared theall buffer
+
+    Parameters
+    ----------
+    job : tuple of (i, shm_name, shape, args, kwargs), i is the volume index in theall,
+        args and kwargs are passed to runthelec
+    """
+    i, shm_name, shape, args, kwargs = job
+    prp_vol = runthelec(*args, **kwargs)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        theall = np.ndarray(shape, dtype=float, buffer=shm.buf)
+        theall[:,:,i] = np.array(prp_vol)
+        del theall
+    finally:
+        shm.close()
+    return i
+
+
+def runthelec_pool(jobs, nT, nV, processes):
+    """
+    run runthelec for the volumes in a process pool
+
+    Parameters
+    ----------
+    jobs : list of (i, args, kwargs) for each volume, with the DOS given by file name or DosArrays
+    nT : number of temperatures
+    nV : number of volumes
+    processes : number of worker processes
+
+    Returns
+    -------
+    theall : array of (14, nT, nV)
+    """
+    shape = (14, nT, nV)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape))*8)
+    try:
+        _jobs = [(i, shm.name, shape, args, kwargs) for i, args, kwargs in jobs]
+        with multiprocessing.Pool(processes=min(processes, len(_jobs))) as pool:
+            for i in pool.imap_unordered(runthelec_shared, _jobs):
+                pass
+        theall = np.ndarray(shape, dtype=float, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return theall
+
+
 def BMvol(V,a):
   T = np.array(V)**(-1./3) # new bug fix
   fval = a[0]+a[1]*T
@@ -727,6 +1296,100 @@ def BMfitF(V, x, y, BMfunc):
   f, pcov = alt_curve_fit(BMfunc, x, y)
   return BMvol(V,f)
 
+
+class BMEOS:
+    """
+    polynomial Birch-Murnaghan EOS, F = sum_k a_k*V**(-k/3), fitted once by linear least squares
+
+    Parameters
+    ----------
+    vol : volumes
+    F : energies, array of (nV) or (nV, nT) to fit all the columns (temperatures) in one
+        multi-RHS least-squares solve
+    BMfunc : BMvol4 for the 4-parameter (cubic) or BMvol5 for the 5-parameter (quartic) form
+    coef : already fitted coefficients, array of (order+1) or (order+1, nT), skips the fit
+
+    The F, dFdV, d2FdV2, P and B evaluators take V of shape broadcastable to the columns, i.e.
+    a scalar or (nT) array evaluates each column at its own volume and (m, 1) gives (m, nT)
+    """
+    def __init__(self, vol, F=None, BMfunc=BMvol4, coef=None):
+        vol = np.asarray(vol, dtype=float)
+        self.vn = vol.min()
+        self.vx = vol.max()
+        if coef is None:
+            order = 4 if BMfunc.__name__=="BMvol5" else 3
+            coef = np.polyfit(vol**(-1/3), np.asarray(F, dtype=float), order)[::-1]
+        self.coef = np.asarray(coef, dtype=float)
+        self.dcoef = np.polynomial.polynomial.polyder(self.coef, axis=0)
+        self.d2coef = np.polynomial.polynomial.polyder(self.dcoef, axis=0)
+
+    def column(self, j):
+        """return the EOS of the j-th column"""
+        return BMEOS([self.vn, self.vx], coef=self.coef.reshape(len(self.coef), -1)[:,j])
+
+    def _eval(self, c, V):
+        return np.polynomial.polynomial.polyval(np.asarray(V, dtype=float)**(-1/3), c, tensor=False)
+
+    def F(self, V):
+        return self._eval(self.coef, V)
+
+    def dFdV(self, V):
+        """dF/dV, the same as BMfitP"""
+        V = np.asarray(V, dtype=float)
+        return self._eval(self.dcoef, V)*V**(-4./3)*(-1./3.)
+
+    def d2FdV2(self, V):
+        V = np.asarray(V, dtype=float)
+        return self._eval(self.d2coef, V)*V**(-8./3)/9. + self._eval(self.dcoef, V)*V**(-7./3)*4./9.
+
+    def P(self, V):
+        """pressure, -dF/dV"""
+        return -self.dFdV(V)
+
+    def B(self, V):
+        """bulk modulus, V*d2F/dV2, the same as the first return of BMfitB"""
+        return np.asarray(V, dtype=float)*self.d2FdV2(V)
+
+    def minimum(self, N=7, ngrid=1000):
+        """
+        find the equilibrium volume of each column as BMDifB. The minimum is located on a grid of
+        ngrid volumes as BMDifB does and then refined by the roots of the polynomial dF/dt (t=V**(-1/3))
+        of degree 2 or 3, instead of root finding on refitted polynomials
+
+        Returns
+        -------
+        blat, v, ff, dFdV : bulk modulus, volume, energy and dF/dV at the minimum, scalars for one
+            column or arrays of (nT). -1.0, -1.0, 0., 0. if the minimum is near or beyond the volume range
+        """
+        single = self.coef.ndim==1
+        coef = self.coef.reshape(len(self.coef), -1)
+        dcoef = self.dcoef.reshape(len(self.dcoef), -1)
+        nT = coef.shape[1]
+        xx = np.linspace(self.vn, self.vx, ngrid)
+        yy = self._eval(coef, xx[:,None])
+        idx = np.argmin(yy, axis=0)
+        ok = (idx >= N//2) & (idx < ngrid-N//2-2)
+        v = np.full(nT, self.vn)
+        for j in np.nonzero(ok)[0]:
+            lo, hi = xx[idx[j]-1], xx[idx[j]+1]
+            t = np.polynomial.polynomial.polyroots(dcoef[:,j])
+            t = t.real[(np.abs(t.imag) <= 1.e-12*np.abs(t)) & (t.real > 0)]
+            vr = t**(-3)
+            vr = vr[(vr >= lo) & (vr <= hi)]
+            if len(vr)==1:
+                v[j] = vr[0]
+            elif len(vr) > 1:
+                v[j] = vr[np.argmin(self._eval(coef[:,j], vr))]
+            else:
+                v[j] = brentq(self.column(j).dFdV, lo, hi, maxiter=10000)
+        eos = BMEOS([self.vn, self.vx], coef=coef)
+        blat = np.where(ok, eos.B(v), -1.0)
+        ff = np.where(ok, eos.F(v), 0.)
+        pp = np.where(ok, eos.dFdV(v), 0.)
+        v = np.where(ok, v, -1.0)
+        if single: return blat[0], v[0], ff[0], pp[0]
+        return blat, v, ff, pp
+
 def BMsmooth(_V, _E0, _Flat, _Fel, _Slat, _Sel, BMfunc, elmode):
     E0 = BMfitF(_V, _V, _E0, BMfunc)
     if elmode==1:
@@ -831,18 +1494,162 @@ def CenDifB(vol, F, N=7,kind='cubic'):
     except:
         return -1.0, -1.0, 0.
 
+def SplineDifB(vol, F, S=None, N=7, kind='cubic'):
+    """
+    Equilibrium properties of F(V) as CenDifB, with the derivatives taken analytically from
+    one spline per temperature instead of the central differences of repeatedly built interpolants
+
+    Parameters
+    ----------
+    vol : volumes
+    F : free energies of shape (nV) or (nV, nT) for nT temperatures
+    S : entropies of the same shape as F, optional
+    N : the minimum at the first or last N//2+1 points of the 1000 point mesh is rejected, as CenDifB
+    kind : 'cubic' for the interpolating cubic spline (as interp1d), otherwise UnivariateSpline
+
+    Returns
+    -------
+    blat : V*d2F/dV2 at the equilibrium volume, -1 if the minimum is not found
+    v : equilibrium volume, -1 if the minimum is not found
+    ff : F at the equilibrium volume by linear interpolation, 0 if the minimum is not found
+    dSdV : dS/dV at the equilibrium volume, None if S is None
+    (scalars for F of shape (nV), arrays of shape (nT) otherwise)
+    """
+    vol = np.asarray(vol, dtype=float)
+    order = np.argsort(vol)
+    vol = vol[order]
+    F = np.asarray(F, dtype=float)
+    single = F.ndim == 1
+    F = F.reshape(len(vol), -1)[order]
+    nT = F.shape[1]
+    if S is not None: S = np.asarray(S, dtype=float).reshape(len(vol), -1)[order]
+    xx = np.linspace(vol[0], vol[-1], 1000)
+    if kind=='cubic':
+        #one not-a-knot spline (as interp1d) for all the temperatures, split into columns
+        fspl = make_interp_spline(vol, F, k=3, axis=0)
+        fsplines = [BSpline(fspl.t, fspl.c[:,j], fspl.k) for j in range(nT)]
+        yy = fspl(xx)
+        if S is not None:
+            sspl = make_interp_spline(vol, S, k=3, axis=0)
+            ssplines = [BSpline(sspl.t, sspl.c[:,j], sspl.k) for j in range(nT)]
+    else:
+        fsplines = [UnivariateSpline(vol, F[:,j]) for j in range(nT)]
+        yy = np.array([f(xx) for f in fsplines]).T
+        if S is not None: ssplines = [UnivariateSpline(vol, S[:,j]) for j in range(nT)]
+
+    blat = np.full(nT, -1.0)
+    v = np.full(nT, -1.0)
+    ff = np.zeros(nT)
+    dSdV = np.zeros(nT)
+    for j in range(nT):
+        idx = int(np.argmin(yy[:,j]))
+        if idx <N//2 or idx>=len(xx)-N//2-2: continue
+        d1 = fsplines[j].derivative()
+        try:
+            v[j] = brentq(d1, xx[idx-1], xx[idx+1], maxiter=10000)
+        except ValueError:
+            v[j] = -1.0
+            continue
+        ff[j] = np.interp(v[j], vol, F[:,j])
+        blat[j] = v[j]*fsplines[j].derivative(2)(v[j])
+        if S is not None: dSdV[j] = ssplines[j].derivative()(v[j])
+    if S is None: dSdV = None
+    if single:
+        return blat[0], v[0], ff[0], (None if dSdV is None else dSdV[0])
+    return blat, v, ff, dSdV
+
+
 def BMDifB(vol, F, BMfunc, N=7, _T=0):
-    vn = min(vol)
-    vx = max(vol)
-    xx = np.linspace(vn,vx,1000)
-    yy = BMfitF(xx, vol, F, BMfunc)
-    val, idx = min((val, idx) for (idx, val) in enumerate(yy))
-    if idx <N//2 or idx>=len(xx)-N//2-2:
-        return -1.0, -1.0, 0.,0.
-    v = brentq(BMfitP, xx[idx-1], xx[idx+1], args=(vol, F, BMfunc), maxiter=10000)
-    ff = BMfitF(v, vol, F, BMfunc)
-    bb, pp = BMfitB(v, vol, F, BMfunc)
-    return bb, v, ff, pp
+    """
+    equilibrium of the Birch-Murnaghan fit of F(vol), F can be (nV, nT) to solve all the
+    temperatures at once, see BMEOS.minimum
+    """
+    return BMEOS(vol, F, BMfunc).minimum(N=N)
+
+
+def ltc_dot(T, b, i, left=None):
+    """
+    cosine of the angle between the segments (i-1, i) and (i, i+1) of the curve b(T), as thelecMDB.dot,
+    for an array of indices i. left replaces b[i-1] if given
+    """
+    i = np.asarray(i)
+    dx0 = T[i] - T[i-1]
+    dx1 = T[i+1] - T[i]
+    dy0 = b[i] - (b[i-1] if left is None else left)
+    dy1 = b[i+1] - b[i]
+    s0 = np.sqrt(dx0*dx0+dy0*dy0)
+    s1 = np.sqrt(dx1*dx1+dy1*dy1)
+    return (dx0*dx1+dy0*dy1)/s0/s1
+
+
+def _ltc_range(n, blat):
+    """indices 1..n-2 of the LTC curve before the first point with blat[i] < 0 or blat[i+1] < 0"""
+    blat = np.asarray(blat)
+    i = np.arange(1, n-1)
+    bad = np.nonzero((blat[i] < 0) | (blat[i+1] < 0))[0]
+    if len(bad) > 0: i = i[0:bad[0]]
+    return i
+
+
+def ltc_smooth(T, beta0, beta1, blat):
+    """
+    merge two estimates of the linear thermal expansion by keeping at each temperature the one
+    giving the smoother curve, i.e. the larger abs(ltc_dot) with the already merged point on the left
+
+    The merge is a sequential scan, the choice at i depends on the choice at i-1. The choices for both
+    possible left points are evaluated at once and the scan is resolved by the last point at which the
+    choice does not depend on the left one, together with the parity of the flips since then. Repeated
+    passes do not change the result, as both estimates agree after the first one
+
+    Returns
+    -------
+    the merged LTC
+    """
+    T = np.asarray(T, dtype=float)
+    b0 = np.array(beta0, dtype=float)
+    b1 = np.asarray(beta1, dtype=float)
+    i = _ltc_range(len(T), blat)
+    if len(i)==0: return b0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        #use1[k]: take b1 when the merged point on the left is from b0 (c=0) or from b1 (c=1)
+        use1 = []
+        for c in (b0, b1):
+            t1 = ltc_dot(T, b0, i, left=c[i-1])
+            t2 = ltc_dot(T, b1, i, left=c[i-1])
+            use1.append(~(np.abs(t1) >= np.abs(t2)))
+        #at i=1 the two estimates use their own left points, so the choice does not depend on the state
+        use1[0][0] = use1[1][0] = ~(abs(ltc_dot(T, b0, 1)) >= abs(ltc_dot(T, b1, 1)))
+    const = use1[0]==use1[1]
+    flip = use1[0] & ~use1[1]
+    pos = np.where(const, np.arange(len(i)), 0)
+    last = np.maximum.accumulate(pos)
+    nflip = np.cumsum(flip)
+    choice = use1[0][last] ^ ((nflip - nflip[last]) % 2 == 1)
+    b0[i] = np.where(choice, b1[i], b0[i])
+    return b0
+
+
+def ltc_zigzag(beta, blat):
+    """count the points where the LTC curve changes direction, ignoring beta < 1.e-6, before the first blat < 0"""
+    beta = np.asarray(beta, dtype=float)
+    i = _ltc_range(len(beta), blat)
+    zz = (beta[i] >= 1.e-6) & ((beta[i]-beta[i-1])*(beta[i+1]-beta[i]) < 0.0)
+    return int(np.count_nonzero(zz))
+
+
+def spline_interp(x, Y, xnew, k=3, der=0):
+    """
+    interpolating spline of all the columns of Y along x evaluated at xnew, the same as
+    splev(xnew, splrep(x, Y[:,j]), der=der) for each column j but fitted in one call
+
+    Parameters
+    ----------
+    x : increasing abscissas
+    Y : array of (len(x), ...), the trailing axes are the columns. np.eye(len(x)) gives the spline
+        weights W at xnew, W @ y equals the interpolation of any y
+    xnew : points to evaluate
+    """
+    return make_interp_spline(x, np.asarray(Y, dtype=float), k=k, axis=0)(xnew, nu=der)
 
 
 def debye_heat_capacity(temperature, debye_T, natoms):
@@ -907,36 +1714,70 @@ def vol_closest(vol, volumes, thr=1.e-6):
     return -1
 
 
-def get_static_calculations(vasp_db, tag):
+def hessian_from_force_constants(force_constants, force_constant_factor=1.0):
+    """
+    Assemble the (3N, 3N) Hessian from the (N, N, 3, 3) phonopy force constants,
+    hessian[3*i+x, 3*j+y] = -force_constants[i,j,x,y]*force_constant_factor
+    """
+    fc = np.asarray(force_constants, dtype=float)
+    natoms = fc.shape[0]
+    hessian_matrix = -fc.transpose(0, 2, 1, 3).reshape(natoms*3, natoms*3)
+    if force_constant_factor!=1.0: hessian_matrix *= force_constant_factor
+    return hessian_matrix
+
+
+def write_superfij(out, unitcell_l, supercell_l, natom, force_constants, force_constant_factor=1.0):
+    """
+    write the superfij.out file used by Yphon
+
+    Parameters
+    ----------
+    out : file object opened for writing
+    unitcell_l : lines of the POSCAR of the unit cell
+    supercell_l : lines of the POSCAR of the supercell
+    natom : number of atoms in the unit cell
+    force_constants : (N, N, 3, 3) force constants of the supercell
+    force_constant_factor : factor to rescale the force constants
+    """
+    hessian_matrix = hessian_from_force_constants(force_constants, force_constant_factor)
+    natoms = len(hessian_matrix)//3
+    lines = unitcell_l[2:5] + supercell_l[2:5] + ['{} {}'.format(natoms, natoms//natom)] + supercell_l[7:natoms+8]
+    out.write('\n'.join(lines)+'\n')
+    #repr of a python float is what '{}'.format writes for each element
+    out.write('\n'.join([' '.join(map(repr, row)) for row in hessian_matrix.tolist()])+'\n')
+
+
+def get_static_calculations(vasp_db, tag, rec=None):
 
     # get the energies, volumes and DOS objects by searching for the tag
-    if vasp_db.collection.count_documents({'$and':[ {'metadata.tag': tag}, {'adopted': True}, \
-        {'output.structure.lattice.volume': {'$exists': True}}]}) <= 5:
-        static_calculations = vasp_db.collection.find({'$and':[ {'metadata.tag': tag}, \
-            {'output.structure.lattice.volume': {'$exists': True} }]})
+    if rec is None: rec = load_static_calculations(vasp_db, tag)
+    calcs = rec['calcs']
+    if np.sum(rec['adopted']) <= 5:
+        static_calculations = list(range(len(calcs)))
     else:
-        static_calculations = vasp_db.collection.find({'$and':[ {'metadata.tag': tag}, {'adopted': True} ]})
+        static_calculations = list(np.nonzero(rec['adopted'])[0])
+    static_calculations = sorted(static_calculations, key=lambda i: rec['order'][i])
     energies = []
     volumes = []
-    dos_objs = []  # pymatgen.electronic_structure.dos.Dos objects
-    structure = None  # single Structure for QHA calculation
+    dos_idx = []  # index of the calculations whose DOS are needed
     _energies = []
     _volumes = []
-    _dos_objs = []  # pymatgen.electronic_structure.dos.Dos objects
-    emin = 1.e36
-    for calc in static_calculations:
+    _dos_idx = []
+    for i in static_calculations:
+        calc = calcs[i]
         ee = calc['output']['energy']
-        if ee < emin : _calc = calc
-        if len(calc['metadata'])==1:
-            _vol = calc['output']['structure']['lattice']['volume']
+        _vol = float(rec['volumes'][i])
+        if not rec['constrained'][i]:
             if np.any(abs(np.array(volumes)-_vol)<_vol*1.e-5): continue
             energies.append(ee)
-            volumes.append(calc['output']['structure']['lattice']['volume'])
-            dos_objs.append(vasp_db.get_dos(calc['task_id']))
+            volumes.append(_vol)
+            dos_idx.append(i)
         else:
             _energies.append(ee)
-            _volumes.append(calc['output']['structure']['lattice']['volume'])
-            _dos_objs.append(vasp_db.get_dos(calc['task_id']))
+            _volumes.append(_vol)
+            _dos_idx.append(i)
+    # the last document in the database order is returned as the reference calculation as before
+    _calc = calcs[static_calculations[-1]] if len(static_calculations)>0 else None
 
     tvolumes = np.array(sorted(volumes))
     if len(tvolumes)>=3:
@@ -949,24 +1790,36 @@ def get_static_calculations(vasp_db, tag):
                     if np.any(abs(np.array(volumes)-_vol)<_vol*1.e-5): continue
                     volumes.append(_vol)
                     energies.append(_energies[i])
-                    dos_objs.append(_dos_objs[i])
+                    dos_idx.append(_dos_idx[i])
     elif len(tvolumes)==0 and len(_volumes)!=0:
         if len(_volumes)!=0:
             for i, _vol in enumerate(_volumes):
                 if np.any(abs(np.array(volumes)-_vol)<_vol*1.e-5): continue
                 volumes.append(_vol)
                 energies.append(_energies[i])
-                dos_objs.append(_dos_objs[i])
+                dos_idx.append(_dos_idx[i])
     # sort everything in volume order
     # note that we are doing volume last because it is the thing we are sorting by!
     energies = sort_x_by_y(energies, volumes)
-    dos_objs = sort_x_by_y(dos_objs, volumes)
+    dos_idx = sort_x_by_y(dos_idx, volumes)
+    # the compact total DOS stored with the task is decoded on first access,
+    # the others are read from GridFS by one query
+    dos_objs = [None]*len(dos_idx)
+    gridfs_idx = []
+    for j,i in enumerate(dos_idx):
+        if calcs[i].get('tdos') is not None:
+            dos_objs[j] = LazyDos(functools.partial(DosArrays.from_dict, calcs[i]['tdos']))
+        else:
+            gridfs_idx.append(j)
+    _dos_objs = get_dos_bulk(vasp_db, [rec['task_ids'][dos_idx[j]] for j in gridfs_idx],
+        [rec['dos_fs_ids'][dos_idx[j]] for j in gridfs_idx])
+    for j, dos in zip(gridfs_idx, _dos_objs):
+        dos_objs[j] = DosArrays(dos)
     volumes = sorted(volumes)
     volumes = np.array(volumes)
     energies = np.array(energies)
     return volumes, energies, dos_objs, _calc
 
-
 def finished_calc():
     tags = []
     _, dirs, _ = next(walk("."))
@@ -980,6 +1833,68 @@ def finished_calc():
     return tags
 
 
+#names and units of the columns of fvib_ele by thelecMDB.calc_thermodynamics
+FVIB_COLUMNS = [('T', 'K'), ('volume', 'Ang^3/atom'), ('F', 'eV/atom'), ('S', 'J/K/mol-atom'),
+    ('H', 'J/mol-atom'), ('a', '1/K'), ('Cp', 'J/K/mol-atom'), ('Cv', 'J/K/mol-atom'), ('Cpion', 'J/K/mol-atom'),
+    ('Bt', 'GPa'), ('T_ph-D', 'K'), ('T-D', 'K'), ('F_el_atom', 'eV/atom'), ('S_el_atom', 'J/K/mol-atom'),
+    ('C_el_atom', 'J/K/mol-atom'), ('M_el', ''), ('Seebeck_coefficients', '10**-6 V/K'),
+    ('Lorenz_number', 'W*Ohm/K^2'), ('Q_el', '1/atom'), ('Q_p', '1/atom'), ('Q_e', '1/atom'),
+    ('C_mu', 'J/K/mol-atom'), ('W_p', '1/atom'), ('W_e', '1/atom'), ('Y_p', '1/atom'), ('Y_e', '1/atom'),
+    ('k_ph', ''), ('gamma', '')]
+#columns without the static calculations, the electronic quantities are per unit cell
+FVIB_ELE_COLUMNS = [('T', 'K'), ('F_el_atom', ''), ('S_el_atom', ''), ('C_el_atom', ''), ('M_el', ''),
+    ('seebeck_coefficients', ''), ('Lorenz_number', 'W*Ohm/K^2'), ('Q_el', ''), ('Q_p', ''), ('Q_e', ''),
+    ('C_mu', ''), ('W_p', ''), ('W_e', ''), ('Y_p', ''), ('Y_e', ''), ('Vol', 'Ang^3'), ('Gibbs_energy', 'eV')]
+
+
+class FvibTable():
+    """
+    thermodynamic table written once on exit, as text (fname), columnar binary (fname+'.npz'), or both
+
+    Parameters
+    ----------
+    fname : the text file name
+    columns : list of (name, unit) of the columns
+    fmt : 'text', 'npz' or 'both'
+    attrs : provenance saved into the binary file
+    """
+    def __init__(self, fname, columns, fmt='text', **attrs):
+        self.fname = fname
+        self.columns = columns
+        self.fmt = fmt
+        self.attrs = attrs
+        self.header = []
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.save()
+        return False
+
+    def write(self, line):
+        """header lines only, the rows are added by add_row"""
+        self.header.append(line.rstrip('\n'))
+
+    def add_row(self, *values):
+        self.rows.append(values)
+
+    @property
+    def data(self):
+        return np.array(self.rows, dtype=float).reshape(-1, len(self.columns))
+
+    def save(self):
+        if self.fmt in ('text', 'both'):
+            with open(self.fname, 'w') as fp:
+                for line in self.header: fp.write(line+'\n')
+                fmt = ' '.join(['{}']*len(self.columns))+'\n'
+                for row in self.rows: fp.write(fmt.format(*row))
+        if self.fmt in ('npz', 'both'):
+            write_fvib_npz(self.fname, self.data, [c[0] for c in self.columns], [c[1] for c in self.columns],
+                header=self.header, created='{}'.format(datetime.now()), **self.attrs)
+
+
 class thelecMDB():
     """
     API to calculate the thermal electronic properties from the saved dos and volume dependence in MongDB database
@@ -1064,9 +1979,18 @@ class thelecMDB():
             if self.dope==0.0: self.dope=-1.e-5
 
         self.local=""
+        self.batch=False
+        self.jobs=1
+        self.yphon_cache=None
+        self.fvib_format='text'
+        self.static_rec=None
         if args!=None:
             self.nT = args.nT
             self.doscar=args.doscar
+            self.batch=args.batch
+            self.jobs=args.jobs
+            self.yphon_cache=args.yphon_cache
+            self.fvib_format=args.fvib_format
             self.poscar=args.contcar
             self.oszicar=args.oszicar
             self.vdos=args.vdos
@@ -1138,40 +2062,11 @@ class thelecMDB():
         with open (os.path.join(voldir,'OSZICAR'),'w') as out:
             idx = vol_within_index(i['volume'],self.volumes, thr=1.e-6)
             if idx >0: out.write('   1 F= xx E0= {}\n'.format(self.energies[idx]))
+        force_constant_matrix = decode_force_constants(i['force_constants'], vasp_db=self.vasp_db)
         with open (os.path.join(voldir,'superfij.out'),'w') as out:
-            for line in range (2,5):
-                out.write('{}\n'.format(unitcell_l[line]))
-            for line in range (2,5):
-                out.write('{}\n'.format(supercell_l[line]))
-            out.write('{} {}\n'.format(natoms, natoms//natom))
-            for line in range (7,natoms+8):
-                out.write('{}\n'.format(supercell_l[line]))
-            force_constant_matrix = np.array(i['force_constants'])
-            hessian_matrix = np.empty((natoms*3, natoms*3), dtype=float)
-            """
-            PI2 = 2*3.141592653589793
-            THz = 1e12*PI2
-            AMU = 1.66053906660e-27
-            eV = 1.602176634e-19
-            M = 1.e10
-            THz_to_eV=THz**2 *AMU/eV/M/M
-            THz_to_eV = 0.004091649655126895
-            """
-
-            for ii in range(natoms):
-               for jj in range(natoms):
-                    for x in range(3):
-                        for y in range(3):
-                            hessian_matrix[ii*3+x, jj*3+y] = -force_constant_matrix[ii,jj,x,y]
-
-            hessian_matrix *= self.force_constant_factor
-            if self.force_constant_factor!=1.0: 
-                print ("\n force constant matrix has been rescaled by :", self.force_constant_factor)
-
-            for xx in range(natoms*3):
-                for yy in range(natoms*3-1):
-                    out.write('{} '.format(hessian_matrix[xx,yy]))
-                out.write('{}\n'.format(hessian_matrix[xx,natoms*3-1]))
+            write_superfij(out, unitcell_l, supercell_l, natom, force_constant_matrix, self.force_constant_factor)
+        if self.force_constant_factor!=1.0: 
+            print ("\n force constant matrix has been rescaled by :", self.force_constant_factor)
         return voldir
 
 
@@ -1570,11 +2465,8 @@ class thelecMDB():
                 if self.debug:
                     _nqwave = "-nqwave "+ str(1.e4)
                 #md = "Yphon -tranI 2 -DebCut 0.5 " +_nqwave+ " <superfij.out"
-                cmd = "Yphon -DebCut 0.5 -thr2 0.001 " +_nqwave+ " <superfij.out"
-                if has_Born: cmd += " -Born dielecfij.out"
-                print(cmd, " at ", voldir)
-                output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                    universal_newlines=True)
+                run_yphon("-DebCut 0.5 -thr2 0.001 " +_nqwave, has_Born=has_Born,
+                    root=self.yphon_cache, cache=self.yphon_cache!="off")
 
             if len(self.Flat)==0:
                 print ("Calling yphon to get f_vib, s_vib, cv_vib at ", phdir)
@@ -1632,10 +2524,8 @@ class thelecMDB():
                 _nqwave = ""
                 if self.debug:
                     _nqwave = "-nqwave "+ str(1.e4)
-                cmd = "Yphon -tranI 2 -DebCut 0.5 -thr2 0.001 " +_nqwave+ " <superfij.out"
-                print(cmd, " at ", dir)
-                output = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                    universal_newlines=True)
+                run_yphon("-tranI 2 -DebCut 0.5 -thr2 0.001 " +_nqwave,
+                    root=self.yphon_cache, cache=self.yphon_cache!="off")
 
             with open("vdos.out", "r") as fp:
                 f_vib, U_ph, s_vib, cv_vib, C_ph_n, Sound_ph, Sound_nn, N_ph, NN_ph, debyeT, quality, natoms \
@@ -1754,8 +2644,9 @@ class thelecMDB():
 
     # get the energies, volumes and DOS objects by searching for the tag
     def find_static_calculations(self):
+        self.static_rec = load_static_calculations(self.vasp_db, self.tag)
         self.volumes, self.energies, self.dos_objs, _calc \
-            = get_static_calculations(self.vasp_db, self.tag)
+            = get_static_calculations(self.vasp_db, self.tag, rec=self.static_rec)
         structure = Structure.from_dict(_calc['output']['structure'])
         self.structure = structure
         print(structure)
@@ -1817,10 +2708,8 @@ class thelecMDB():
         if not os.path.exists(self.phasename):
             os.mkdir(self.phasename)
 
-        vasp_version = list(self.vasp_db.db['tasks'].find({'$and':[ {'metadata.tag': self.tag}, { 'calcs_reversed': { '$exists': True } }]}))
         self.static_vasp_version = None
-        for i in vasp_version:
-            v = i['calcs_reversed'][0]['vasp_version']
+        for v in self.static_rec['vasp_versions']:
             if self.static_vasp_version is None: self.static_vasp_version = v
             elif v[0:3]!=self.static_vasp_version[0:3]:
                 print("\n***********FETAL messing up calculation! please remove:", self.tag, "\n")
@@ -1957,6 +2846,8 @@ class thelecMDB():
                 self.structure = Structure.from_file(poscar)
             if os.path.exists(os.path.join(dir,'DOSCAR.gz')):
                 self.dos_objs.append(os.path.join(dir,'DOSCAR.gz'))
+            elif os.path.exists(os.path.join(dir,'dos.npz')):
+                self.dos_objs.append(os.path.join(dir,'dos.npz'))
             elif os.path.exists(os.path.join(dir,'DOSCAR')):
                 self.dos_objs.append(os.path.join(dir,'DOSCAR'))
 
@@ -2122,18 +3013,22 @@ class thelecMDB():
         #print("xxxxx=", t0,t1,td)
         #theall = np.empty([len(prp_T), int((t1-t0)/td+1.5), len(self.volumes)])
         self.theall = np.empty([14, len(self.T), len(self.volumes)])
+        if self.jobs > 1 and len(self.dos_objs) > 1:
+            jobs = []
+            for i,dos in enumerate(self.dos_objs):
+                if not isinstance(dos, (str, DosArrays)): dos = DosArrays(dos)
+                jobs.append((i, (t0, t1, td, self.xdn, self.xup, self.dope, self.ndosmx, self.gaussian, self.natfactor),
+                    dict(dos=dos, _T=self.T, vol=self.volumes[i], batch=self.batch)))
+            sys.stdout.flush()
+            self.theall = runthelec_pool(jobs, len(self.T), len(self.volumes), self.jobs)
         for i,dos in enumerate(self.dos_objs):
             #print ("processing dos object at volume: ", self.volumes[i], " with nT =", len(self.T))
-            if isinstance(dos, str):
-                if dos.endswith(".gz"):
-                    _dos = gzip.open (dos,'rt')
-                else:
-                    _dos = open (dos,'r')
-                prp_vol = runthelec(t0, t1, td, self.xdn, self.xup, self.dope, self.ndosmx,
-                    self.gaussian, self.natfactor, dos=_dos, _T=self.T, fout=sys.stdout, vol=self.volumes[i])
+            if self.jobs > 1 and len(self.dos_objs) > 1:
+                prp_vol = self.theall[:,:,i]
             else:
                 prp_vol = runthelec(t0, t1, td, self.xdn, self.xup, self.dope, self.ndosmx,
-                    self.gaussian, self.natfactor, dos=dos, _T=self.T, fout=sys.stdout, vol=self.volumes[i])
+                    self.gaussian, self.natfactor, dos=dos, _T=self.T, fout=sys.stdout, vol=self.volumes[i],
+                    batch=self.batch)
             """
             if 1==1:
                 iFunc = trapz
@@ -2156,18 +3051,10 @@ class thelecMDB():
             voldir = os.path.join(phdir, vol)
             if not os.path.exists(voldir):
                 os.mkdir(voldir)
-            doscar = os.path.join(voldir,'DOSCAR.gz')
-            if not os.path.exists(doscar):
-                with gzip.open (doscar,'wt') as out:
-                    for j in range(5):
-                        out.write('   {}\n'.format(j))
-                    eup = np.max(dos.energies)
-                    edn = np.min(dos.energies)
-                    out.write('{:>16.8}{:>16.8}{:5}{:>16.8}{:>16.8}\n'.format(eup,edn,len(dos.energies),dos.efermi,1.0))
-                    vaspEdos = np.array(dos.get_densities())
-                    ados = cumtrapz(vaspEdos, dos.energies, initial=0.0)
-                    for j,d in enumerate(dos.energies):
-                        out.write('{:>11.3f} {:>11.4e} {:>11.4e}\n'.format(d,vaspEdos[j],ados[j]))
+            #binary local cache of the total DOS, read back by find_static_calculations_without_DB
+            if not os.path.exists(os.path.join(voldir,'DOSCAR.gz')) and not isinstance(dos, str):
+                dosnpz = os.path.join(voldir,'dos.npz')
+                if not os.path.exists(dosnpz): DosArrays(dos).to_npz(dosnpz)
 
 
     def find_vibrational(self):
@@ -2176,16 +3063,16 @@ class thelecMDB():
             return
         self.from_phonon_collection = False
         if self.qhamode=="debye":
-            self.qha_items = self.vasp_db.db['qha'].find({'$and':[ {'metadata': {'tag':self.tag}}, {'S_vib': {'$exists': True}} ]})
+            self.qha_items = self.vasp_db.db['qha'].find({'$and':[ metadata_filter({'tag':self.tag}), {'S_vib': {'$exists': True}} ]})
         elif self.qhamode=="phonon":
-            self.qha_items = self.vasp_db.db['qha_phonon'].find({'$and':[ {'metadata': {'tag':self.tag}}, {'S_vib': {'$exists': True}} ]})
+            self.qha_items = self.vasp_db.db['qha_phonon'].find({'$and':[ metadata_filter({'tag':self.tag}), {'S_vib': {'$exists': True}} ]})
         else:
             try:
                 self.qhamode='phonon'
-                self.qha_items = self.vasp_db.db['qha_phonon'].find({'$and':[ {'metadata': {'tag':self.tag}}, {'S_vib': {'$exists': True}} ]})
+                self.qha_items = self.vasp_db.db['qha_phonon'].find({'$and':[ metadata_filter({'tag':self.tag}), {'S_vib': {'$exists': True}} ]})
             except:
                 self.qhamode='debye'
-                self.qha_items = self.vasp_db.db['qha'].find({'$and':[ {'metadata': {'tag':self.tag}}, {'S_vib': {'$exists': True}} ]})
+                self.qha_items = self.vasp_db.db['qha'].find({'$and':[ metadata_filter({'tag':self.tag}), {'S_vib': {'$exists': True}} ]})
         # check compatibility with vasp6
         if self.qhamode=='phonon':
             for i in (self.vasp_db).db['phonon'].find({'$and':[ {'metadata.tag': self.tag}, {'S_vib': {'$exists': True}} ]}):
@@ -2296,15 +3183,18 @@ class thelecMDB():
         self.energies = BMfitF(self.volumes, self.volumes, self.energies_orig, self.BMfunc)
 
         self.blat = []
+        FFs = []
         for i in range(len(self.T)):
             FF = self.Flat[:,i] + self.theall[0,i,:]
             #p2 = np.poly1d(np.polyfit(self.volumes, FF, 2))
             #FF = p2(self.volumes)
             p1 = np.poly1d(np.polyfit(self.volumes, FF, 1))
-            FF = p1(self.volumes)
-            blat, self.volT[i], newF = CenDifB(self.volumes, self.energies+FF, N=7,kind='cubic')
-            self.blat.append(blat)
-            if newF!=None: self.GibT[i] = newF
+            FFs.append(self.energies + p1(self.volumes))
+        blats, volT, GibT, _ = SplineDifB(self.volumes, np.array(FFs).T, N=7, kind='cubic')
+        for i in range(len(self.T)):
+            self.blat.append(blats[i])
+            self.volT[i] = volT[i]
+            self.GibT[i] = GibT[i]
             if self.volT[i] < 0: break
 
         nT = len(self.blat)
@@ -2334,34 +3224,98 @@ class thelecMDB():
 
             if self.eqmode==4 or self.eqmode==5:
                 #print ("iiii", self.T[i], self.volT[i], E0+Flat+Fel)
-                blat, self.volT[i], self.GibT[i], P = BMDifB(self.volumes, E0+FF, self.BMfunc, N=7, _T=self.T[i])
+                eos = BMEOS(self.volumes, np.array([E0+FF, Slat+Sel]).T, self.BMfunc)
+                blat, self.volT[i], self.GibT[i], P = eos.column(0).minimum(N=7)
                 if blat < 0: return -1.0, 0.0
-                if self.T[i]!=0.0: beta = (BMfitP(self.volT[i], self.volumes, E0+FF+self.T[i]*(Slat+Sel),
-                    self.BMfunc) + P)/self.T[i]/blat
+                dFdV, dSdV = eos.dFdV(self.volT[i])
+                if self.T[i]!=0.0: beta = (dFdV + self.T[i]*dSdV + P)/self.T[i]/blat
                 else: beta = 0.0
             else:
-                blat, self.volT[i], newF = CenDifB(self.volumes, E0+FF, N=7,kind=kind)
+                blat, self.volT[i], self.GibT[i], dSdV = SplineDifB(self.volumes, E0+FF, Slat+Sel, N=7, kind=kind)
                 if blat < 0: return -1.0, 0.0
-                if newF!=None: self.GibT[i] = newF
-                if self.T[i]!=0.0:
-                    try:
-                        beta = CenDif(self.volT[i], self.volumes, Slat+Sel, N=7,kind=kind)/blat
-                    except:
-                        return -1.0, 0.0
+                if self.T[i]!=0.0: beta = dSdV/blat
                 else: beta = 0.0
             return blat, beta
         #except:
         #return -1.0, 0.0
 
 
+    def FS_columns(self):
+        """
+        return the free energies E0+Flat+Fel and the entropies Slat+Sel, (smoothed as in calc_TE_V_general),
+        as arrays of (nV, nT)
+        """
+        Fs = []
+        Ss = []
+        for i in range(len(self.T)):
+            if self.smooth:
+                E0, Flat, Fel, Slat, Sel = BMsmooth(self.volumes, self.energies, self.Flat[:,i],
+                    self.theall[0,i,:], self.Slat[:,i], self.theall[1,i,:], self.BMfunc, self.elmode)
+            else:
+                E0, Flat, Fel, Slat, Sel = self.energies, self.Flat[:,i], \
+                    self.theall[0,i,:], self.Slat[:,i], self.theall[1,i,:]
+            Fs.append(E0+Flat+Fel)
+            Ss.append(Slat+Sel)
+        return np.array(Fs).T, np.array(Ss).T
+
+
+    def calc_TE_V_BM(self):
+        """
+        calc_TE_V_general with eqmode 4 or 5 for all the temperatures in one batch. F and S of all
+        the temperatures are fitted by one least-squares solve, see BMEOS
+
+        Returns
+        -------
+        blat, beta, nT : as calc_TE_V_splines
+        """
+        Fs, Ss = self.FS_columns()
+        nT = len(self.T)
+        eos = BMEOS(self.volumes, np.hstack([Fs, Ss]), self.BMfunc)
+        eosF = BMEOS(self.volumes, coef=eos.coef[:,:nT])
+        eosS = BMEOS(self.volumes, coef=eos.coef[:,nT:])
+        blats, volT, GibT, P = eosF.minimum(N=7)
+        v = np.where(blats < 0, max(self.volumes), volT)
+        dFdV = eosF.dFdV(v)
+        dSdV = eosS.dFdV(v)
+        blat = np.zeros((nT), dtype=float)
+        beta = np.zeros((nT), dtype=float)
+        for i in range(nT):
+            self.volT[i] = volT[i]
+            self.GibT[i] = GibT[i]
+            if blats[i] < 0:
+                blat[i] = -1.0
+                return blat, beta, i
+            blat[i] = blats[i]
+            if self.T[i]!=0.0: beta[i] = (dFdV[i] + self.T[i]*dSdV[i] + P[i])/self.T[i]/blats[i]
+        return blat, beta, nT
+
+
+    def calc_TE_V_splines(self, kind='cubic'):
+        """
+        calc_TE_V_general (except eqmode 4 and 5) for all the temperatures in one batch by SplineDifB
+
+        Returns
+        -------
+        blat, beta : as calc_TE_V_general, the temperatures after the first failure are left as 0
+        nT : index of the first temperature with blat < 0, len(self.T) if there is no failure
+        """
+        Fs, Ss = self.FS_columns()
+        blats, volT, GibT, dSdV = SplineDifB(self.volumes, Fs, Ss, N=7, kind=kind)
+        blat = np.zeros((len(self.T)), dtype=float)
+        beta = np.zeros((len(self.T)), dtype=float)
+        for i in range(len(self.T)):
+            self.volT[i] = volT[i]
+            self.GibT[i] = GibT[i]
+            if blats[i] < 0:
+                blat[i] = -1.0
+                return blat, beta, i
+            blat[i] = blats[i]
+            if self.T[i]!=0.0: beta[i] = dSdV[i]/blats[i]
+        return blat, beta, len(self.T)
+
+
     def dot(self,i,b):
-        dx0 = self.T[i] - self.T[i-1]
-        dx1 = self.T[i+1] - self.T[i]
-        dy0 = b[i] - b[i-1]
-        dy1 = b[i+1] - b[i]
-        s0 = math.sqrt(dx0*dx0+dy0*dy0)
-        s1 = math.sqrt(dx1*dx1+dy1*dy1)
-        return (dx0*dx1+dy0*dy1)/s0/s1
+        return ltc_dot(self.T, b, i)
 
     def calc_thermodynamics(self):
         Faraday_constant = physical_constants["Faraday constant"][0]
@@ -2371,7 +3325,8 @@ class thelecMDB():
         toGPa = electron_volt/angstrom*1.e-9
 
         thermofile = self.phasename+'/'+self.outf
-        with open(thermofile, 'w') as fvib:
+        with FvibTable(thermofile, FVIB_COLUMNS if self.hasSCF else FVIB_ELE_COLUMNS, fmt=self.fvib_format,
+            tag=self.tag, qhamode=self.qhamode, eqmode=self.eqmode, elmode=self.elmode, natoms=self.natoms) as fvib:
             fvib.write('#Found quasiharmonic mode : {}\n'.format(self.qhamode))
             if self.hasSCF:
                 fvib.write('#T(K), volume, F(eV), S(J/K), H(J/K), a(-6/K), Cp(J/mol), Cv, Cpion, Bt(GPa), T_ph-D(K), T-D(K), F_el_atom, S_el_atom, C_el_atom, M_el, Seebeck_coefficients(10**-6 V/K), Lorenz_number(WOK^{-2}), Q_el, Q_p, Q_e, C_mu, W_p, W_e, Y_p, Y_e\n')
@@ -2385,18 +3340,14 @@ class thelecMDB():
                     nT = len(self.beta)
                     #_beta = copy.deepcopy(self.beta)
                 else:
-                    self.blat = np.zeros((len(self.T)), dtype=float)
-                    self.beta = np.zeros((len(self.T)), dtype=float)
-                    nT = len(self.T)
-                    for i in range(len(self.T)):
-                        if self.elmode>=1:
-                            self.blat[i], self.beta[i] = self.calc_TE_V_general(i, kind='UnivariateSpline')
-                        else:
-                            self.blat[i], self.beta[i] = self.calc_TE_V_general(i, kind='cubic')
-                        if self.blat[i] < 0:
-                            nT = i
-                            print ("\nat point1 blat<0! Perhaps it has reached the upvolume limit at T =", self.T[i], "\n")
-                            break
+                    if self.eqmode==4 or self.eqmode==5:
+                        self.blat, self.beta, nT = self.calc_TE_V_BM()
+                    elif self.elmode>=1:
+                        self.blat, self.beta, nT = self.calc_TE_V_splines(kind='UnivariateSpline')
+                    else:
+                        self.blat, self.beta, nT = self.calc_TE_V_splines(kind='cubic')
+                    if nT < len(self.T):
+                        print ("\nat point1 blat<0! Perhaps it has reached the upvolume limit at T =", self.T[nT], "\n")
                 """
                     _beta = copy.deepcopy(self.beta)
 
@@ -2413,27 +3364,10 @@ class thelecMDB():
                 _beused = copy.deepcopy(_beta)
                 _b2 = copy.deepcopy(self.beta)
                 _bsplev = copy.deepcopy(self.beta)
-                for ii in range (32):
-                    for i in range(1, len(self.T)-1):
-                        if self.blat[i] < 0 or self.blat[i+1] < 0: break
-                        t1 = self.dot(i, _beused)
-                        t2 = self.dot(i, _b2)
-                        #t1 = (_beused[i]-_beused[i-1])*(_beused[i+1]-_beused[i])
-                        #t2 = (_b2[i]-_b2[i-1])*(_b2[i+1]-_b2[i])
-                        if abs(t1) >=abs(t2):
-                            tused = _beused[i]
-                        else:
-                            tused = _b2[i]
-                        _beused[i]=tused
-                        _b2[i]=tused
-                self.beta = _beused
-
-                LTCzigzag = 0
-                for i in range(1, len(self.T)-1):
-                    if self.blat[i] < 0 or self.blat[i+1] < 0: break
-                    if self.beta[i] < 1.e-6: continue #check irregularity of along LTC curve
-                    if (self.beta[i]-self.beta[i-1])*(self.beta[i+1]-self.beta[i]) < 0.0: LTCzigzag += 1
-                self.key_comments['LTC quality'] = LTCzigzag
+                self.beta = ltc_smooth(self.T, _beused, _b2, self.blat)
+
+                #check irregularity of along LTC curve
+                self.key_comments['LTC quality'] = ltc_zigzag(self.beta, self.blat)
                 """
 
 
@@ -2500,129 +3434,99 @@ class thelecMDB():
 
                     self.Cp.append(cplat+prp_T[2])
                     self.Cv.append(clat+prp_T[2])
-                    fvib.write('{} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {}\n'.
-                    format(self.T[i], self.volT[i]/self.natoms, self.GibT[i]/self.natoms, (slat+prp_T[1])*toJmol,
+                    fvib.add_row(self.T[i], self.volT[i]/self.natoms, self.GibT[i]/self.natoms, (slat+prp_T[1])*toJmol,
                     (self.GibT[i]+self.T[i]*(slat+prp_T[1]))*toJmol,
                     beta/3., (cplat+prp_T[2])*toJmol, (clat+prp_T[2])*toJmol,
                     cplat*toJmol, blat*toGPa, debyeT, dlat,
                     prp_T[0]/self.natoms, prp_T[1]*toJmol, prp_T[2]*toJmol,
                     prp_T[3], prp_T[4], L, prp_T[5]/self.natoms, prp_T[6]/self.natoms,
                     prp_T[7]/self.natoms, prp_T[8]*toJmol, prp_T[10]/self.natoms,
-                    prp_T[11]/self.natoms, prp_T[12]/self.natoms, prp_T[13]/self.natoms, k_ph, gamma))
+                    prp_T[11]/self.natoms, prp_T[12]/self.natoms, prp_T[13]/self.natoms, k_ph, gamma)
                     #prp_T[7]/self.natoms, prp_T[8]*toJmol, _bsplev[i]/3.0, prp_T[10]/self.natoms,
                 else:
                     #(T[i], F_el_atom[i], S_el_atom[i], C_el_atom[i], M_el[i], seebeck_coefficients[i], L,
                     #Q_el[i], Q_p[i], Q_e[i], C_mu[i], W_p[i], W_e[i], Y_p[i], Y_e[i])
-                    fvib.write('{} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} {}\n'.
-                    format(self.T[i], prp_T[0], prp_T[1], prp_T[2], prp_T[3], prp_T[4], L,
+                    fvib.add_row(self.T[i], prp_T[0], prp_T[1], prp_T[2], prp_T[3], prp_T[4], L,
                     prp_T[5], prp_T[6], prp_T[7], prp_T[8], prp_T[10], prp_T[11], prp_T[12], prp_T[13],
-                    self.volT[i], self.GibT[i]))
-        self.datasm(thermofile)
+                    self.volT[i], self.GibT[i])
+        #the csv copies are text tables, written with the text output only
+        if self.fvib_format!='npz': self.datasm(thermofile, data=fvib.data, header=fvib.header)
         return np.array(self.volumes)/self.natoms, np.array(self.energies_orig)/self.natoms, thermofile
 
-    def datasm(self, fname):
-        data = np.loadtxt(fname, comments="#", dtype=float)
-        data_orig = copy.deepcopy(data)
-        nT = data.shape[0]
-        nF = data.shape[1]
-        nSmooth = 11
-        box = np.ones(nSmooth)/nSmooth
-        if nT <nSmooth : return
-        from scipy.signal import savgol_filter
-        for i in range(1,nF):
-            #data[:,i]=np.convolve(data[:,i], box, mode='same')
-            data[:,i]=savgol_filter(data[:,i], nSmooth, 3)
-
-        with open(fname+'_sm.csv', 'w') as fout:
-            with open(fname, 'r') as fin:
-                lines = fin.readlines()
-                for line in lines:
-                    if line.startswith('#'): print(line.strip(),file=fout)
-
-            for i in range(0,nT):
-                for j in range(0,nF):
-                    if j==nF-1: fout.write('{}\n'.format(data[i,j]))
-                    else: fout.write('{}, '.format(data[i,j])) 
-    
-            
-        with open(fname+'.csv', 'w') as fout:
-            with open(fname, 'r') as fin:
-                lines = fin.readlines()
-                for line in lines:
-                    if line.startswith('#'): print(line.strip(),file=fout)
-
-            for i in range(0,nT):
-                for j in range(0,nF):
-                    if j==nF-1: fout.write('{}\n'.format(data_orig[i,j]))
-                    else: fout.write('{}, '.format(data_orig[i,j])) 
+    def datasm(self, fname, data=None, header=None):
+        """
+        write fname+'_sm.csv' smoothed by the Savitzky-Golay filter and fname+'.csv', see write_fvib_csv
+        """
+        write_fvib_csv(fname, data=data, header=header)
 
     def add_comput_inf(self):
         if self.vasp_db!=None:
             self.key_comments['METADATA'] = {'tag':self.tag}
             self.key_comments['E-V'], self.key_comments['POSCAR'], self.key_comments['INCAR'] = \
-                get_rec_from_metatag(self.vasp_db, self.tag)
+                get_rec_from_metatag(self.vasp_db, self.tag, rec=self.static_rec)
             with open (self.phasename+'/POSCAR', 'w') as fp:
                 fp.write(self.key_comments['POSCAR'])
-        nT = min(len(self.volT),len(self.blat))
-        for i in range(nT):
-            if self.blat[i] < 0:
-                nT = i
-                break
+        nT = self.quality_nT()
         if nT < 3:
             self.key_comments['ERROR'] = "Fatal ERROR! Calculation corrupted due to certain reason! Perhaps very bad E-V curve!"
             return False
 
-        vn = min(self.volT[0:nT])
-        vx = max(self.volT[0:nT])
-        for ix,vol in enumerate(self.volumes):
-           if vol>vn: break
         try:
-            n = 0
-            q = 0.0
-            for i in range(ix-1, len(self.volumes)):
-                n = n+1
-                q += self.quality[i]
-                if self.volumes[i] > vx: break
-            q /= n
+            idx = self.quality_volumes(nT)
+            q = sum([self.quality[i] for i in idx])/len(idx)
             self.key_comments['phonon quality'] = '{:8.6}'.format(q)
         except:
             self.key_comments['phonon quality'] = '{:8.6}'.format(-1.0)
         return True
 
 
-    def find_fitting_quality(self, xx, orig_points, fitted, readme):
-        nT = len(self.volT)
-        for i in range(nT):
-            if self.blat[i] < 0:
-                nT = i
-                break
+    def quality_nT(self):
+        """number of temperatures before the first one with blat < 0"""
+        nT = min(len(self.volT),len(self.blat))
+        bad = np.nonzero(np.asarray(self.blat[0:nT]) < 0)[0]
+        if len(bad) > 0: nT = int(bad[0])
+        return nT
+
+
+    def quality_volumes(self, nT):
+        """
+        indices of the calculated volumes covering the equilibrium volumes of the first nT temperatures,
+        from the one below the smallest volT to the first one above the largest volT
+        """
         vn = min(self.volT[0:nT])
         vx = max(self.volT[0:nT])
-        for ix,vol in enumerate(self.volumes):
-           if vol>vn: break
+        volumes = np.asarray(self.volumes)
+        above = np.nonzero(volumes > vn)[0]
+        ix = above[0] if len(above) > 0 else len(volumes)-1
+        idx = np.arange(ix-1, len(volumes))
+        stop = np.nonzero(volumes[idx] > vx)[0]
+        if len(stop) > 0: idx = idx[0:stop[0]+1]
+        return idx
+
+
+    def find_fitting_quality(self, xx, orig_points, fitted, readme):
+        idx = self.quality_volumes(self.quality_nT())
         #try:
         if True:
-            n = 0
-            q = 0.0
-            qmax = 0.0
-            qT = 0.0
-            qmaxT = 0.0
-            for i in range(ix-1, len(self.volumes)):
-                n = n+1
-                for k,t in enumerate(self.T):
-                    for j in range(len(xx)-1):
-                        if (xx[j]-self.volumes[i])*(xx[j+1]-self.volumes[i])<0:
-                            fn0 = fitted[0][j]+(self.volumes[i]-xx[j])/(xx[j+1]-xx[j])*(fitted[0][j+1]-fitted[0][j])
-                            fn = fitted[k][j]+(self.volumes[i]-xx[j])/(xx[j+1]-xx[j])*(fitted[k][j+1]-fitted[k][j])
-                            q += abs(fn-orig_points[k][i])
-                            qmax = max(qmax,abs(fn-orig_points[k][i]))
-                            if k!=0:
-                                #tmp = abs((fn-orig_points[k][i]-fn0+orig_points[0][i])/(fn-fn0))
-                                tmp = abs((fn-orig_points[k][i]-fn0+orig_points[0][i])/(t))
-                                qT += tmp
-                                qmaxT = max(qmaxT,tmp)
-                            break
-                if self.volumes[i] > vx: break
+            n = len(idx)
+            xx = np.asarray(xx, dtype=float)
+            fitted = np.asarray(fitted, dtype=float)
+            orig = np.asarray(orig_points, dtype=float)[:,idx]
+            v = np.asarray(self.volumes, dtype=float)[idx]
+            #the interval of xx strictly containing each volume, volumes on the xx points are skipped
+            j = np.searchsorted(xx, v, side='right')-1
+            ok = (j >= 0) & (j < len(xx)-1)
+            j = np.where(ok, j, 0)
+            ok &= (xx[j]-v)*(xx[j+1]-v) < 0
+            j, v, orig = j[ok], v[ok], orig[:,ok]
+            fn = fitted[:,j]+(v-xx[j])/(xx[j+1]-xx[j])*(fitted[:,j+1]-fitted[:,j])
+            err = np.abs(fn-orig)
+            q = err.sum()
+            qmax = err.max(initial=0.0)
+            #tmp = abs((fn-orig_points[k][i]-fn0+orig_points[0][i])/(fn-fn0))
+            errT = np.abs((fn[1:]-orig[1:]-fn[0]+orig[0])/np.asarray(self.T, dtype=float)[1:,None])
+            qT = errT.sum()
+            qmaxT = errT.max(initial=0.0)
             q /= n*len(self.T)*self.natoms
             qmax /= self.natoms
             qT /= n*(len(self.T)-1)*self.natoms
@@ -2648,16 +3552,8 @@ class thelecMDB():
         T = self.T[self.T <=self.TupLimit]
         nT = len(T)
         R = np.array(R)
-        R_T = np.zeros((nT, 3, 3), dtype=float)
-        for i in range(3):
-            for j in range(3):
-                f2 = splrep(R_volumes, R[:,i,j])
-                R_T[:,i,j] = splev(self.volT[0:nT], f2)
-        R_T_dT = np.zeros((nT, 3, 3), dtype=float)
-        for i in range(3):
-            for j in range(3):
-                f2 = splrep(self.T[0:nT], R_T[:,i,j])
-                R_T_dT[:,i,j] = splev(self.T[0:nT], f2, der=1)
+        R_T = spline_interp(R_volumes, R, self.volT[0:nT])
+        R_T_dT = spline_interp(self.T[0:nT], R_T, self.T[0:nT], der=1)
         inv_R_T = np.linalg.inv(R_T)
         #eij_T = np.matmul(inv_R_T,R_T_dT)
         eij_T = np.matmul(R_T_dT, inv_R_T)
@@ -2704,21 +3600,15 @@ class thelecMDB():
               header[7] = "kappae[W/(m*K)]"
           print(headerfmt.format(*header).strip(), file=fp)
           rowfmt = "{:>14.8g} {:>9g}" + " ".join(18 * ["{:>25g}"])
-          for i in range(nT):
-            if T[i] <min(self.T): continue
-            if T[i] >max(self.T): continue
-            f2 = splrep(self.T, self.volT)
-            vol = splev(T[i], f2)
-            uniform_V = []
-            for ii,u in enumerate(volumes):
-                uniform_V.append(uniform[ii][i,:])
-            uniform_V = np.array(uniform_V, dtype=float)
-            values = []
-            for j in range(nF):
-              f2 = splrep(volumes, uniform_V[:,j])
-              val = splev(vol, f2)
-              values.append(val)
-            print(rowfmt.format(*values), file=fp)
+          rows = np.nonzero((T >= min(self.T)) & (T <= max(self.T)))[0]
+          if len(rows) == 0: return
+          vol = spline_interp(self.T, self.volT, T[rows])
+          #the spline weights of the volumes at each vol, applied to all the columns at once
+          W = spline_interp(volumes, np.eye(nV), vol)
+          uniform_V = np.array([uniform[ii][rows,:] for ii in range(nV)], dtype=float)
+          values = np.einsum('iv,vif->if', W, uniform_V)
+          for val in values:
+            print(rowfmt.format(*val), file=fp)
             #fp.write ("\n")
 
 
@@ -2736,22 +3626,14 @@ class thelecMDB():
         electron_volt = physical_constants["electron volt"][0]
         angstrom = 1e-30
         toGPa = electron_volt/angstrom*1.e-9
-        for i in range(6):
-            for j in range(6):
-                if len(self.VCij)==1:
-                    self.Cij_T[:,i,j] = self.Cij[0,i,j]
-                elif len(self.VCij)==2:
-                    f2 = interp1d(self.VCij, self.Cij[:,i,j], kind='slinear')
-                    self.Cij_T[:,i,j] = f2(self.volT[0:nT])
-                elif len(self.VCij)==3:
-                    f2 = interp1d(self.VCij, self.Cij[:,i,j], kind='quadratic')
-                    self.Cij_T[:,i,j] = f2(self.volT[0:nT])
-                elif len(self.VCij)==4:
-                    f2 = interp1d(self.VCij, self.Cij[:,i,j], kind='cubic')
-                    self.Cij_T[:,i,j] = f2(self.volT[0:nT])
-                else:
-                    f2 = splrep(self.VCij, self.Cij[:,i,j])
-                    self.Cij_T[:,i,j] = splev(self.volT[0:nT], f2)
+        if len(self.VCij)==1:
+            self.Cij_T[:,:,:] = self.Cij[0,:,:]
+        elif len(self.VCij)<=4:
+            kind = {2:'slinear', 3:'quadratic', 4:'cubic'}[len(self.VCij)]
+            f2 = interp1d(self.VCij, self.Cij, kind=kind, axis=0)
+            self.Cij_T[:,:,:] = f2(self.volT[0:nT])
+        else:
+            self.Cij_T[:,:,:] = spline_interp(self.VCij, self.Cij, self.volT[0:nT])
         """
         if True:
                     print ("db_file",self.VCij)
@@ -2880,12 +3762,10 @@ class thelecMDB():
                     print (ec)
                     sys.exit()
                 """
-                for j in range(6):
-                    for k in range(6):
-                        if self.Cv[i] > 1.e-8:
-                            self.Cij_S[i, j, k] = self.Cij_T[i, j, k] + T[i]*self.volT[i]/self.Cv[i]*ec[j]*ec[k]*toGPa
-                        else:
-                            self.Cij_S[i, j, k] = self.Cij_T[i, j, k]
+                if self.Cv[i] > 1.e-8:
+                    self.Cij_S[i, :, :] = self.Cij_T[i] + T[i]*self.volT[i]/self.Cv[i]*np.outer(ec, ec)*toGPa
+                else:
+                    self.Cij_S[i, :, :] = self.Cij_T[i]
 
                 E,G,B,Poisson_Ratio = self.Cij_to_Moduli(self.Cij_S[i, :, :])
                 self.Young_Modulus_Cij_S.append(E)
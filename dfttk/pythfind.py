@@ -23,7 +23,7 @@ import numpy as np
 from fireworks.fw_config import config_to_dict
 from monty.serialization import loadfn
 from atomate.vasp.database import VaspCalcDb
-from dfttk.analysis.ywutils import formula2composition, reduced_formula, get_used_pot, get_Magnetic_State
+from dfttk.analysis.ywutils import formula2composition, reduced_formula, get_used_pot, get_Magnetic_State, fvib_file
 
 def findjobdir(jobpath, metatag):
     try:
@@ -168,7 +168,7 @@ class thfindMDB ():
         for _dir in jobpath:
             dir = self.jobpath+_dir
             thermofile = dir+"/fvib_ele"
-            if not os.path.exists(thermofile): continue
+            if fvib_file(thermofile) is None: continue
             volumes = None
             energies = None
             ss = [s for s in dir.split('/') if s!=""]
@@ -139,3 +139,32 @@ class InsertXMLToDb(FiretaskBase):
                        'structure': structure.as_dict(),
                        'formula_pretty': structure.composition.reduced_formula}
             self.vasp_db.db['xmlgz'].insert_one(xml_data) 
+
+
+@explicit_serialize
+class TotalDosToDb(FiretaskBase):
+    '''
+    Store the total DOS of the static calculation as compact arrays (the 'tdos' field, see
+    dfttk.pythelec.DosArrays) into the task document inserted by VaspToDb in the same folder,
+    so that the postprocessing does not need to deserialize the full CompleteDos. The CompleteDos
+    stored in GridFS by VaspToDb is kept for vasp_db.get_dos
+    '''
+    required_params = ["db_file", "tag"]
+    optional_params = ['xml', 'dtype']
+
+    def run_task(self, fw_spec):
+        from atomate.utils.utils import get_uri
+        from dfttk.pythelec import DosArrays
+        from dfttk.utils import read_vasprun_tdos
+        xml = self.get("xml", "vasprun.xml")
+        if not os.path.exists(xml):
+            if not os.path.exists(xml+".gz"): return
+            xml += ".gz"
+        #only the total DOS is read, VaspToDb has already parsed the rest of vasprun.xml
+        efermi, energies, densities = read_vasprun_tdos(xml)
+        tdos = DosArrays(efermi=efermi, energies=energies, densities=densities).as_dict(dtype=self.get("dtype", "float64"),
+            compression="gzip")
+        self.db_file = env_chk(self.get("db_file"), fw_spec)
+        vasp_db = VaspCalcDb.from_db_file(self.db_file, admin=True)
+        vasp_db.collection.update_one({'$and':[ {'metadata.tag': self.get('tag')}, {'dir_name': get_uri(os.getcwd())} ]},
+            {'$set': {'tdos': tdos}})
@@ -28,7 +28,7 @@ from atomate.vasp.database import VaspCalcDb
 from dfttk.analysis.phonon import get_f_vib_phonopy, get_phonon_band_dos, phonon_stable
 from dfttk.analysis.relaxing import get_non_isotropic_strain, get_bond_distance_change
 from dfttk.analysis.quasiharmonic import Quasiharmonic
-from dfttk.utils import sort_x_by_y, update_pos_by_symbols, update_pot_by_symbols, check_symmetry
+from dfttk.utils import sort_x_by_y, update_pos_by_symbols, update_pot_by_symbols, check_symmetry, metadata_filter
 from dfttk.custodian_jobs import ATATWalltimeHandler, ATATInfDetJob
 from atomate import __version__ as atomate_ver
 from dfttk import __version__ as dfttk_ver
@@ -74,6 +74,8 @@ class QHAAnalysis_renew(FiretaskBase):
     bp2gru : float
         Debye model fitting parameter for dBdP in the Gruneisen parameter. 2/3 is the high temperature
         value and 1 is the low temperature value. Defaults to 1.
+    batch : bool
+        If True, minimize the Gibbs energy of all temperatures together, see Quasiharmonic. Defaults to False.
 
     Notes
     -----
@@ -82,7 +84,7 @@ class QHAAnalysis_renew(FiretaskBase):
 
     required_params = ["phonon", "db_file", "t_min", "t_max", "t_step", "tag"]
 
-    optional_params = ["poisson", "bp2gru", "metadata", "test_failure", "admin"]
+    optional_params = ["poisson", "bp2gru", "metadata", "test_failure", "admin", "batch"]
 
     def get_vol_ene(self):
         tag = self["tag"]
@@ -114,11 +116,12 @@ class QHAAnalysis_renew(FiretaskBase):
             poisson = poisson_Cij or 0.363615
         print("Used Poisson ratio:", poisson)
         bp2gru = self.get('bp2gru', 2./3.)
+        batch = self.get('batch', False)
 
         # phonon properties
         # check if phonon calculations existed
         #always perform phonon calculations when when enough phonon calculations found
-        num_phonons = len(list(vasp_db.db['phonon'].find({'$and':[ {'metadata': {'tag':tag}}, {'adopted': True} ]})))       
+        num_phonons = len(list(vasp_db.db['phonon'].find({'$and':[ metadata_filter({'tag':tag}), {'adopted': True} ]})))       
         #num_phonons = len(list(vasp_db.db['phonon'].find({'$and':[ {'metadata.tag': tag}, {'adopted': True} ]})))       
         qha_result['has_phonon'] = num_phonons >= 5
         #if self['phonon']:
@@ -164,7 +167,7 @@ class QHAAnalysis_renew(FiretaskBase):
                
             qha = Quasiharmonic(energies, volumes, structure, dos_objects=dos_objs, F_vib=f_vib,
                                 t_min=self['t_min'], t_max=self['t_max'], t_step=self['t_step'],
-                                poisson=poisson, bp2gru=bp2gru)
+                                poisson=poisson, bp2gru=bp2gru, batch=batch)
             qha_result['phonon'] = qha.get_summary_dict()
             qha_result['phonon']['entropies'] = vol_s_vib
             qha_result['phonon']['heat_capacities'] = vol_c_vib
@@ -173,7 +176,7 @@ class QHAAnalysis_renew(FiretaskBase):
         # calculate the Debye model results no matter what
         qha_debye = Quasiharmonic(energies, volumes, structure, dos_objects=dos_objs, F_vib=None,
                                   t_min=self['t_min'], t_max=self['t_max'], t_step=self['t_step'],
-                                  poisson=poisson, bp2gru=bp2gru)
+                                  poisson=poisson, bp2gru=bp2gru, batch=batch)
 
         # fit 0 K EOS for good measure
         eos = Vinet(volumes, energies)
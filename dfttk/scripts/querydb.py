@@ -194,3 +194,131 @@ def remove_data_by_metadata(tag, db_file=None, rem_mode='vol', forcedelete=False
                     if input('Are you really sure to remove all the {} collections. (Yes/N)'.format(collections))[0].upper() == 'Yes':
                         vasp_db.db[collectioni].remove()
                         print('The data in {} collection is removed'.format(collectioni))
+
+
+# compound indexes for the access paths of dfttk, all led by metadata.tag
+DFTTK_INDEXES = {
+    'tasks': [[('metadata.tag', 1), ('adopted', 1)],
+              [('metadata.tag', 1), ('output.structure.lattice.volume', 1)],
+              [('adopted', 1), ('metadata.tag', 1)]],
+    'phonon': [[('metadata.tag', 1), ('adopted', 1)],
+               [('metadata.tag', 1), ('volume', 1)],
+               [('adopted', 1), ('metadata.tag', 1)]],
+    'qha': [[('metadata.tag', 1), ('has_phonon', 1)], [('has_phonon', 1), ('metadata.tag', 1)]],
+    'qha_phonon': [[('metadata.tag', 1), ('has_phonon', 1)], [('has_phonon', 1), ('metadata.tag', 1)]],
+    'borncharge': [[('metadata.tag', 1), ('volume', 1)]],
+    'elasticity': [[('metadata.tag', 1), ('volume', 1)]],
+    'relaxations': [[('metadata.tag', 1)]],
+    'xmlgz': [[('metadata.tag', 1), ('volume', 1)]],
+}
+
+# representative queries of dfttk for the explain report, 'TAG' is replaced by the tag
+DFTTK_QUERIES = [
+    ('tasks', {'$and': [{'metadata.tag': 'TAG'}, {'adopted': True}]}),
+    ('tasks', {'metadata.tag': 'TAG', 'metadata': {'tag': 'TAG'}}),
+    ('tasks', {'$and': [{'metadata': {'$exists': True}}, {'adopted': True}]}),
+    ('phonon', {'$and': [{'metadata.tag': 'TAG'}, {'adopted': True}, {'S_vib': {'$exists': True}}]}),
+    ('phonon', {'metadata.tag': 'TAG'}),
+    ('qha', {'$and': [{'metadata.tag': 'TAG'}, {'S_vib': {'$exists': True}}]}),
+    ('qha_phonon', {'$and': [{'metadata': {'$exists': True}}, {'has_phonon': True}]}),
+    ('borncharge', {'metadata.tag': 'TAG'}),
+    ('elasticity', {'metadata.tag': 'TAG'}),
+    ('relaxations', {'metadata.tag': 'TAG'}),
+]
+
+_checked_indexes = set()
+
+
+def _index_name(keys):
+    return '_'.join(['{}_{}'.format(k, d) for k, d in keys])
+
+
+def missing_indexes(vasp_db):
+    '''
+    Find the dfttk indexes that do not exist in the database
+
+    Parameters
+    ----------
+        vasp_db: VaspCalcDb
+            The database connection
+    Returns
+    -------
+        missing: list of (collection, keys)
+    '''
+    missing = []
+    for collection, indexes in DFTTK_INDEXES.items():
+        existing = [list(v['key']) for v in vasp_db.db[collection].index_information().values()]
+        existing = [[(k, int(d)) for k, d in keys] for keys in existing]
+        for keys in indexes:
+            if keys not in existing: missing.append((collection, keys))
+    return missing
+
+
+def ensure_indexes(vasp_db, background=True):
+    '''
+    Create the compound indexes needed by the dfttk queries, existing indexes are kept
+
+    Parameters
+    ----------
+        vasp_db: VaspCalcDb
+            The database connection, with admin privilege
+        background: bool
+            Build the indexes in the background
+    Returns
+    -------
+        created: list of (collection, index name)
+    '''
+    created = []
+    for collection, keys in missing_indexes(vasp_db):
+        name = vasp_db.db[collection].create_index(keys, name=_index_name(keys), background=background)
+        created.append((collection, name))
+    return created
+
+
+def check_indexes(vasp_db):
+    '''
+    Warn once per database if the dfttk indexes are missing
+    '''
+    key = (vasp_db.host, vasp_db.port, vasp_db.db_name)
+    if key in _checked_indexes: return
+    _checked_indexes.add(key)
+    try:
+        missing = missing_indexes(vasp_db)
+    except Exception:
+        return
+    if len(missing) != 0:
+        warn('{} dfttk indexes are missing in database {}, queries by metadata.tag scan whole collections. '
+             'Run "dfttk db ensure-indexes" to create them.'.format(len(missing), vasp_db.db_name))
+
+
+def _plan_stages(plan):
+    stages = [plan.get('stage')]
+    if 'inputStage' in plan: stages += _plan_stages(plan['inputStage'])
+    for p in plan.get('inputStages', []): stages += _plan_stages(p)
+    return stages
+
+
+def explain_queries(vasp_db, tag=None):
+    '''
+    Explain the representative dfttk queries and flag collection scans
+
+    Parameters
+    ----------
+        vasp_db: VaspCalcDb
+            The database connection
+        tag: str
+            The metadata tag used in the queries, a random one if None
+    Returns
+    -------
+        report: list of (collection, query, stages of the winning plan, is a collection scan)
+    '''
+    import json
+    if tag is None: tag = 'dfttk-explain-tag'
+    report = []
+    for collection, query in DFTTK_QUERIES:
+        query = json.loads(json.dumps(query).replace('"TAG"', json.dumps(tag)))
+        plan = vasp_db.db[collection].find(query).explain()['queryPlanner']['winningPlan']
+        if 'queryPlan' in plan: plan = plan['queryPlan']
+        stages = _plan_stages(plan)
+        report.append((collection, query, stages, 'COLLSCAN' in stages))
+    return report
@@ -20,6 +20,7 @@ import shutil
 import glob
 
 from atomate.vasp.config import VASP_CMD, DB_FILE
+from atomate.vasp.database import VaspCalcDb
 
 
 def get_abspath(path):
@@ -550,6 +551,28 @@ def config(args):
 def db_remove(args):
     querydb.remove_data_by_metadata(tag=args.TAG, rem_mode=args.MODE, forcedelete=args.FORCE)
 
+def db_indexes(args):
+    db_file = args.db_file
+    if db_file is None:
+        db_file = loadfn(config_to_dict()["FWORKER_LOC"])["env"]["db_file"]
+    vasp_db = VaspCalcDb.from_db_file(db_file, admin=args.ACTION=="ensure-indexes")
+    if args.ACTION == "ensure-indexes":
+        created = querydb.ensure_indexes(vasp_db)
+        for collection, name in created:
+            print("created index {} in {}".format(name, collection))
+        if len(created) == 0: print("all dfttk indexes exist")
+    else:
+        missing = querydb.missing_indexes(vasp_db)
+        for collection, keys in missing:
+            print("missing index {} in {}".format(keys, collection))
+        if len(missing) == 0: print("all dfttk indexes exist")
+    if args.EXPLAIN:
+        nscan = 0
+        for collection, query, stages, collscan in querydb.explain_queries(vasp_db, tag=args.TAG):
+            if collscan: nscan += 1
+            print("{:<10} {:<12} {} {}".format("COLLSCAN" if collscan else "ok", collection, query, '->'.join(stages)))
+        print("\n{} queries run as collection scans".format(nscan))
+
 def run_dfttk():
     """
     dfttk command
@@ -661,6 +684,18 @@ def run_dfttk():
     pdbrm.add_argument('-f', '--force', dest='FORCE', action="store_true", help='Force remove (no query). Default: False.')
     pdbrm.set_defaults(func=db_remove)
 
+    #SUB-PROCESS: db
+    pdb = subparsers.add_parser("db", help="Maintain the indexes of the dfttk collections in MongoDb.")
+    pdb.add_argument('ACTION', choices=["ensure-indexes", "check-indexes"],
+        help='ensure-indexes: create the missing indexes (admin). check-indexes: report the missing indexes.')
+    pdb.add_argument('-explain', '--explain', dest='EXPLAIN', action="store_true",
+        help='Explain the representative dfttk queries and flag the collection scans. Default: False.')
+    pdb.add_argument('-tag', '--tag', dest='TAG', default=None, help='Specify the tag used in the explained queries. Default: None')
+    pdb.add_argument("-db", "--db_file", dest="db_file", nargs="?", type=str, default=None,
+                      help="alternative database other than default\n"
+                           "Default: None")
+    pdb.set_defaults(func=db_indexes)
+
 
     # extension by Yi Wang, finalized on August 4, 2020
     # -----------------------------------
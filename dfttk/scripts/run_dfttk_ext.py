@@ -14,6 +14,7 @@ import dfttk.pythelec as pythelec
 from dfttk.pythelec import thelecMDB
 from dfttk.pythfind import thfindMDB
 from dfttk.pyEVfind import EVfindMDB
+from dfttk.scripts.querydb import check_indexes
 import warnings
 import copy
 import os
@@ -21,7 +22,7 @@ import sys
 import shutil
 from datetime import datetime
 from dfttk.analysis.ywplot import myjsonout, thermoplot
-from dfttk.analysis.ywutils import get_melting_temperature, reduced_formula, get_expt
+from dfttk.analysis.ywutils import get_melting_temperature, reduced_formula, get_expt, fvib_file, write_fvib_text
 import numpy as np
 
 no_MongoDB = False
@@ -74,6 +75,16 @@ def ext_thelec(args, plotfiles=None, vasp_db=None):
         ndosmx = max(100001, int(ndosmx))
         gaussian = max(10000., float(gaussian))
 
+    if args.fvib_text:
+        phasename = args.local if args.local != "" else args.phasename
+        if plotfiles is not None: phasename = plotfiles[4]
+        if phasename is None:
+            print("\n-fvibtext needs the phase folder given by -pn or -local\n")
+            return
+        thermofile = write_fvib_text(os.path.join(phasename, outf), csv=True)
+        print("\nText table and csv copies of", thermofile, "regenerated from", thermofile+".npz\n")
+        return
+
     formula = None
     if args.local != "":
         print("\nRun using local data\n")
@@ -98,7 +109,7 @@ def ext_thelec(args, plotfiles=None, vasp_db=None):
             from dfttk.analysis.ywplot import plotAPI
             if plotAPI(readme, thermofile, volumes, energies, expt=expt, xlim=xlim, _fitCp=args.SGTEfitCp,
                 formula = proc.get_formula(), debug=args.debug,
-                plotlabel=args.plot, local=args.local):
+                plotlabel=args.plot, local=args.local, jobs=args.jobs):
                 vtof = proc.get_free_energy_for_plot(readme)
                 if vtof is not None:
                     plotAPI(readme, thermofile, volumes, energies, expt=expt, xlim=xlim, _fitCp=args.SGTEfitCp,
@@ -114,6 +125,7 @@ def ext_thelec(args, plotfiles=None, vasp_db=None):
             if vasp_db is None:
                 db_file = loadfn(config_to_dict()["FWORKER_LOC"])["env"]["db_file"]
                 vasp_db = VaspCalcDb.from_db_file(db_file, admin=False)
+                check_indexes(vasp_db)
             static_calculations = vasp_db.collection.\
                 find({'$and':[ {'metadata.tag': metatag}, {'adopted': True} ]})
             structure = Structure.from_dict(static_calculations[0]['output']['structure'])
@@ -136,7 +148,7 @@ def ext_thelec(args, plotfiles=None, vasp_db=None):
         readme={}
         from dfttk.analysis.ywplot import plotAPI
         plotAPI(readme, thermofile, None, energies, expt=expt, xlim=xlim, _fitCp=args.SGTEfitCp,
-            formula = formula, vtof=None, plotlabel=args.plot)
+            formula = formula, vtof=None, plotlabel=args.plot, jobs=args.jobs)
     elif vasp_db==None and plotfiles!=None:
         metatag, thermofile, volumes, energies, dir, formula = plotfiles
         sys.stdout.write('Processing {}, dir: {}, formula: {}\n'.format(metatag, dir, formula))
@@ -164,7 +176,7 @@ def ext_thelec(args, plotfiles=None, vasp_db=None):
             from dfttk.analysis.ywplot import plotAPI
             if plotAPI(readme, thermofile, volumes, energies, expt=expt, xlim=xlim, _fitCp=args.SGTEfitCp,
                 formula = proc.get_formula(), debug=args.debug,
-                plotlabel=args.plot):
+                plotlabel=args.plot, jobs=args.jobs):
                 vtof = proc.get_free_energy_for_plot(readme)
                 if vtof is not None:
                     plotAPI(readme, thermofile, volumes, energies, expt=expt, xlim=xlim, _fitCp=args.SGTEfitCp,
@@ -198,7 +210,7 @@ def ext_thelec(args, plotfiles=None, vasp_db=None):
             from dfttk.analysis.ywplot import plotAPI
             if plotAPI(readme, thermofile, volumes, energies, expt=expt, xlim=xlim, _fitCp=args.SGTEfitCp,
                 formula = proc.get_formula(), debug=args.debug,
-                plotlabel=args.plot):
+                plotlabel=args.plot, jobs=args.jobs):
                 vtof = proc.get_free_energy_for_plot(readme)
                 if vtof is not None:
                     plotAPI(readme, thermofile, volumes, energies, expt=expt, xlim=xlim, _fitCp=args.SGTEfitCp,
@@ -220,7 +232,7 @@ def ext_thelec(args, plotfiles=None, vasp_db=None):
             from dfttk.analysis.ywplot import plotAPI
             if plotAPI(readme, thermofile, None, None, expt=expt, xlim=xlim, _fitCp=args.SGTEfitCp,
                 formula = proc.get_formula(), debug=args.debug,
-                poscar=args.poscar,vdos=args.vdos, doscar=args.doscar, natoms=natoms, plotlabel=args.plot):
+                poscar=args.poscar,vdos=args.vdos, doscar=args.doscar, natoms=natoms, plotlabel=args.plot, jobs=args.jobs):
                 record_cmd_print(thermofile, readme)
     elif args.local == "":
         pythelec.thelecAPI(t0, t1, td, xdn, xup, dope, ndosmx, gaussian, natom, outf, doscar)
@@ -338,6 +350,32 @@ def shared_aguments(pthelec):
     pthelec.add_argument("-noel", "-noel", dest="noel", action='store_true', default=False,
                       help="do not consider the thermal electron contribution. \n"
                            "Default: False")
+    pthelec.add_argument("-batch", "--batch", dest="batch", action='store_true', default=False,
+                      help="calculate the thermal electron contribution for all temperatures \n"
+                           "together by array operations instead of temperature by temperature. \n"
+                           "Default: False")
+    pthelec.add_argument("-qhabatch", "--qha_batch", dest="qha_batch", action='store_true', default=False,
+                      help="with -db_repair/-db_renew, minimize the Gibbs energy of all temperatures together \n"
+                           "by one polynomial fit in V^(-1/3) instead of an EOS fit for each temperature. \n"
+                           "Default: False")
+    pthelec.add_argument("-jobs", "--jobs", dest="jobs", nargs="?", type=int, default=1,
+                      help="number of processes to calculate the thermal electron contribution \n"
+                           "of different volumes and to render the figures in parallel. For 'thfind -get', number of phases \n"
+                           "postprocessed in parallel, each logged into thfind_logs/phasename.log. \n"
+                           "Default: 1")
+    pthelec.add_argument("-ycache", "--yphon_cache", dest="yphon_cache", nargs="?", type=str, default=None,
+                      help="root of the cache of the phonon DOS by Yphon, 'off' to always rerun Yphon. \n"
+                           "Default: None ($DFTTK_YPHON_CACHE or ~/.dfttk/yphon_cache)")
+    pthelec.add_argument("-fvib", "--fvib_format", dest="fvib_format", nargs="?", type=str, default="text",
+                      choices=["text", "npz", "both"],
+                      help="output format of the thermodynamic table (-outf): text, the columnar binary \n"
+                           "outf.npz read by the plotting and the find tools, or both. \n"
+                           "Default: text")
+    pthelec.add_argument("-fvibtext", "--fvib_text", dest="fvib_text", action='store_true', default=False,
+                      help="regenerate the text table (-outf) and its csv copies outf.csv and outf_sm.csv \n"
+                           "from outf.npz written by '-fvib npz', without postprocessing. The phase folder \n"
+                           "is given by -pn or -local, or taken from the phases found by 'thfind -get'. \n"
+                           "Default: False")
     pthelec.add_argument("-tag", "--metatag", dest="metatag", nargs="?", type=str, default=None,
                       help="metatag: MongoDB metadata tag field. \n"
                            "Default: None")
@@ -425,6 +463,7 @@ def run_ext_thelec(subparsers):
     #further extension for finding phonon calculation
     run_ext_thfind(subparsers)
     run_ext_EVfind(subparsers)
+    run_ext_yphon_cache(subparsers)
 
 
 def run_ext_thfind(subparsers):
@@ -472,6 +511,9 @@ def run_ext_thfind(subparsers):
     pthfind.add_argument("-remove", "--remove", dest="remove", action='store_true', default=False,
                       help="remove database document entries under given conditions (under development). \n"
                            "Default: False")
+    pthfind.add_argument("-resume", "--resume", dest="resume", action='store_true', default=False,
+                      help="with -get, skip the phases whose readme and fvib_ele are up to date. \n"
+                           "Default: False")
     shared_aguments(pthfind)
 
     if subparsers is None: return pthfind
@@ -494,12 +536,14 @@ def ext_thfind(args, vasp_db=None):
             workflow, current only get_wf_gibbs
     """
     qha_renew = args.db_repair or args.db_renew
+    db_file = None
     if args.db_file is not None:
         vasp_db = VaspCalcDb.from_db_file(args.db_file, admin=qha_renew)
         db_file = args.db_file       
     elif vasp_db is None:
         db_file = loadfn(config_to_dict()["FWORKER_LOC"])["env"]["db_file"]
         vasp_db = VaspCalcDb.from_db_file(db_file, admin=qha_renew)
+    check_indexes(vasp_db)
     proc=thfindMDB(args,vasp_db)
     tags = proc.run_console()
 
@@ -534,7 +578,7 @@ def ext_thfind(args, vasp_db=None):
                 proc = QHAAnalysis_renew(phonon=True, t_min=t_min, t_max=t_max,
                 t_step=t_step, db_file=db_file, test_failure=False, admin=True,
                 metadata={'tag':tag}, bp2gru = args.debye_gruneisen_x, 
-                tag=tag, poisson = args.poisson)
+                tag=tag, poisson = args.poisson, batch = args.qha_batch)
                 #proc.run_task()
 
                 try: 
@@ -550,16 +594,121 @@ def ext_thfind(args, vasp_db=None):
     if args.get:
         with open("runs.log", "a") as fp:
             fp.write ('\nPostprocessing run at {}\n\n'.format(datetime.now()))
+        summary = []
+        jobs = []
         for t in tags:
             if isinstance(t,dict):
-                print("\nDownloading data by metadata tag:", t['tag'], "\n")
-                args.metatag = t['tag']
-                args.phasename = t['phasename']
-                ext_thelec(args, vasp_db=vasp_db)
+                if args.resume and thelec_up_to_date(t['phasename'], args.outf):
+                    print("\nSkip up to date phase:", t['phasename'], "\n")
+                    summary.append((t['tag'], t['phasename'], 'skipped', 0.0, ''))
+                elif args.jobs > 1:
+                    jobs.append((args, t['tag'], t['phasename'], db_file, "thfind_logs"))
+                else:
+                    args.metatag = t['tag']
+                    args.phasename = t['phasename']
+                    res = thfind_run(args, t['tag'], t['phasename'], vasp_db=vasp_db)
+                    if res[2] == 'failed': print("\nFailed postprocessing", t['phasename'], res[4], "\n")
+                    summary.append(res)
                 #args.metatag = None
                 #args.phasename = None
             else:
                 ext_thelec(args,plotfiles=t, vasp_db=vasp_db)
+        if len(jobs) > 0:
+            import multiprocessing
+            print("\nPostprocessing", len(jobs), "phases by", args.jobs, "processes, logs in thfind_logs\n")
+            with multiprocessing.Pool(processes=min(args.jobs, len(jobs)), maxtasksperchild=1) as pool:
+                for res in pool.imap_unordered(thfind_job, jobs):
+                    print("{:>8} {:10.1f}s {} {}".format(res[2], res[3], res[1], res[4]))
+                    summary.append(res)
+        if len(summary) > 0:
+            write_thfind_summary(summary)
+
+def thelec_up_to_date(phasename, outf="fvib_ele"):
+    """
+    check if the postprocessing of a phase has finished without error,
+    i.e., the readme is written after the thermodynamic file and there is no ERROR file
+    """
+    readme = os.path.join(phasename, "readme")
+    thermofile = fvib_file(os.path.join(phasename, outf))
+    if not (os.path.exists(readme) and thermofile is not None): return False
+    if os.path.exists(os.path.join(phasename, "ERROR")): return False
+    return os.path.getmtime(readme) >= os.path.getmtime(thermofile)
+
+
+def thelec_status(phasename, start=None):
+    """
+    status of the postprocessing of a phase, the readme older than the start time
+    (datetime) of the run is left from an earlier run and does not count
+    """
+    if os.path.exists(os.path.join(phasename, "ERROR")): return 'error'
+    readme = os.path.join(phasename, "readme")
+    if os.path.exists(readme):
+        #the file time stamps are taken from a coarser clock than datetime.now()
+        if start is None or os.path.getmtime(readme) >= start.timestamp()-1.0: return 'ok'
+    return 'nodata'
+
+
+def thfind_run(args, tag, phasename, vasp_db=None, db_file=None):
+    """
+    postprocess one phase for 'thfind -get', recording an exception as 'failed' so that
+    the remaining phases are processed and the summary is written
+
+    Returns
+        (tag, phasename, status, elapsed seconds, message)
+    """
+    import traceback
+    start = datetime.now()
+    message = ''
+    try:
+        print("\nDownloading data by metadata tag:", tag, "\n")
+        if vasp_db is None and db_file is not None:
+            vasp_db = VaspCalcDb.from_db_file(db_file, admin=False)
+        ext_thelec(args, vasp_db=vasp_db)
+        #the readme is not rewritten when only the text tables are regenerated
+        status = 'ok' if args.fvib_text else thelec_status(phasename, start=start)
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        #including SystemExit of sys.exit() in the postprocessing
+        traceback.print_exc()
+        status = 'failed'
+        message = '{}: {}'.format(type(e).__name__, e).split('\n')[0]
+    return tag, phasename, status, (datetime.now()-start).total_seconds(), message
+
+
+def thfind_job(job):
+    """
+    postprocess one phase for 'thfind -get' in a worker process, which opens its own database
+    connection and writes its output into logdir/phasename.log
+
+    Returns
+        (tag, phasename, status, elapsed seconds, message)
+    """
+    import contextlib
+    args, tag, phasename, db_file, logdir = job
+    args = copy.copy(args)
+    args.metatag = tag
+    args.phasename = phasename
+    #nested process pools are not allowed in the pool workers
+    args.jobs = 1
+    if not os.path.exists(logdir): os.makedirs(logdir, exist_ok=True)
+    with open(os.path.join(logdir, phasename+".log"), "w") as fp:
+        with contextlib.redirect_stdout(fp), contextlib.redirect_stderr(fp):
+            return thfind_run(args, tag, phasename, db_file=db_file)
+
+
+def write_thfind_summary(summary, fname="thfind_summary.txt"):
+    """
+    write the table of the postprocessing results of 'thfind -get'
+    """
+    nfailed = len([s for s in summary if s[2] in ('failed', 'error')])
+    with open(fname, "w") as fp:
+        fp.write('#Postprocessing summary at {}, {} phases, {} failed\n'.format(datetime.now(), len(summary), nfailed))
+        fp.write('#{:>7} {:>10} {:<40} {:<24} {}\n'.format('status', 'seconds', 'phasename', 'tag', 'message'))
+        for tag, phasename, status, elapsed, message in summary:
+            fp.write('{:>8} {:10.1f} {:<40} {:<24} {}\n'.format(status, elapsed, phasename, tag, message))
+    print("\nPostprocessed", len(summary), "phases,", nfailed, "failed, summary in", fname, "\n")
+
 
 def run_ext_EVfind(subparsers):
     #SUB-PROCESS: EVfind
@@ -606,6 +755,38 @@ def run_ext_EVfind(subparsers):
     pEVfind.set_defaults(func=ext_EVfind)
 
 
+def run_ext_yphon_cache(subparsers):
+    #SUB-PROCESS: yphon_cache
+    pycache = subparsers.add_parser("yphon_cache", help="Inspect and prune the cache of the phonon DOS by Yphon.")
+    pycache.add_argument("-root", "--root", dest="root", nargs="?", type=str, default=None,
+                      help="root of the cache. \n"
+                           "Default: None ($DFTTK_YPHON_CACHE or ~/.dfttk/yphon_cache)")
+    pycache.add_argument("-prune", "--prune", dest="prune", nargs="?", type=float, const=0.0, default=None,
+                      help="remove the least recently used entries until the cache is not larger than the given size in MB, \n"
+                           "remove all entries if no size is given. \n"
+                           "Default: None")
+    pycache.set_defaults(func=ext_yphon_cache)
+
+
+def ext_yphon_cache(args):
+    """
+    report the size of the Yphon cache and prune it if requested
+
+    Parameters
+        root = args.root
+            root of the cache
+        prune = args.prune
+            size limit in MB
+    """
+    from dfttk.yphoncache import yphon_cache_info, yphon_cache_prune
+    if args.prune is not None:
+        nremoved = yphon_cache_prune(max_size=args.prune*1024**2, root=args.root)
+        print("removed", nremoved, "entries")
+    root, nentries, size = yphon_cache_info(root=args.root)
+    print("Yphon cache:", root)
+    print("entries:", nentries, " size: {:.3f} MB".format(size/1024**2))
+
+
 def ext_EVfind(args, vasp_db=None):
     """
     find the metadata tag that has finished.
@@ -626,5 +807,6 @@ def ext_EVfind(args, vasp_db=None):
     elif vasp_db is None:
         db_file = loadfn(config_to_dict()["FWORKER_LOC"])["env"]["db_file"]
         vasp_db = VaspCalcDb.from_db_file(db_file, admin=False)
+    check_indexes(vasp_db)
     proc=EVfindMDB(args, vasp_db=vasp_db)
     tags = proc.run_console()
@@ -16,6 +16,20 @@ from pymatgen.core import Structure
 from .prl_structure import PRLStructure
 
 
+def _sublattice_configuration(concrete_subl, subl_ratios):
+    """Return the canonical configuration and occupancies of one sublattice, e.g.
+    (['FE', 'NI'], [0.3333, 0.6666]) for ['NI', 'FE', 'NI'] with the site ratios [1, 1, 1]
+
+    The sublattice configuration is canonicalized, e.g. ['FE', 'FE'] => ['FE']
+    """
+    sublattice_ratio_sum = sum(subl_ratios)
+    sublattice_occupancy_dict = {}
+    for concrete_specie, site_ratio in zip(concrete_subl, subl_ratios):
+        sublattice_occupancy_dict[concrete_specie] = sublattice_occupancy_dict.get(concrete_specie, 0) + site_ratio/sublattice_ratio_sum
+    subl_config = sorted(set(concrete_subl))
+    return subl_config, [sublattice_occupancy_dict[specie] for specie in subl_config]
+
+
 class AbstractSQS(Structure):
     """A pymatgen Structure with special features for SQS.
     """
@@ -58,6 +72,32 @@ class AbstractSQS(Structure):
         site_ratios = [[comp_dict['X'+name+e+'0+'] for e in subl] for subl, name in zip(subl_model, subl_names)]
         return site_ratios
 
+    def get_concrete_configuration(self, subl_model, sublattice_site_ratios=None):
+        """Return the canonical sublattice configuration and occupancies of the concrete SQS
+        for the sublattice model, without building the structure.
+
+        Parameters
+        ----------
+        subl_model : [[str]]
+            List of strings of species names. Must exactly match the shape of self.sublattice_model.
+        sublattice_site_ratios : [[int]]
+            self.sublattice_site_ratios, can be passed to avoid the recalculation for many sublattice models
+
+        Returns
+        -------
+        tuple
+            Tuple of (configuration, occupancies), e.g. ([['FE', 'NI'], ['FE']], [[0.3333, 0.6666], [1.0]])
+        """
+        if sublattice_site_ratios is None:
+            sublattice_site_ratios = self.sublattice_site_ratios
+        configuration = []
+        occupancies = []
+        for concrete_subl, subl_ratios in zip(subl_model, sublattice_site_ratios):
+            subl_config, subl_occupancies = _sublattice_configuration(concrete_subl, subl_ratios)
+            configuration.append(subl_config)
+            occupancies.append(subl_occupancies)
+        return configuration, occupancies
+
     def get_concrete_sqs(self, subl_model, scale_volume=True):
         """Modify self to be a concrete SQS based on the sublattice model.
 
@@ -74,20 +114,14 @@ class AbstractSQS(Structure):
         if len(subl_model) != len(self.sublattice_model):
             _subl_error()
 
-        # build the replacement dictionary and the site ratios
+        # build the replacement dictionary
         # we have to look up the sublattice names to build the replacement species names
         replacement_dict = {}
-        site_occupancies = [] # list of [{'FE': 0.3333, 'NI': 0.6666}, {'FE': 1}] for [['FE', 'NI'], ['FE]]
-        for abstract_subl, concrete_subl, subl_name, subl_ratios in zip(self.sublattice_model, subl_model, self._sublattice_names, self.sublattice_site_ratios):
+        for abstract_subl, concrete_subl, subl_name in zip(self.sublattice_model, subl_model, self._sublattice_names):
             if len(abstract_subl) != len(concrete_subl):
                 _subl_error()
-            sublattice_ratio_sum = sum(subl_ratios)
-            sublattice_occupancy_dict = {}
-            for abstract_specie, concrete_specie, site_ratio in zip(abstract_subl, concrete_subl, subl_ratios):
-                specie = 'X' + subl_name + abstract_specie
-                replacement_dict[specie] = concrete_specie
-                sublattice_occupancy_dict[concrete_specie] = sublattice_occupancy_dict.get(concrete_specie, 0) + site_ratio/sublattice_ratio_sum
-            site_occupancies.append(sublattice_occupancy_dict)
+            for abstract_specie, concrete_specie in zip(abstract_subl, concrete_subl):
+                replacement_dict['X' + subl_name + abstract_specie] = concrete_specie
 
         # create a copy of myself to make the transformations and make them
         self_copy = copy.deepcopy(self)
@@ -104,14 +138,11 @@ class AbstractSQS(Structure):
 
         # finally we will construct the SQS object and set the values for the canonicalized
         # sublattice configuration, site ratios, and site occupancies
-
-        # first, canonicalize the sublattice model, e.g. [['FE', 'FE'], ['NI']] => [['FE'], ['NI']]
-        sublattice_configuration = [sorted(set(subl)) for subl in subl_model]
-        # construct the sublattice occupancies for the model
-        sublattice_occupancies = [[occupancies[specie] for specie in subl] for occupancies, subl in zip(site_occupancies, sublattice_configuration)]
+        sublattice_site_ratios = self.sublattice_site_ratios
+        sublattice_configuration, sublattice_occupancies = self.get_concrete_configuration(subl_model, sublattice_site_ratios)
         # sum up the individual sublattice site ratios to the total sublattice ratios.
         # e.g [[0.25, 0.25], [0.1666, 0.1666, 0.1666]] => [0.5, 0.5]
-        site_ratios = [sum(ratios) for ratios in self.sublattice_site_ratios]
+        site_ratios = [sum(ratios) for ratios in sublattice_site_ratios]
 
         # create the SQS and add all of these properties to our SQS
         concrete_sqs = PRLStructure.from_sites(self_copy.sites)
@@ -164,7 +195,52 @@ class AbstractSQS(Structure):
         return sqs
 
 
-def enumerate_sqs(structure, subl_model, scale_volume=True, skip_on_failure=False):
+def iter_sqs(structure, subl_model, scale_volume=True, limit=None):
+    """
+    Yield the unique concrete Structure objects from an abstract Structure and concrete sublattice model lazily.
+
+    The assignments of species are enumerated for each sublattice separately and reduced to the
+    canonical (configuration, occupancies) keys in a hash set first, so that the concrete structures
+    are only built for the unique combinations of the sublattice keys. The structures are yielded
+    in the same order as the first occurrences in the product of all the assignments.
+
+    Parameters
+    ----------
+    structure : AbstractSQS
+        SQS object. Must be abstract.
+    subl_model : [[str]]
+        List of strings of species names, in the style of ESPEI `input.json`, see enumerate_sqs.
+    scale_volume : bool
+        If True, scales the volume of the cell so the ions have at least their minimum atomic radii between them.
+    limit : int
+        Maximum number of structures to yield. None for all.
+
+    Yields
+    ------
+    PRLStructure
+    """
+    if len(subl_model) != len(structure.sublattice_model):
+        raise ValueError('Passed sublattice model ({}) does not agree with the passed structure ({})'.format(subl_model, structure.sublattice_model))
+    sublattice_site_ratios = structure.sublattice_site_ratios
+    # the first assignment of each unique canonical sublattice configuration
+    unique_subls = []
+    for subl, abstract_subl, subl_ratios in zip(subl_model, structure.sublattice_model, sublattice_site_ratios):
+        seen = set()
+        subls = []
+        for concrete_subl in itertools.product(subl, repeat=len(abstract_subl)):
+            subl_config, subl_occupancies = _sublattice_configuration(concrete_subl, subl_ratios)
+            key = (tuple(subl_config), tuple(subl_occupancies))
+            if key not in seen:
+                seen.add(key)
+                subls.append(concrete_subl)
+        unique_subls.append(subls)
+    for n, model in enumerate(itertools.product(*unique_subls)):
+        if limit is not None and n >= limit:
+            return
+        yield structure.get_concrete_sqs(model, scale_volume)
+
+
+def enumerate_sqs(structure, subl_model, scale_volume=True, skip_on_failure=False, limit=None):
     """
     Return a list of all of the concrete Structure objects from an abstract Structure and concrete sublattice model.
     Parameters
@@ -181,27 +257,13 @@ def enumerate_sqs(structure, subl_model, scale_volume=True, skip_on_failure=Fals
         If True, scales the volume of the cell so the ions have at least their minimum atomic radii between them.
     skip_on_failure : bool
         If True, will skip if the sublattice model is lower order and return [] instead of raising
+    limit : int
+        Maximum number of structures to return. None for all.
 
     Returns
     -------
     [PRLStructure]
         List of all concrete PRLStructure objects that can be created from the sublattice model.
+        Use iter_sqs to get them lazily.
     """
-    if len(subl_model) != len(structure.sublattice_model):
-        raise ValueError('Passed sublattice model ({}) does not agree with the passed structure ({})'.format(subl_model, structure.sublattice_model))
-    possible_subls = []
-    for subl, abstract_subl in zip(subl_model, structure.sublattice_model):
-        subls = itertools.product(subl, repeat=len(abstract_subl))
-        possible_subls.append(subls)
-    unique_subl_models = itertools.product(*possible_subls)
-
-    # create a list of unique concrete structures with the generated sublattice models
-    unique_sqs = []
-    unique_configurations_occupancies = []
-    for model in unique_subl_models:
-        proposed_sqs = structure.get_concrete_sqs(model, scale_volume)
-        proposed_config_occupancy = (proposed_sqs.sublattice_configuration, proposed_sqs.sublattice_occupancies)
-        if proposed_config_occupancy not in unique_configurations_occupancies:
-            unique_configurations_occupancies.append(proposed_config_occupancy)
-            unique_sqs.append(proposed_sqs)
-    return unique_sqs
+    return list(iter_sqs(structure, subl_model, scale_volume=scale_volume, limit=limit))
@@ -15,6 +15,8 @@ In general, the workflow to create a database is to use the helper functions to
 4. persist the database to a path (no helper function)
 
 Later, the database can be constructed again from the path, added to (steps 1-3) and persisted again.
+The parsed SQS are kept in a SQLite index file next to them, keyed by the endmember space group symbol
+and the reduced sublattice site ratios, and only the files changed since the last time are parsed again.
 
 To use the database, the user calls the `structures_from_database` helper function to generate a list
 of all the SQS that match the endmember symmetry, sublattice model (and site ratios) that define a
@@ -25,6 +27,9 @@ the resulting Structure objects can be made concrete using functions in `dfttk.s
 import json
 import os
 import re
+import math
+import sqlite3
+import functools
 
 from pymatgen.core import Lattice
 from pyparsing import Regex, Word, alphas, alphanums, OneOrMore, LineEnd, Suppress, Group
@@ -125,30 +130,178 @@ def lat_in_to_sqs(atat_lattice_in, rename=True):
     return sqs
 
 
-def SQSDatabase(path, name_constraint=''):
+SQS_INDEX_VERSION = 1
+SQS_INDEX_NAME = '.sqs_index.sqlite'
+
+
+def site_ratio_signature(site_ratios):
+    """
+    Return the reduced sublattice site ratios as a string, the key of the SQS index.
+
+    Parameters
+    ----------
+    site_ratios : [int] or [[int]]
+        Site ratios of each sublattice, the site ratios of the species in a sublattice are summed.
+
+    Returns
+    -------
+    str
+        The site ratios divided by their greatest common divisor, None if they are not positive integers.
+
+    Examples
+    --------
+    >>> site_ratio_signature([2, 6])
+    '1:3'
+    >>> site_ratio_signature([[1, 1], [2]])
+    '1:1'
+    >>> site_ratio_signature([0.5, 0.5]) is None
+    True
+    """
+    ratios = [sum(r) if isinstance(r, (list, tuple)) else r for r in site_ratios]
+    if len(ratios) == 0 or any([(float(r) != int(r)) or (r <= 0) for r in ratios]):
+        return None
+    ratios = [int(r) for r in ratios]
+    gcd = functools.reduce(math.gcd, ratios)
+    return ':'.join([str(r//gcd) for r in ratios])
+
+
+class SQSIndex():
+    """
+    Abstract SQS (in the serialized form of AbstractSQS.as_dict) in a SQLite index, built by
+    SQSDatabase or SQSDatabaseATAT.
+
+    Lookups by get_structures_from_database use the index on (space group symbol, reduced site ratios).
     """
-    Convienence function to create a TinyDB for the SQS database found at `path`.
+    def __init__(self, conn, name_constraint='', nparsed=0):
+        self.conn = conn
+        self.name_constraint = name_constraint.upper()
+        self.nparsed = nparsed  # number of files parsed when the index is updated
+
+    def _select(self, where='', args=()):
+        sql = 'SELECT doc FROM sqs WHERE instr(upper(fname), ?) > 0' + where + ' ORDER BY fname, rowid'
+        return [json.loads(row[0]) for row in self.conn.execute(sql, (self.name_constraint,)+tuple(args))]
+
+    def all(self):
+        return self._select()
+
+    def __len__(self):
+        return self.conn.execute('SELECT count(*) FROM sqs WHERE instr(upper(fname), ?) > 0',
+            (self.name_constraint,)).fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def search_site_ratios(self, symmetry, subl_site_ratios):
+        """Return the SQS with the symmetry and the same reduced site ratios as subl_site_ratios"""
+        signature = site_ratio_signature(subl_site_ratios)
+        if signature is None:
+            return self._select(' AND symbol = ?', (symmetry,))
+        return self._select(' AND symbol = ? AND signature = ?', (symmetry, signature))
+
+    def as_tinydb(self):
+        """Return the SQS in a TinyDB in memory, as SQSDatabase did before"""
+        db = TinyDB(storage=MemoryStorage)
+        for doc in self.all():
+            db.insert(doc)
+        return db
+
+
+def _open_sqs_index(index_file):
+    """Connect to the SQS index, the tables are (re)created if missing or of another version"""
+    conn = sqlite3.connect(index_file)
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if version is None or version[0] != str(SQS_INDEX_VERSION):
+        conn.execute('DROP TABLE IF EXISTS files')
+        conn.execute('DROP TABLE IF EXISTS sqs')
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(SQS_INDEX_VERSION),))
+    conn.execute('CREATE TABLE IF NOT EXISTS files (fname TEXT PRIMARY KEY, mtime INTEGER, size INTEGER)')
+    conn.execute('CREATE TABLE IF NOT EXISTS sqs (fname TEXT, symbol TEXT, signature TEXT, doc TEXT)')
+    conn.execute('CREATE INDEX IF NOT EXISTS sqs_symbol_signature ON sqs (symbol, signature)')
+    conn.commit()
+    return conn
+
+
+def _update_sqs_index(conn, fnames, loader):
+    """
+    Synchronize the SQS index with the files, only the new or modified (by mtime and size) files are
+    parsed by loader(fname), which returns the list of the SQS dicts in the file
+
+    Returns
+    -------
+    int
+        Number of parsed files
+    """
+    stored = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT fname, mtime, size FROM files')}
+    for fname in set(stored) - set(fnames):
+        conn.execute('DELETE FROM sqs WHERE fname = ?', (fname,))
+        conn.execute('DELETE FROM files WHERE fname = ?', (fname,))
+    nparsed = 0
+    for fname in fnames:
+        st = os.stat(fname)
+        if stored.get(fname) == (st.st_mtime_ns, st.st_size):
+            continue
+        docs = loader(fname)
+        conn.execute('DELETE FROM sqs WHERE fname = ?', (fname,))
+        for doc in docs:
+            conn.execute('INSERT INTO sqs VALUES (?, ?, ?, ?)', (fname, doc.get('symmetry', {}).get('symbol'),
+                site_ratio_signature(doc.get('sublattice_site_ratios', [])), json.dumps(doc)))
+        conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (fname, st.st_mtime_ns, st.st_size))
+        nparsed += 1
+    conn.commit()
+    return nparsed
+
+
+def _sqs_index(index_file, fnames, loader):
+    """
+    Open and update the SQS index in index_file. If it can not be written, e.g. a read only
+    (site-installed) SQS database, all the files are parsed into an index in memory instead
+
+    Returns
+    -------
+    (sqlite3.Connection, int)
+        The connection to the index and the number of parsed files
+    """
+    conn = None
+    try:
+        conn = _open_sqs_index(index_file)
+        return conn, _update_sqs_index(conn, fnames, loader)
+    except sqlite3.Error:
+        if conn is not None:
+            conn.close()
+    conn = _open_sqs_index(':memory:')
+    return conn, _update_sqs_index(conn, fnames, loader)
+
+
+def _load_json_sqs(fname):
+    with open(fname) as file_:
+        try:
+            return [json.load(file_)]
+        except ValueError as e:
+            raise ValueError('JSON Error in {}: {}'.format(fname, e))
+
+
+def SQSDatabase(path, name_constraint='', index_file=None):
+    """
+    Convienence function to create the SQS database found at `path`.
 
     Parameters
     ----------
     path : path-like of the folder containing the SQS database.
     name_constraint : Any name constraint to add into the recursive glob. Not case sensitive. Exact substring.
+    index_file : path of the SQLite index. Default is `.sqs_index.sqlite` in `path`, ':memory:' for no persistence.
+        If the index can not be written, the SQS are parsed into an index in memory.
 
     Returns
     -------
-    TinyDB
-        Database of abstract SQS.
+    SQSIndex
+        Database of abstract SQS, SQSIndex.as_tinydb() gives the TinyDB.
     """
-    db = TinyDB(storage=MemoryStorage)
+    if index_file is None:
+        index_file = os.path.join(path, SQS_INDEX_NAME)
     dataset_filenames = recursive_glob(path, '*.json')
-    dataset_filenames = [fname for fname in dataset_filenames if name_constraint.upper() in fname.upper()]
-    for fname in dataset_filenames:
-        with open(fname) as file_:
-            try:
-                db.insert(json.load(file_))
-            except ValueError as e:
-                raise ValueError('JSON Error in {}: {}'.format(fname, e))
-    return db
+    conn, nparsed = _sqs_index(index_file, dataset_filenames, _load_json_sqs)
+    return SQSIndex(conn, name_constraint=name_constraint, nparsed=nparsed)
 
 def SQSDatabaseATAT(atat_sqsdb_path, db_save_path=None):
     """
@@ -159,37 +312,41 @@ def SQSDatabaseATAT(atat_sqsdb_path, db_save_path=None):
         atat_sqsdb_path: str
             The path of ATAT's sqsdb, usually it is stored at ATAT_HOME/data/sqsdb
         db_save_path: str
-            The path to store the ATAT's SQS database
+            The path to store the index of ATAT's SQS database (ATAT_SQSDB.sqlite)
                 Default: None (The path of the sqs_db.py(DFTTK) file)
                 MemoryStorage: store in the memory
             Note: compared with the default SQS database, one more key is provided in
                   the ATAT's SQS database (prototype: [name_prototype, Strukturbericht_mark])
     Return
     ------
-        db: TinyDB
-            Database of abstract SQS.
+        db: SQSIndex
+            Database of abstract SQS, only the new or modified bestsqs.out are parsed.
     """
     if db_save_path == "MemoryStorage":
-        db = TinyDB(storage=MemoryStorage)
+        index_file = ':memory:'
     else:
         if db_save_path is None:
             db_save_path = os.path.dirname(__file__)
-        sqsdb_fullpath = db_save_path + "/ATAT_SQSDB.json"
-        db = TinyDB(sqsdb_fullpath)
-    for diri in os.listdir(atat_sqsdb_path):
+        index_file = os.path.join(db_save_path, "ATAT_SQSDB.sqlite")
+    fnames = []
+    for diri in sorted(os.listdir(atat_sqsdb_path)):
         sqsgen_path = os.path.join(atat_sqsdb_path, diri)
         if os.path.isdir(sqsgen_path):
-            prototype = diri.split("_")
-            for atatsqs_path in os.listdir(sqsgen_path):
-                sqs_path = os.path.join(sqsgen_path, atatsqs_path)
-                if os.path.isdir(sqs_path):
-                    sqsfile_fullpath = os.path.join(sqs_path, "bestsqs.out")
-                    if os.path.exists(sqsfile_fullpath):
-                        with open(sqsfile_fullpath, "r") as fid:
-                            sqs_dict = lat_in_to_sqs(fid.read()).as_dict()
-                            sqs_dict["prototype"] = prototype
-                            db.insert(sqs_dict)
-    return db
+            for atatsqs_path in sorted(os.listdir(sqsgen_path)):
+                sqsfile_fullpath = os.path.join(sqsgen_path, atatsqs_path, "bestsqs.out")
+                if os.path.exists(sqsfile_fullpath):
+                    fnames.append(sqsfile_fullpath)
+
+    def _load_bestsqs(fname):
+        # the prototype is given by the name of the folder, e.g. FCC_A1
+        prototype = os.path.basename(os.path.dirname(os.path.dirname(fname))).split("_")
+        with open(fname, "r") as fid:
+            sqs_dict = lat_in_to_sqs(fid.read()).as_dict()
+        sqs_dict["prototype"] = prototype
+        return [sqs_dict]
+
+    conn, nparsed = _sqs_index(index_file, fnames, _load_bestsqs)
+    return SQSIndex(conn, nparsed=nparsed)
 
 #Not used
 def parse_atatsqs_path(atatsqs_path):
@@ -281,8 +438,8 @@ def get_structures_from_database(db, symmetry, subl_model, subl_site_ratios):
 
     Parameters
     ----------
-    db : tinydb.database.Table
-        TinyDB database of the SQS database
+    db : SQSIndex or tinydb.database.Table
+        SQS database by SQSDatabase, or a TinyDB of the SQS
     symmetry : str
         Spacegroup symbol for a non-mixing endmember as in pymatgen, e.g. 'Pm-3m'.
     subl_model : [[str]]
@@ -322,6 +479,11 @@ def get_structures_from_database(db, symmetry, subl_model, subl_site_ratios):
                     return True
         return False
 
+    if isinstance(db, SQSIndex):
+        # only the SQS with the same reduced site ratios can be multiples
+        return [doc for doc in db.search_site_ratios(symmetry, subl_site_ratios)
+                if lists_are_multiple([sum(subl) for subl in doc['sublattice_site_ratios']], subl_site_ratios)]
+
     from tinydb import where
     results = db.search((where('symmetry').symbol == symmetry) &
                         (where('sublattice_site_ratios').test(
@@ -5,6 +5,8 @@ these are more verbose """
 
 import fnmatch
 import os
+import gzip
+import warnings
 
 from pymatgen.ext.matproj import MPRester, Structure
 from pymatgen.io.vasp.inputs import Incar, Poscar, Potcar
@@ -12,13 +14,23 @@ from pymatgen.io.vasp.outputs import Vasprun, Outcar
 from dfttk.analysis.relaxing import get_non_isotropic_strain, get_bond_distance_change
 from fireworks.fw_config import config_to_dict
 from fireworks import LaunchPad
-from ase.build import get_deviation_from_optimal_cell_shape
+try:
+    #ase >= 3.24, rotationally invariant and evaluated for a stack of cells
+    from ase.build.supercells import eval_length_deviation
+except ImportError:
+    eval_length_deviation = None
 from monty.serialization import loadfn, dumpfn
 import numpy as np
 import itertools
+import functools
 import scipy
 import math
 import copy
+import gridfs
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
 
 # TODO: wrap MPRester calls in a try-except block to catch errors and retry automatically
 
@@ -196,6 +208,94 @@ def get_norm_cell(cell, target_size, target_shape='sc'):
     norm_cell = norm * cell
     return norm_cell
 
+def cell_shape_deviation(cells, target_shape='sc'):
+    """
+    The deviation of the cells from the target shape by ase, evaluated for a stack of
+    cells of shape (n, 3, 3) in one call when the ase version supports it
+
+    Returns
+    -------
+        1D array of the scores
+    """
+    cells = np.asarray(cells, dtype=float).reshape(-1, 3, 3)
+    if eval_length_deviation is not None:
+        return np.asarray(eval_length_deviation(cells, target_shape=target_shape), dtype=float).reshape(-1)
+    # get_deviation_from_optimal_cell_shape(cell, target_shape, norm=1.0) of ase<=3.22,
+    # i.e. ||cell - target_metric||, on the whole stack
+    if target_shape in ["sc", "simple-cubic"]:
+        target_metric = np.eye(3)
+    elif target_shape in ["fcc", "face-centered cubic"]:
+        target_metric = 0.5 * np.array([[0, 1, 1], [1, 0, 1], [1, 1, 0]], dtype=float)
+    else:
+        raise ValueError('The target_shape should be sc or fcc (ase supported)')
+    return np.linalg.norm(cells - target_metric, axis=(1, 2))
+
+
+def int_det3(P):
+    """exact determinants of a stack of integer 3x3 matrices of shape (n, 3, 3)"""
+    return (P[:,0,0]*(P[:,1,1]*P[:,2,2]-P[:,1,2]*P[:,2,1])
+        - P[:,0,1]*(P[:,1,0]*P[:,2,2]-P[:,1,2]*P[:,2,0])
+        + P[:,0,2]*(P[:,1,0]*P[:,2,1]-P[:,1,1]*P[:,2,0]))
+
+
+@functools.lru_cache(maxsize=256)
+def _search_cell_shape(cell, starting_P, target_shape, min_size, max_size, lower_limit, upper_limit,
+    sc_tolerance, chunk_size=1<<16):
+    """
+    Batched search of find_optimal_cell_shape_in_range over starting_P+dP, dP in the product
+    of range(lower_limit, upper_limit+1) for the 9 elements, taking dP=0 first. The candidates are
+    generated in chunks in the order of itertools.product, the ones with the determinant out of
+    [min_size, max_size] are pruned before scoring. It returns the first candidate with the
+    minimum score, or the first one with the score less than sc_tolerance, as the sequential loop.
+
+    The arguments are hashable (tuples of the flattened cell and starting_P) so that the result is
+    cached for the calls of supercell_scaling_by_atom_lat_vol which share the same starting_P
+
+    Returns
+    -------
+        (best_score, optimal_P as a tuple of 9 integers or None)
+    """
+    cell = np.array(cell).reshape(3, 3)
+    starting_P = np.array(starting_P, dtype=np.int64).reshape(3, 3)
+    base = upper_limit - lower_limit + 1
+    ntot = base**9
+    powers = base**np.arange(8, -1, -1, dtype=np.int64)
+    #index of dP=0 in the product order
+    i0 = int(np.dot(np.full(9, -lower_limit, dtype=np.int64), powers)) if lower_limit <= 0 <= upper_limit else -1
+    norm_cells = {}
+    best_score = 1e6
+    optimal_P = None
+
+    def _scan(idx):
+        dP = (idx[:,None]//powers) % base + lower_limit
+        P = starting_P[None,:,:] + dP.reshape(-1, 3, 3)
+        sizes = int_det3(P)
+        P = P[(sizes >= min_size) & (sizes <= max_size)]
+        if len(P) == 0: return None, None
+        sizes = int_det3(P)
+        scores = np.empty(len(P))
+        for size in np.unique(sizes):
+            if size not in norm_cells: norm_cells[size] = get_norm_cell(cell, size, target_shape=target_shape)
+            mask = sizes == size
+            scores[mask] = cell_shape_deviation(np.matmul(P[mask], norm_cells[size]), target_shape=target_shape)
+        return scores, P
+
+    chunks = [np.array([i0], dtype=np.int64)] if i0 >= 0 else []
+    chunks += [np.arange(start, min(start+chunk_size, ntot), dtype=np.int64) for start in range(0, ntot, chunk_size)]
+    for k, idx in enumerate(chunks):
+        if k > 0 and i0 >= 0: idx = idx[idx != i0]
+        scores, P = _scan(idx)
+        if scores is None: continue
+        below = np.nonzero(scores < sc_tolerance)[0]
+        if len(below) > 0:
+            return float(scores[below[0]]), tuple(P[below[0]].ravel().tolist())
+        j = int(np.argmin(scores))
+        if scores[j] < best_score:
+            best_score = float(scores[j])
+            optimal_P = tuple(P[j].ravel().tolist())
+    return best_score, optimal_P
+
+
 def find_optimal_cell_shape_in_range(cell, target_size, target_shape, size_range=None, optimize_sc=False, lower_limit=-2, upper_limit=2,
                             sc_tolerance=1e-5, verbose=False,):
     """
@@ -290,27 +390,10 @@ def find_optimal_cell_shape_in_range(cell, target_size, target_shape, size_range
         print(starting_P)
 
     if optimize_sc:
-        # Prepare run.
-        best_score = 1e6
-        optimal_P = None
-        #Set the starting_P as the first one
-        dPlist = list(itertools.product(range(lower_limit, upper_limit + 1), repeat=9))
-        dP0 = (0, 0, 0, 0, 0, 0, 0, 0, 0)
-        dPlist.pop(dPlist.index(dP0))
-        dPlist = [dP0] + dPlist
-        for dP in dPlist:
-            dP = np.array(dP, dtype=int).reshape(3, 3)
-            P = starting_P + dP
-            New_size = np.around(np.linalg.det(P))
-            if New_size < min_size or New_size > max_size:
-                continue
-            norm_new = get_norm_cell(cell, New_size, target_shape=target_shape)
-            score = get_deviation_from_optimal_cell_shape(np.dot(P, norm_new), target_shape=target_shape, norm=1.0)
-            if score < best_score:
-                best_score = score
-                optimal_P = P
-            if best_score <  sc_tolerance:
-                break
+        best_score, optimal_P = _search_cell_shape(tuple(np.asarray(cell, dtype=float).ravel()),
+            tuple(starting_P.ravel()), target_shape, min_size, max_size, lower_limit, upper_limit, sc_tolerance)
+        if optimal_P is not None:
+            optimal_P = np.array(optimal_P, dtype=int).reshape(3, 3)
 
         if optimal_P is None:
             optimal_P = starting_P
@@ -410,7 +493,7 @@ def supercell_scaling_by_atom_lat_vol(structure, min_obj=60, max_obj=120, scale_
             verbose=verbose, sc_tolerance=sc_tolerance, optimize_sc=optimize_sc)
         optimal_supercell_shapes.append(optimal_shape)
         norm_cell = get_norm_cell(structure.lattice.matrix, sc_size, target_shape=target_shape)
-        scores = get_deviation_from_optimal_cell_shape(np.dot(optimal_shape, norm_cell), target_shape)
+        scores = cell_shape_deviation(np.dot(optimal_shape, norm_cell), target_shape)[0]
         optimal_supercell_scores.append(scores)
         supercell_sizes_out.append(sc_size)
         if scores < sc_tolerance:
@@ -839,6 +922,157 @@ def update_pot_by_symbols(InputSet, write_file=True):
         potcar.write_file(filename="POTCAR")
     return potcar
 
+def _vasprun_energies(elem):
+    """energies of a calculation or scstep element of vasprun.xml"""
+    energy = {}
+    for i in elem.findall("i"):
+        try:
+            energy[i.attrib["name"]] = float(i.text)
+        except ValueError:
+            # e.g. ******** for overflow
+            energy[i.attrib["name"]] = float("nan")
+    return energy
+
+
+def read_vasprun_energies(filename="vasprun.xml"):
+    """
+    Read the energies of the first and the last ionic steps from vasprun.xml by streaming,
+    the other parts (eigenvalues, DOS, etc.) are discarded while being parsed
+
+    Parameters
+    ----------
+        filename: str
+            vasprun.xml, or vasprun.xml.gz
+    Returns
+    -------
+        energies: dict
+            initial: energies (e_fr_energy, e_wo_entrp, e_0_energy) of the first ionic step
+            final: energies of the last ionic step
+            final_energy: the final energy as pymatgen.io.vasp.outputs.Vasprun.final_energy
+            nionic_steps: number of ionic steps
+    Raises
+    ------
+        ValueError: the file is incomplete or has no ionic step
+    """
+    import xml.etree.ElementTree as ET
+    initial = None
+    final = None
+    final_estep = None
+    nionic_steps = 0
+    depth = 0
+    fp = gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb')
+    try:
+        with fp:
+            for event, elem in ET.iterparse(fp, events=('start', 'end')):
+                if elem.tag != "calculation":
+                    if event == 'end' and depth > 0 and elem.tag in ('dos', 'eigenvalues', 'projected'):
+                        elem.clear()
+                    continue
+                if event == 'start':
+                    depth += 1
+                    continue
+                depth -= 1
+                energy = elem.find("energy")
+                scsteps = elem.findall("scstep")
+                if energy is not None:
+                    final = _vasprun_energies(energy)
+                    final_estep = _vasprun_energies(scsteps[-1].find("energy")) if len(scsteps) > 0 else {}
+                    if initial is None: initial = final
+                    nionic_steps += 1
+                elem.clear()
+    except ET.ParseError as e:
+        # a truncated vasprun.xml is from an unfinished run, whose energies are not the final ones
+        raise ValueError("{} is incomplete after {} ionic steps".format(filename, nionic_steps)) from e
+    if final is None:
+        raise ValueError("No ionic step is found in {}".format(filename))
+    # same as Vasprun.final_energy, for the bug of vasprun.xml in https://www.vasp.at/forum/viewtopic.php?f=3&t=16942
+    final_energy = final.get("e_0_energy", float("inf"))
+    try:
+        total_energy_bugfix = np.round(final_estep["e_0_energy"] - final_estep["e_fr_energy"] + final["e_fr_energy"], 8)
+        if np.abs(final_energy - total_energy_bugfix) > 1e-7:
+            final_energy = total_energy_bugfix
+    except KeyError:
+        pass
+    return {"initial": initial, "final": final, "final_energy": float(final_energy), "nionic_steps": nionic_steps}
+
+
+def read_vasprun_tdos(filename="vasprun.xml"):
+    """
+    Read the total DOS of the last calculation from vasprun.xml. The file is scanned line by line
+    and only the <dos><total> block is parsed as XML, the projected DOS, the eigenvalues and the
+    ionic steps are skipped without being parsed
+
+    Parameters
+    ----------
+        filename: str
+            vasprun.xml, or vasprun.xml.gz
+    Returns
+    -------
+        efermi: float
+            The Fermi energy, as pymatgen.io.vasp.outputs.Vasprun.tdos.efermi
+        energies: 1D array
+            The energies of the DOS
+        densities: 2D array
+            The total DOS of each spin, of shape (ispin, nedos)
+    """
+    import xml.etree.ElementTree as ET
+    block = None
+    lines = None
+    fp = gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb')
+    with fp:
+        for line in fp:
+            tag = line.strip()
+            if tag == b'<dos>':
+                lines = [line]
+            elif lines is not None:
+                lines.append(line)
+                if tag == b'</total>':
+                    lines.append(b'</dos>')
+                    block = lines
+                    lines = None
+    if block is None:
+        raise ValueError("No total DOS is found in {}".format(filename))
+    elem = ET.fromstring(b''.join(block))
+    nfield = len(elem.findall("total/array/field"))
+    data = [np.array(' '.join([r.text for r in spin.findall("r")]).split(), dtype=float).reshape(-1, nfield)
+        for spin in elem.findall("total/array/set/set")]
+    return float(elem.find("i[@name='efermi']").text), data[0][:,0], np.array([d[:,1] for d in data])
+
+
+def read_outcar_magnetization(filename="OUTCAR"):
+    """
+    Read the total magnetic moments of the ions in the last "magnetization (x)" table of OUTCAR,
+    the file is read backward until the table is found
+
+    Returns
+    -------
+        magmoms: list
+            The total magnetic moment of each ion, [] if OUTCAR has no magnetization
+    """
+    from monty.io import reverse_readfile
+    lines = []
+    for line in reverse_readfile(filename):
+        clean = line.strip()
+        if clean == "magnetization (x)":
+            break
+        lines.append(clean)
+    else:
+        return []
+    header = []
+    magmoms = []
+    for clean in reversed(lines):
+        if clean.startswith("# of ion"):
+            header = re.split(r"\s{2,}", clean.strip())
+            header.pop(0)
+        elif re.match(r"\s*(\d+)\s+(([\d\.\-]+)\s+)+", clean):
+            toks = [float(i) for i in re.findall(r"[\d\.\-]+", clean)]
+            toks.pop(0)
+            magmoms.append(dict(zip(header, toks))["tot"])
+        elif clean.startswith("tot"):
+            break
+    return magmoms
+
+
 def check_symmetry(tol_energy=0.025, tol_strain=0.05, tol_bond=0.10, site_properties=None):
     '''
     Check symmetry for vasp run. This should be run for each vasp run
@@ -857,10 +1091,9 @@ def check_symmetry(tol_energy=0.025, tol_strain=0.05, tol_bond=0.10, site_proper
                 final_energy_per_atom, symmetry_checks_passed, tolerances, failures, number_of_failures
     ------
     '''
-    # Get relevant files as pmg objects
+    # Get relevant files, only the energies and magnetization are read from vasprun.xml and OUTCAR
     incar = Incar.from_file("INCAR")
-    outcar = Outcar('OUTCAR')
-    vasprun = Vasprun("vasprun.xml")
+    energies = read_vasprun_energies("vasprun.xml")
     inp_struct = Structure.from_file("POSCAR")
     out_struct = Structure.from_file("CONTCAR")
 
@@ -868,7 +1101,7 @@ def check_symmetry(tol_energy=0.025, tol_strain=0.05, tol_bond=0.10, site_proper
         if 'magmom' in site_properties:
             in_mag = incar.as_dict()['MAGMOM']
             inp_struct.add_site_property('magmom', in_mag)
-            out_mag = [m['tot'] for m in outcar.magnetization]
+            out_mag = read_outcar_magnetization('OUTCAR')
             if len(out_mag)==0:
                 out_mag = copy.deepcopy(in_mag)
             out_struct.add_site_property('magmom', out_mag)
@@ -878,8 +1111,8 @@ def check_symmetry(tol_energy=0.025, tol_strain=0.05, tol_bond=0.10, site_proper
             out_struct.add_site_property(site_property, site_properties[site_property])
 
     current_isif = incar['ISIF']
-    initial_energy = float(vasprun.ionic_steps[0]['e_wo_entrp'])/len(inp_struct)
-    final_energy = float(vasprun.final_energy)/len(out_struct)
+    initial_energy = float(energies['initial']['e_wo_entrp'])/len(inp_struct)
+    final_energy = energies['final_energy']/len(out_struct)
 
     # perform all symmetry breaking checks
     failures = []
@@ -930,3 +1163,122 @@ def check_symmetry(tol_energy=0.025, tol_strain=0.05, tol_bond=0.10, site_proper
     }
     return symm_data
 
+
+
+def encode_array(array, vasp_db=None, dtype='float64', compression='gzip',
+                 gridfs_threshold=8*1024*1024, gridfs_collection='phonon_fs'):
+    """Encode a numpy array as compact binary to be stored in MongoDB
+
+    Args:
+        array (array): the data
+        vasp_db (VaspCalcDb): database used to store the payload in GridFS if it is large.
+            If None, the payload is always stored in the document
+        dtype (str): 'float64' or 'float32', stored as little-endian
+        compression (str): 'gzip', 'zstd' or None. zstd is opt-in since reading it back
+            requires zstandard, which is not a dependency of dfttk
+        gridfs_threshold (int): payloads larger than this number of bytes go to GridFS
+        gridfs_collection (str): the GridFS collection for the large payloads
+
+    Returns:
+        dict with the dtype, shape and compression of the data, which is read back by decode_array
+    """
+    data = np.asarray(array, dtype=np.dtype(dtype).newbyteorder('<'))
+    payload = data.tobytes()
+    if compression == 'zstd' and zstd is None:
+        warnings.warn("zstandard is not installed, the array is compressed by gzip")
+        compression = 'gzip'
+    if compression == 'gzip':
+        payload = gzip.compress(payload)
+    elif compression == 'zstd':
+        payload = zstd.ZstdCompressor().compress(payload)
+    elif compression is not None:
+        raise ValueError("Unknown compression {} for the array".format(compression))
+    d = {'dtype': data.dtype.str, 'shape': list(data.shape), 'compression': compression}
+    if vasp_db is not None and len(payload) > gridfs_threshold:
+        fs = gridfs.GridFS(vasp_db.db, gridfs_collection)
+        d['gridfs_id'] = fs.put(payload)
+        d['gridfs_collection'] = gridfs_collection
+    else:
+        d['data'] = payload
+    return d
+
+
+def decode_array(d, vasp_db=None):
+    """Read the array encoded by encode_array
+
+    Args:
+        d (dict): the encoded array
+        vasp_db (VaspCalcDb): database holding the GridFS payload, if any
+
+    Returns:
+        numpy array of float
+    """
+    if 'gridfs_id' in d:
+        if vasp_db is None:
+            raise ValueError("The array is stored in GridFS, vasp_db is needed to read it")
+        fs = gridfs.GridFS(vasp_db.db, d['gridfs_collection'])
+        payload = fs.get(d['gridfs_id']).read()
+    else:
+        payload = bytes(d['data'])
+    compression = d.get('compression')
+    if compression == 'gzip':
+        payload = gzip.decompress(payload)
+    elif compression == 'zstd':
+        if zstd is None:
+            raise ImportError("zstandard is needed to read the zstd compressed array")
+        payload = zstd.ZstdDecompressor().decompress(payload)
+    data = np.frombuffer(payload, dtype=np.dtype(d['dtype']))
+    return data.reshape(d['shape']).astype(float)
+
+
+def encode_force_constants(force_constants, vasp_db=None, dtype='float64', compression='gzip',
+                           gridfs_threshold=8*1024*1024, gridfs_collection='phonon_fs'):
+    """Encode the force constants as compact binary for the phonon collection
+
+    Args:
+        force_constants (array): force constants of shape (N, N, 3, 3)
+        vasp_db, dtype, compression, gridfs_threshold, gridfs_collection: see encode_array
+
+    Returns:
+        dict to be stored in the force_constants field, which is read back by decode_force_constants
+    """
+    return encode_array(force_constants, vasp_db=vasp_db, dtype=dtype, compression=compression,
+        gridfs_threshold=gridfs_threshold, gridfs_collection=gridfs_collection)
+
+
+def decode_force_constants(force_constants, vasp_db=None):
+    """Read the force constants stored in the phonon collection as a numpy array
+
+    Args:
+        force_constants: the force_constants field of the phonon document, either the dict
+            written by encode_force_constants or the nested lists of the old documents
+        vasp_db (VaspCalcDb): database holding the GridFS payload, if any
+
+    Returns:
+        numpy array of shape (N, N, 3, 3)
+    """
+    if not isinstance(force_constants, dict):
+        return np.array(force_constants)
+    return decode_array(force_constants, vasp_db=vasp_db)
+
+
+def metadata_filter(metadata):
+    """Return an index friendly query for documents whose metadata is exactly the given dict
+
+    The exact subdocument form {'metadata': {'tag': tag}} cannot use an index on metadata.tag,
+    so the equality on metadata.tag is added in front of it to select the documents by the index.
+
+    Args:
+        metadata (dict): metadata of the documents, e.g. {'tag': tag}
+
+    Returns:
+        dict to be used in the queries
+
+    Examples
+    --------
+    >>> metadata_filter({'tag': 'a'})
+    {'metadata.tag': 'a', 'metadata': {'tag': 'a'}}
+    """
+    if isinstance(metadata, dict) and 'tag' in metadata:
+        return {'metadata.tag': metadata['tag'], 'metadata': metadata}
+    return {'metadata': metadata}
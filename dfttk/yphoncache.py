@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed cache of the phonon DOS (vdos.out) produced by Yphon
+
+The cache key is the sha256 of the Yphon command line flags together with the bytes
+of the input files (superfij.out holding the Hessian, and dielecfij.out holding the
+Born effective charges and dielectric constants when present) and the identity of the
+Yphon executable (its path, size and mtime), so that a rebuilt Yphon does not reuse the
+results of the old one. Identical inputs therefore reuse the same vdos.out regardless
+of the directory, the phase, the user or the mtimes of the inputs. The entries are gzip
+compressed files in a shared root, and the least recently used entries are evicted once
+the root exceeds a size limit. The total size is kept in YPHON_CACHE_USAGE of the root,
+so that the entries are only walked when the limit is reached.
+"""
+
+import os
+import gzip
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+YPHON_CACHE_ENV = "DFTTK_YPHON_CACHE"
+YPHON_CACHE_SIZE_ENV = "DFTTK_YPHON_CACHE_SIZE"
+YPHON_CACHE_MAX_SIZE = 2*1024**3
+YPHON_CACHE_SUFFIX = ".vdos.gz"
+YPHON_CACHE_USAGE = "usage"
+
+
+def yphon_cache_root(root=None):
+    """
+    return the cache root, by order of the argument, the DFTTK_YPHON_CACHE environment variable
+    and ~/.dfttk/yphon_cache
+    """
+    if root is None:
+        root = os.environ.get(YPHON_CACHE_ENV, os.path.join("~", ".dfttk", "yphon_cache"))
+    return os.path.abspath(os.path.expanduser(root))
+
+
+def yphon_cache_max_size():
+    """return the size limit of the cache in bytes, DFTTK_YPHON_CACHE_SIZE overrides the default of 2 GB"""
+    return int(float(os.environ.get(YPHON_CACHE_SIZE_ENV, YPHON_CACHE_MAX_SIZE)))
+
+
+def yphon_executable_id(executable="Yphon"):
+    """
+    return the identity of the executable found in PATH as 'path:size:mtime', or the name itself
+    if it is not found
+    """
+    path = shutil.which(executable)
+    if path is None: return executable
+    path = os.path.realpath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path
+    return '{}:{}:{}'.format(path, st.st_size, st.st_mtime_ns)
+
+
+def yphon_cache_key(flags, inputs=('superfij.out', 'dielecfij.out'), executable="Yphon"):
+    """
+    hash the Yphon flags, the content of the input files and the identity of the Yphon executable
+
+    Parameters
+    ----------
+    flags : Yphon flags, without the input redirection
+    inputs : input files, those do not exist are skipped
+    executable : name of the Yphon executable, see yphon_executable_id, None to leave it out
+
+    Returns
+    -------
+    sha256 hex digest
+    """
+    h = hashlib.sha256()
+    h.update(' '.join(flags.split()).encode())
+    if executable is not None:
+        h.update(b'\0'+yphon_executable_id(executable).encode())
+    for fname in inputs:
+        if not os.path.exists(fname): continue
+        h.update(b'\0'+os.path.basename(fname).encode()+b'\0')
+        with open(fname, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1<<20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def yphon_cache_path(key, root=None):
+    return os.path.join(yphon_cache_root(root), key[0:2], key+YPHON_CACHE_SUFFIX)
+
+
+def yphon_cache_get(key, dest='vdos.out', root=None):
+    """
+    copy the cached phonon DOS into dest
+
+    Returns
+    -------
+    True if the key is found in the cache
+    """
+    fname = yphon_cache_path(key, root=root)
+    try:
+        with gzip.open(fname, 'rb') as fp, open(dest, 'wb') as out:
+            shutil.copyfileobj(fp, out)
+    except (FileNotFoundError, OSError, EOFError):
+        return False
+    #mtime marks the last use for the eviction
+    try:
+        os.utime(fname)
+    except OSError:
+        pass
+    return True
+
+
+def _read_cache_usage(root=None):
+    """return the total size of the cache recorded in YPHON_CACHE_USAGE, None if unknown"""
+    try:
+        with open(os.path.join(yphon_cache_root(root), YPHON_CACHE_USAGE)) as fp:
+            return int(fp.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache_usage(total, root=None):
+    root = yphon_cache_root(root)
+    fd, tmp = tempfile.mkstemp(dir=root, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(str(int(total)))
+        os.replace(tmp, os.path.join(root, YPHON_CACHE_USAGE))
+    except OSError:
+        if os.path.exists(tmp): os.remove(tmp)
+
+
+def yphon_cache_put(key, src='vdos.out', root=None, max_size=None):
+    """
+    store the phonon DOS in src into the cache and evict old entries if the cache is full
+
+    The recorded total size is updated by the size of the new entry, and the entries are only
+    walked by yphon_cache_prune when it exceeds max_size or is unknown. The concurrent updates
+    may miss some entries, the total is recounted exactly by each yphon_cache_prune
+    """
+    if not os.path.exists(src): return
+    fname = yphon_cache_path(key, root=root)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    #write to a temporary file first so that concurrent readers never see a partial entry
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname), suffix='.tmp')
+    try:
+        with open(src, 'rb') as fp, gzip.open(os.fdopen(fd, 'wb'), 'wb') as out:
+            shutil.copyfileobj(fp, out)
+        os.replace(tmp, fname)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    if max_size is None: max_size = yphon_cache_max_size()
+    total = _read_cache_usage(root=root)
+    if total is not None:
+        total += os.path.getsize(fname)
+        if total <= max_size:
+            _write_cache_usage(total, root=root)
+            return
+    yphon_cache_prune(max_size, root=root)
+
+
+def yphon_cache_entries(root=None):
+    """return list of (mtime, size, path) of the cache entries, oldest first"""
+    entries = []
+    for dirpath, _, files in os.walk(yphon_cache_root(root)):
+        for f in files:
+            if not f.endswith(YPHON_CACHE_SUFFIX): continue
+            fname = os.path.join(dirpath, f)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fname))
+    return sorted(entries)
+
+
+def yphon_cache_info(root=None):
+    """return the cache root, the number of entries and their total size in bytes"""
+    entries = yphon_cache_entries(root=root)
+    return yphon_cache_root(root), len(entries), sum([e[1] for e in entries])
+
+
+def yphon_cache_prune(max_size=0, root=None):
+    """
+    remove the least recently used entries until the cache is not larger than max_size bytes,
+    and record the total size of the remaining entries
+
+    Returns
+    -------
+    number of removed entries
+    """
+    entries = yphon_cache_entries(root=root)
+    total = sum([e[1] for e in entries])
+    nremoved = 0
+    for _, size, fname in entries:
+        if total <= max_size: break
+        try:
+            os.remove(fname)
+        except OSError:
+            continue
+        total -= size
+        nremoved += 1
+    if os.path.isdir(yphon_cache_root(root)): _write_cache_usage(total, root=root)
+    return nremoved
+
+
+def run_yphon(flags, voldir='.', has_Born=False, root=None, cache=True):
+    """
+    produce vdos.out in voldir by Yphon, reusing the cached result for identical inputs
+
+    Parameters
+    ----------
+    flags : Yphon flags, e.g. "-DebCut 0.5 -thr2 0.001"
+    voldir : directory with superfij.out (and dielecfij.out if has_Born)
+    has_Born : pass dielecfij.out to Yphon by -Born
+    root : cache root, see yphon_cache_root
+    cache : False to always run Yphon
+
+    Returns
+    -------
+    True if vdos.out is taken from the cache
+    """
+    cmd = "Yphon " + flags + " <superfij.out"
+    if has_Born: cmd += " -Born dielecfij.out"
+    inputs = [os.path.join(voldir, 'superfij.out')]
+    if has_Born: inputs.append(os.path.join(voldir, 'dielecfij.out'))
+    vdos = os.path.join(voldir, 'vdos.out')
+    if cache:
+        key = yphon_cache_key(flags + (" -Born" if has_Born else ""), inputs=inputs)
+        if yphon_cache_get(key, dest=vdos, root=root):
+            print("reuse cached vdos.out for", cmd, " at ", voldir)
+            return True
+    print(cmd, " at ", voldir)
+    output = subprocess.run(cmd, shell=True, cwd=voldir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+    if cache and output.returncode==0: yphon_cache_put(key, src=vdos, root=root)
+    return False
@@ -63,3 +63,26 @@ def test_DebyeModel():
         t_max=1000, eos="vinet", poisson=0.363615, bp2gru=2./3.)
     print (debye_model.D_vib)
     assert np.isclose(debye_model.D_vib, D_vib).all()
+
+
+@pytest.mark.DebyeModel
+def test_debye_functions():
+    from scipy.integrate import quad
+    from dfttk.analysis.debye import debye_function, debye_cv_function
+    y = np.array([1.e-3, 0.5, 1.999, 2.0, 3.0, 10.0, 50.0, 154.0, 200.0])
+    D = [3/x**3*quad(lambda t: t**3/np.expm1(t), 0, min(x, 155), epsabs=0, epsrel=1.e-13, limit=200)[0] for x in y]
+    C = [3/x**3*quad(lambda t: t**4*np.exp(t)/np.expm1(t)**2, 0, min(x, 155), epsabs=0, epsrel=1.e-13, limit=200)[0] for x in y]
+    assert np.allclose(debye_function(y), D, rtol=1.e-12, atol=0)
+    assert np.allclose(debye_cv_function(y), C, rtol=1.e-12, atol=0)
+
+
+@pytest.mark.DebyeModel
+def test_DebyeModel_grid():
+    T = np.linspace(0, 1000, 51)
+    debye_model = DebyeModel(energies, volumes, structure, T=T, eos="vinet", gruneisen_T0=None, gruneisen_T1=1.0)
+    assert len(set(debye_model.D_vib)) == len(volumes)
+    for v_idx, vol in enumerate(volumes):
+        for t_idx, temp in enumerate(T):
+            assert np.isclose(debye_model.F_vib[v_idx, t_idx], debye_model.vibrational_free_energy(temp, vol), rtol=1.e-6, atol=1.e-12)
+            assert np.isclose(debye_model.S_vib[v_idx, t_idx], debye_model.vibrational_entropy(temp, vol), rtol=1.e-6, atol=1.e-12)
+            assert np.isclose(debye_model.C_vib[v_idx, t_idx], debye_model.vibrational_heat_capacity(temp, vol), rtol=1.e-6, atol=1.e-12)
@@ -8,6 +8,7 @@ from pymatgen.analysis.eos import EOS
 from fireworks import Firework
 from atomate.vasp.config import VASP_CMD, DB_FILE
 import os
+import numpy as np
 
 head,tail = os.path.split(__file__)
 db_file = os.path.join(head,"db.json")
@@ -100,3 +101,25 @@ def test_EVcheck_QHA():
     wf = Firework(EVcheck_QHA(db_file=db_file,vasp_cmd=VASP_CMD,tag="test",metadata={}))
     #print(wf.as_dict())
 
+
+def test_eos_outlier_search():
+    volumes = list(np.linspace(60., 86., 14))
+    eos_fit = EOS('vinet').fit(volumes[:8], [-34.69037673, -34.88126365, -34.98844492, -35.02444959,
+        -34.99974727, -34.92873799, -34.8383195, -34.69550342])
+    energies = list(eos_fit.func(volumes))
+    energies[3] += 0.05
+    energies[10] -= 0.08
+    error, ind, fit, dropped = eos_outlier_search(volumes, energies, 1.e-6)
+    assert error <= 1.e-6
+    assert ind == [i for i in range(14) if i not in (3, 10)]
+    assert sorted([d['index'] for d in dropped]) == [3, 10]
+    assert fit.v0 == pytest.approx(eos_fit.v0, rel=1.e-4)
+
+def test_check_points():
+    proc = EVcheck_QHA()
+    volumes = [504.4854780252552, 534.1610477526048, 563.8366733894931, 593.512427132093, 623.1879003769909, 652.8636686613459, 682.5393342833485, 711.6214250632727, 740.703761424463, 769.7858059616457, 798.8678864247061]
+    energies = [-342.98343642, -344.38954914, -344.89492019, -344.80547287, -344.28500957, -343.47527914, -342.47536783, -341.31384393, -340.16711161, -339.67940075, -338.41924052]
+    proc.check_points("", "", 0.005, 14, 0.3, volumes, energies, False)
+    assert proc.correct and proc.error <= 0.005
+    assert len(proc.points) >= 4
+    assert sorted(proc.points + [d['index'] for d in proc.dropped]) == list(range(len(volumes)))
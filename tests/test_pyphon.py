@@ -0,0 +1,31 @@
+import io
+import numpy as np
+import pytest
+from dfttk import pyphon
+
+
+T = np.concatenate(([0.0, 0.01, 0.1, 1.0, 2.0, 5.0], np.arange(10, 2001, 10.)))
+
+
+def _vdos(natom=2, nfreq=2001):
+    freq = np.linspace(-0.2e12, 10e12, nfreq)
+    dos = np.where(freq>0, (freq/8e12)**2*(freq<8e12), 0) + 0.5*np.exp(-((freq-6e12)/0.5e12)**2)
+    dos *= 3*natom/np.trapz(dos, freq)
+    return ''.join(['{:.8e} {:.8e}\n'.format(x, y) for x, y in zip(freq, dos)])
+
+
+@pytest.mark.parametrize("energyunit", ['J', 'eV'])
+def test_caclf_batch(energyunit):
+    freq, pdos, quality, natom = pyphon.getdos(io.StringIO(_vdos()))
+    ref = np.array([pyphon.caclf(freq, pdos, t, energyunit=energyunit) for t in T]).T
+    prp = np.array(pyphon.caclf_batch(freq, pdos, T, energyunit=energyunit, nchunk=64))
+    assert prp.shape == ref.shape
+    assert np.array_equal(np.isnan(prp), np.isnan(ref))
+    ok = ~np.isnan(ref)
+    assert np.allclose(prp[ok], ref[ok], rtol=1.e-12, atol=0)
+
+
+def test_vibrational_contributions():
+    prp = pyphon.vibrational_contributions(T, dos_input=io.StringIO(_vdos()), energyunit='eV')
+    assert prp[-1] == 2
+    assert np.allclose(prp[3][-1], 6*pyphon.kB/pyphon.eV, rtol=1.e-2)
@@ -0,0 +1,473 @@
+import io
+import os
+import gzip
+import numpy as np
+import pytest
+from scipy.optimize import brentq
+from scipy.interpolate import splrep, splev
+from pymatgen.electronic_structure.core import Spin
+from pymatgen.electronic_structure.dos import Dos
+from dfttk.pythelec import runthelec, pregetdos, remesh, remesh_array, refdos, refdos_array
+from dfttk.pythelec import DosArrays, LazyDos, runthelec_pool, write_superfij
+from dfttk.pythelec import CenDif, CenDifB, SplineDifB
+from dfttk.pythelec import BMEOS, BMDifB, BMvol4, BMvol5, BMfitF, BMfitP, BMfitB
+from dfttk.pythelec import ltc_smooth, ltc_zigzag, thelecMDB, spline_interp, FvibTable, FVIB_ELE_COLUMNS
+from dfttk.analysis.ywutils import load_fvib, fvib_file, write_fvib_text
+
+
+T = np.arange(0, 2001, 50.)
+
+
+def _write_doscar(fname, nedos=3001, efermi=5.3, gap=0.0):
+    e = np.linspace(-10, 15, nedos)+efermi
+    x = e - efermi
+    dos = np.sqrt(np.clip(x+9.0, 0, None))*0.3 + 0.8*np.exp(-(x+2)**2) + 0.1*np.sin(3*x)**2
+    if gap > 0.0:
+        dos[(x>0.0) & (x<gap)] = 0.0
+    ados = np.cumsum(dos)*(e[1]-e[0])
+    with open(fname, 'w') as fp:
+        for i in range(5): fp.write('   {}\n'.format(i))
+        fp.write('{:>16.8f}{:>16.8f}{:5}{:>16.8f}{:>16.8f}\n'.format(e[-1], e[0], nedos, efermi, 1.0))
+        for i in range(nedos):
+            fp.write('{:>11.3f} {:>11.4e} {:>11.4e}\n'.format(e[i], dos[i], ados[i]))
+
+
+def _runthelec(doscar, batch):
+    with open(doscar) as fp:
+        return np.array(runthelec(0, 2000, 50, -100, 100, 0.0, 10001, 1000., 1,
+            _T=T, dos=fp, fout=io.StringIO(), batch=batch))
+
+
+@pytest.mark.thelec
+@pytest.mark.parametrize("gap", [0.0, 0.5, 1.2])
+def test_runthelec_batch(tmp_path, gap):
+    doscar = str(tmp_path / "DOSCAR")
+    _write_doscar(doscar, gap=gap)
+    ref = _runthelec(doscar, False)
+    prp = _runthelec(doscar, True)
+    assert prp.shape == ref.shape
+    assert np.allclose(prp, ref, rtol=1.e-8, atol=1.e-8)
+    #chemical potential and seebeck coefficient, which are sensitive to mu in the gap
+    assert np.allclose(prp[3], ref[3], rtol=1.e-8, atol=1.e-8)
+    assert np.allclose(prp[4], ref[4], rtol=1.e-8, atol=0.0)
+
+
+@pytest.mark.thelec
+@pytest.mark.parametrize("gaussian, dF, eBoF", [(1000., 0.0, -1.0), (100., 0.0, -1.0), (1000., 0.01, 1.2), (1000., 1.5, 1.2)])
+def test_remesh_array(gaussian, dF, eBoF):
+    ref = remesh(-100, 100, gaussian, dF, eBoF, 10001)
+    e = remesh_array(-100, 100, gaussian, dF, eBoF, 10001)
+    assert np.allclose(e, ref, rtol=0, atol=1.e-9)
+
+
+@pytest.mark.thelec
+@pytest.mark.parametrize("gap, dF", [(0.0, 0.0), (1.2, 0.0), (1.2, 0.3), (1.2, -0.2)])
+def test_refdos_array(tmp_path, gap, dF):
+    doscar = str(tmp_path / "DOSCAR")
+    _write_doscar(doscar, gap=gap)
+    with open(doscar) as fp:
+        edn, eup, vde, ve, tdos = pregetdos(fp)
+    eBoF = -1.0
+    if gap > 0.0:
+        eBoF = ve[np.nonzero((ve>0.0) & (tdos>0.0))[0][0]] - 0.5*vde
+    e = remesh(edn, eup, 1000., dF, eBoF, 10001)
+    ref = refdos(eBoF, dF, vde, edn, e, ve, tdos)
+    dos = refdos_array(eBoF, dF, vde, edn, e, ve, tdos)
+    assert np.allclose(dos, ref, rtol=1.e-12, atol=1.e-14)
+
+
+@pytest.mark.thelec
+def test_pregetdos(tmp_path):
+    doscar = str(tmp_path / "DOSCAR")
+    _write_doscar(doscar, gap=1.2)
+    with open(doscar, 'a') as fp: # projected DOS blocks which are not read
+        fp.write(' 15.3 -4.7 3001 5.3 1.0\n')
+        fp.write(' 1.000 0.1000E-01 0.2000E-01\n'*3001)
+    with open(doscar) as fp:
+        ref = pregetdos(fp)
+    with open(doscar, 'rb') as fp, gzip.open(doscar+".gz", 'wb') as gz:
+        gz.write(fp.read())
+    assert len(ref[3]) == 3001
+    for prp in (pregetdos(doscar), pregetdos(doscar+".gz")):
+        for x, y in zip(prp, ref):
+            assert np.array_equal(x, y)
+
+
+@pytest.mark.thelec
+def test_pregetdos_spin(tmp_path):
+    doscar = str(tmp_path / "DOSCAR")
+    _write_doscar(doscar)
+    with open(doscar) as fp:
+        lines = fp.readlines()
+    with open(doscar+".spin", 'w') as fp:
+        fp.writelines(lines[:6])
+        for l in lines[6:]:
+            e, dos, ados = [float(x) for x in l.split()]
+            fp.write('{:>11.3f} {:>11.4e} {:>11.4e} {:>11.4e} {:>11.4e}\n'.format(e, 0.75*dos, 0.25*dos, ados, ados))
+    ref = pregetdos(doscar)
+    prp = pregetdos(doscar+".spin")
+    assert np.allclose(prp[4], ref[4], rtol=1.e-3)
+    assert np.array_equal(prp[3], ref[3])
+
+
+@pytest.mark.thelec
+def test_pregetdos_wien2k(tmp_path):
+    dosfile = str(tmp_path / "case.dos1ev")
+    e = np.linspace(-12, 10, 2001)
+    with open(dosfile, 'w') as fp:
+        fp.write('#  BAND STRUCTURE\n')
+        fp.write('#EF=  0.45000 DELTA=   0.00050 NENRG=  2001  NDOS= 1\n')
+        fp.write('# ENERGY   total-DOS\n')
+        for x in e:
+            fp.write('{:12.5f} {:12.5f}\n'.format(x, abs(np.sin(x))))
+    edn, eup, vde, ve, dos = pregetdos(dosfile)
+    assert (edn, eup) == (-12.0, 10.0)
+    assert np.allclose(dos, abs(np.sin(e)), atol=1.e-5)
+
+
+@pytest.mark.thelec
+def test_runthelec_pool(tmp_path):
+    doscar = str(tmp_path / "DOSCAR")
+    _write_doscar(doscar)
+    with open(doscar) as fp:
+        data = np.loadtxt(fp, skiprows=6)
+    doses = [doscar, DosArrays(Dos(5.3, data[:,0], {Spin.up: 1.1*data[:,1]}))]
+    jobs = []
+    for i, dos in enumerate(doses):
+        jobs.append((i, (0, 2000, 50, -100, 100, 0.0, 10001, 1000., 1), dict(dos=dos, _T=T, fout=io.StringIO())))
+    theall = runthelec_pool(jobs, len(T), len(doses), 2)
+    for i, dos in enumerate(doses):
+        ref = runthelec(0, 2000, 50, -100, 100, 0.0, 10001, 1000., 1, _T=T, dos=dos, fout=io.StringIO())
+        assert np.array_equal(theall[:,:,i], np.array(ref))
+
+
+@pytest.mark.parametrize("dtype, compression", [('float64', 'gzip'), ('float32', None)])
+def test_dos_arrays(tmp_path, dtype, compression):
+    e = np.linspace(-5, 5, 11)
+    dos = Dos(0.5, e, {Spin.up: np.abs(e), Spin.down: 2*np.abs(e)})
+    dosa = DosArrays(dos)
+    assert dosa.ispin == 2
+    assert np.array_equal(dosa.densities[1], 2*np.abs(e))
+    assert np.allclose(dosa.get_densities(), dos.get_densities())
+    d = DosArrays.from_dict(dosa.as_dict(dtype=dtype, compression=compression))
+    assert d.efermi == 0.5 and d.ispin == 2
+    #the default must be readable on any host, i.e. not zstd
+    assert dosa.as_dict()['densities']['compression'] == 'gzip'
+    assert np.allclose(d.get_densities(), dos.get_densities())
+    dosa.to_npz(str(tmp_path / "dos.npz"))
+    d = DosArrays.from_npz(str(tmp_path / "dos.npz"))
+    assert np.array_equal(d.densities, dosa.densities) and np.array_equal(d.energies, e)
+
+
+def test_lazy_dos():
+    calls = []
+    def loader():
+        calls.append(1)
+        return DosArrays(efermi=0.0, energies=[0.0, 1.0], densities=[[1.0, 2.0]])
+    dos = LazyDos(loader)
+    assert calls == []
+    assert dos.efermi == 0.0
+    assert np.array_equal(dos.get_densities(), [1.0, 2.0])
+    assert len(dos.energies) == 2
+    assert calls == [1]
+
+
+@pytest.mark.thelec
+def test_runthelec_npz(tmp_path):
+    doscar = str(tmp_path / "DOSCAR")
+    _write_doscar(doscar)
+    data = np.loadtxt(doscar, skiprows=6)
+    dos = Dos(5.3, data[:,0], {Spin.up: data[:,1]})
+    DosArrays(dos).to_npz(str(tmp_path / "dos.npz"))
+    ref = runthelec(0, 2000, 50, -100, 100, 0.0, 10001, 1000., 1, _T=T, dos=dos, fout=io.StringIO())
+    prp = runthelec(0, 2000, 50, -100, 100, 0.0, 10001, 1000., 1, _T=T, dos=str(tmp_path / "dos.npz"), fout=io.StringIO())
+    assert np.array_equal(np.array(prp), np.array(ref))
+
+
+@pytest.mark.parametrize("kind", ['cubic', 'UnivariateSpline'])
+def test_spline_difb(kind):
+    vol = np.linspace(60, 80, 9)
+    T = np.arange(0, 1000, 100.)
+    F = np.array([0.05*(vol-68-0.01*t)**2 + 1.e-4*(vol-70)**3 - 1.e-4*t*vol for t in T]).T
+    S = np.array([0.01*np.log(vol)*t for t in T]).T
+    blat, v, ff, dSdV = SplineDifB(vol, F, S, kind=kind)
+    for j in range(len(T)):
+        b0, v0, f0 = CenDifB(vol, F[:,j], kind=kind)
+        assert v[j] == pytest.approx(v0, abs=1.e-4)
+        assert blat[j] == pytest.approx(b0, rel=1.e-5)
+        assert ff[j] == pytest.approx(f0, abs=1.e-5)
+        assert dSdV[j] == pytest.approx(CenDif(v0, vol, S[:,j], kind=kind), abs=1.e-6)
+        assert SplineDifB(vol, F[:,j], kind=kind)[0:3] == (blat[j], v[j], ff[j])
+    #no minimum inside
+    assert SplineDifB(vol, -vol, kind=kind)[0:3] == (-1.0, -1.0, 0.0)
+
+
+@pytest.mark.parametrize("BMfunc", [BMvol4, BMvol5])
+def test_bm_eos(BMfunc):
+    vol = np.linspace(60, 80, 9)
+    T = np.arange(0, 1000, 100.)
+    F = np.array([0.05*(vol-68-0.01*t)**2 + 1.e-4*(vol-70)**3 - 1.e-4*t*vol for t in T]).T
+    eos = BMEOS(vol, F, BMfunc)
+    blat, v, ff, pp = BMDifB(vol, F, BMfunc)
+    for j in range(len(T)):
+        assert eos.F(vol[:,None])[:,j] == pytest.approx(BMfitF(vol, vol, F[:,j], BMfunc))
+        assert eos.column(j).dFdV(vol) == pytest.approx(BMfitP(vol, vol, F[:,j], BMfunc))
+        assert eos.column(j).B(vol) == pytest.approx(BMfitB(vol, vol, F[:,j], BMfunc)[0])
+        #the previous root finding on the refitted polynomials
+        xx = np.linspace(60, 80, 1000)
+        idx = np.argmin(BMfitF(xx, vol, F[:,j], BMfunc))
+        v0 = brentq(BMfitP, xx[idx-1], xx[idx+1], args=(vol, F[:,j], BMfunc))
+        assert v[j] == pytest.approx(v0, abs=1.e-8)
+        assert blat[j] == pytest.approx(BMfitB(v0, vol, F[:,j], BMfunc)[0], rel=1.e-8)
+        assert ff[j] == pytest.approx(BMfitF(v0, vol, F[:,j], BMfunc), abs=1.e-8)
+        assert pp[j] == pytest.approx(0, abs=1.e-10)
+        assert BMDifB(vol, F[:,j], BMfunc) == pytest.approx((blat[j], v[j], ff[j], pp[j]))
+    assert eos.P(v) == pytest.approx(-pp)
+    #no minimum inside
+    assert BMDifB(vol, -vol, BMfunc) == (-1.0, -1.0, 0.0, 0.0)
+
+
+def _ltc_smooth_loop(T, b0, b1, blat):
+    def dot(i, b):
+        dx0, dx1, dy0, dy1 = T[i]-T[i-1], T[i+1]-T[i], b[i]-b[i-1], b[i+1]-b[i]
+        return (dx0*dx1+dy0*dy1)/np.sqrt(dx0*dx0+dy0*dy0)/np.sqrt(dx1*dx1+dy1*dy1)
+    b0, b1 = list(b0), list(b1)
+    for ii in range(32):
+        for i in range(1, len(T)-1):
+            if blat[i] < 0 or blat[i+1] < 0: break
+            tused = b0[i] if abs(dot(i, b0)) >= abs(dot(i, b1)) else b1[i]
+            b0[i] = b1[i] = tused
+    return np.array(b0)
+
+
+def test_ltc_smooth():
+    np.random.seed(1)
+    T = np.arange(0, 2000, 10.)
+    blat = np.ones(len(T))
+    blat[150] = -1
+    for scale in (1.e-7, 1.e-6, 1.e-5):
+        b0 = 3.e-5*(1-np.exp(-T/300)) + scale*np.random.randn(len(T))
+        b1 = 3.e-5*(1-np.exp(-T/300)) + scale*np.random.randn(len(T))
+        ref = _ltc_smooth_loop(T, b0, b1, blat)
+        beta = ltc_smooth(T, b0, b1, blat)
+        assert np.array_equal(beta, ref)
+        zigzag = 0
+        for i in range(1, len(T)-1):
+            if blat[i] < 0 or blat[i+1] < 0: break
+            if beta[i] < 1.e-6: continue
+            if (beta[i]-beta[i-1])*(beta[i+1]-beta[i]) < 0.0: zigzag += 1
+        assert ltc_zigzag(beta, blat) == zigzag
+
+
+def test_find_fitting_quality():
+    prp = thelecMDB.__new__(thelecMDB)
+    prp.natoms = 2
+    prp.volumes = np.linspace(60, 80, 9)
+    prp.T = np.arange(0, 1000, 50.)
+    prp.blat = np.ones(len(prp.T))
+    prp.blat[-3] = -1
+    prp.volT = 66 + 0.01*prp.T
+    xx = np.linspace(60, 80, 1000)
+    fitted = np.array([0.05*(xx-66-0.01*t)**2 - 1.e-4*t*xx for t in prp.T])
+    orig = np.array([0.05*(prp.volumes-66-0.01*t)**2 - 1.e-4*t*prp.volumes + 1.e-3*np.sin(prp.volumes+t)
+        for t in prp.T])
+    #the previous linear scan
+    nT = list(prp.blat).index(-1)
+    vn, vx = min(prp.volT[0:nT]), max(prp.volT[0:nT])
+    ix = [i for i,v in enumerate(prp.volumes) if v > vn][0]
+    n, q, qmax, qT, qmaxT = 0, 0.0, 0.0, 0.0, 0.0
+    for i in range(ix-1, len(prp.volumes)):
+        n += 1
+        for k,t in enumerate(prp.T):
+            for j in range(len(xx)-1):
+                if (xx[j]-prp.volumes[i])*(xx[j+1]-prp.volumes[i]) < 0:
+                    w = (prp.volumes[i]-xx[j])/(xx[j+1]-xx[j])
+                    fn0 = fitted[0][j]+w*(fitted[0][j+1]-fitted[0][j])
+                    fn = fitted[k][j]+w*(fitted[k][j+1]-fitted[k][j])
+                    q += abs(fn-orig[k][i])
+                    qmax = max(qmax, abs(fn-orig[k][i]))
+                    if k!=0:
+                        qT += abs((fn-orig[k][i]-fn0+orig[0][i])/t)
+                        qmaxT = max(qmaxT, abs((fn-orig[k][i]-fn0+orig[0][i])/t))
+                    break
+        if prp.volumes[i] > vx: break
+    readme = {}
+    prp.find_fitting_quality(xx, orig, fitted, readme)
+    assert readme['Helmholtz energy quality'] == '+-{:.1e} eV'.format(q/(n*len(prp.T)*prp.natoms))
+    assert readme['Helmholtz energy max error'] == '{:.1e} eV'.format(qmax/prp.natoms)
+    assert readme['Entropy quality'] == '{:.1e} J/K'.format(qT/(n*(len(prp.T)-1)*prp.natoms)*96484)
+    assert readme['Entropy max error'] == '{:.1e} J/K'.format(qmaxT/prp.natoms*96484)
+    assert list(prp.quality_volumes(nT)) == list(range(ix-1, i+1))
+
+
+@pytest.mark.parametrize("nV", [4, 5, 9])
+def test_spline_interp(nV):
+    np.random.seed(2)
+    x = np.sort(np.random.uniform(60, 80, nV))
+    Y = np.random.randn(nV, 3, 3)
+    xnew = np.linspace(58, 82, 50)
+    for der in (0, 1):
+        val = spline_interp(x, Y, xnew, der=der)
+        assert val.shape == (50, 3, 3)
+        for i in range(3):
+            for j in range(3):
+                assert val[:,i,j] == pytest.approx(splev(xnew, splrep(x, Y[:,i,j]), der=der), rel=1.e-10)
+    W = spline_interp(x, np.eye(nV), xnew)
+    assert W @ Y[:,0,0] == pytest.approx(spline_interp(x, Y[:,0,0], xnew), rel=1.e-12)
+
+
+def test_calc_uniform(tmp_path):
+    prp = thelecMDB.__new__(thelecMDB)
+    prp.T = np.arange(0, 1000, 10.)
+    prp.volT = 66 + 0.01*prp.T + 1.e-6*prp.T**2
+    volumes = [60., 63., 67., 72., 80.]
+    Tu = np.arange(0, 1200, 100.)
+    uniform = [np.array([[0.01*v] + [t] + [np.sin(v*c+t) for c in range(18)] for t in Tu]) for v in volumes]
+    outf = str(tmp_path / "uniform_tau")
+    prp.calc_uniform(volumes, uniform, outf)
+    rows = np.loadtxt(outf)
+    assert len(rows) == 10
+    for i,row in enumerate(rows):
+        vol = splev(Tu[i], splrep(prp.T, prp.volT))
+        ref = [float(splev(vol, splrep(volumes, [u[i,j] for u in uniform]))) for j in range(20)]
+        assert list(row) == pytest.approx(ref, rel=1.e-5, abs=1.e-5)
+
+
+def test_fvib_table(tmp_path):
+    np.random.seed(3)
+    rows = np.random.randn(20, len(FVIB_ELE_COLUMNS))
+    rows[:,0] = np.arange(20)*10.
+    text = str(tmp_path / "text" / "fvib_ele")
+    binary = str(tmp_path / "npz" / "fvib_ele")
+    for fname, fmt in ((text, 'text'), (binary, 'npz')):
+        os.mkdir(os.path.dirname(fname))
+        with FvibTable(fname, FVIB_ELE_COLUMNS, fmt=fmt, qhamode='phonon') as fvib:
+            fvib.write('#Found quasiharmonic mode : phonon\n')
+            for row in rows: fvib.add_row(*row)
+    assert not os.path.exists(text+'.npz')
+    assert not os.path.exists(binary)
+    data, info = load_fvib(text)
+    assert info == {}
+    assert np.array_equal(data, rows)
+    data, info = load_fvib(binary)
+    assert np.array_equal(data, rows)
+    #mapped from the file rather than read
+    assert isinstance(data.base, np.memmap)
+    assert info['columns'][0] == 'T' and info['units'][0] == 'K'
+    assert info['attrs']['qhamode'] == 'phonon'
+    #text on demand, the same as the text output
+    write_fvib_text(binary)
+    with open(binary) as fp, open(text) as ref:
+        assert fp.read() == ref.read()
+    #the newer of the two is used
+    os.utime(binary+'.npz', (0, 0))
+    assert fvib_file(binary) == binary
+    os.remove(binary)
+    assert fvib_file(binary) == binary+'.npz'
+    assert fvib_file(str(tmp_path / "fvib_ele")) is None
+    #csv copies
+    prp = thelecMDB.__new__(thelecMDB)
+    prp.datasm(text)
+    csv = np.loadtxt(text+'.csv', delimiter=',')
+    assert np.array_equal(csv, rows)
+    sm = np.loadtxt(text+'_sm.csv', delimiter=',')
+    assert np.array_equal(sm[:,0], rows[:,0])
+
+
+def test_write_superfij():
+    np.random.seed(0)
+    natoms, natom, factor = 8, 2, 0.5
+    fc = np.random.randn(natoms, natoms, 3, 3)
+    poscar = ['Fe', '1.0'] + ['{} 0 0'.format(i) for i in range(3)] + ['Fe', str(natoms), 'direct'] \
+        + ['0 0 {}'.format(i) for i in range(natoms)] + ['']
+    out = io.StringIO()
+    write_superfij(out, poscar, poscar, natom, fc, factor)
+    lines = out.getvalue().split('\n')
+    assert lines[6] == '{} {}'.format(natoms, natoms//natom)
+    assert lines[7:natoms+8] == poscar[7:natoms+8]
+    hessian = np.array([[float(x) for x in line.split()] for line in lines[natoms+8:-1]])
+    for ii in range(natoms):
+        for jj in range(natoms):
+            for x in range(3):
+                for y in range(3):
+                    assert hessian[ii*3+x, jj*3+y] == -fc[ii,jj,x,y]*factor
+
+
+class _FakeCollection():
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        ids = query['files_id']['$in']
+        return [d for d in self.docs if d['files_id'] in ids]
+
+
+class _FakeVaspDb():
+    """stand-in for VaspCalcDb holding the DOS of the calculations in dos_fs.chunks"""
+    _maggma_store_type = None
+
+    def __init__(self, dos):
+        self.db = {'dos_fs.chunks': _FakeCollection(dos)}
+
+
+def _static_docs(tag):
+    from pymatgen.core import Structure, Lattice
+    docs = []
+    # (volume scale, energy, metadata, adopted)
+    for k, (a, e, metadata, adopted) in enumerate([(4.10, -3.70, {'tag':tag}, True),
+        (3.95, -3.72, {'tag':tag}, True), (4.00, -3.75, {'tag':tag}, True),
+        (4.00, -3.75, {'tag':tag}, True), (4.30, -3.50, {'tag':tag, 'x':1}, True)]):
+        st = Structure(Lattice.cubic(a), ['Al'], [[0, 0, 0]], site_properties={'magmom':[0.0]})
+        docs.append({'task_id':k, 'metadata':metadata, 'adopted':adopted,
+            'orig_inputs':{'kpoints':{'kpoints':[[8, 8, 8]]}},
+            'input':{'structure':st.as_dict(), 'incar':{'ENCUT':520}},
+            'output':{'energy':e, 'structure':st.as_dict(), 'bandgap':0.0,
+                'stress':[[k, 0, 0], [0, k, 0], [0, 0, k]]},
+            'dos_fs_id':'fs{}'.format(k), 'vasp_version':'5.4.4'})
+    return docs
+
+
+def test_get_static_calculations():
+    import json
+    import zlib
+    from pymatgen.core import Structure
+    from dfttk.pythelec import get_static_calculations
+    from dfttk.analysis.ywutils import static_record, get_rec_from_metatag
+    tag = 'a-tag'
+    docs = _static_docs(tag)
+    rec = static_record(docs, tag)
+    assert np.all(np.diff(rec['volumes']) >= 0)
+    assert rec['task_ids'] == [1, 2, 3, 0, 4]
+    assert list(rec['constrained']) == [False]*4+[True]
+    assert rec['vasp_versions'] == ['5.4.4']*5
+
+    chunks = []
+    for d in docs:
+        st = Structure.from_dict(d['output']['structure'])
+        dos = {'efermi':1.0, 'energies':[0.0, 1.0, 2.0], 'densities':{'1':[0.0, d['task_id'], 0.0]},
+            'structure':st.as_dict(), 'pdos':[]}
+        data = zlib.compress(json.dumps(dos).encode())
+        #split in two chunks returned out of order
+        chunks += [{'files_id':d['dos_fs_id'], 'n':1, 'data':data[10:]},
+                   {'files_id':d['dos_fs_id'], 'n':0, 'data':data[:10]}]
+    volumes, energies, dos_objs, _calc = get_static_calculations(_FakeVaspDb(chunks), tag, rec=rec)
+    #the constrained calculation fills the uneven volume spacing
+    assert np.allclose(volumes, [3.95**3, 4.0**3, 4.1**3, 4.3**3])
+    assert np.allclose(energies, [-3.72, -3.75, -3.70, -3.50])
+    assert all([isinstance(d, DosArrays) for d in dos_objs])
+    assert [d.get_densities()[1] for d in dos_objs] == [1, 2, 0, 4]
+    assert _calc['task_id'] == 4
+
+    #the compact total DOS stored with the task is used without reading GridFS
+    for d in docs:
+        d['tdos'] = DosArrays(efermi=1.0, energies=[0.0, 1.0, 2.0], densities=[[0.0, 10+d['task_id'], 0.0]]).as_dict()
+    rec = static_record(docs, tag)
+    volumes, energies, dos_objs, _calc = get_static_calculations(_FakeVaspDb([]), tag, rec=rec)
+    assert all([isinstance(d, LazyDos) for d in dos_objs])
+    assert [d.get_densities()[1] for d in dos_objs] == [11, 12, 10, 14]
+
+    EV, POSCAR, INCAR = get_rec_from_metatag(None, tag, rec=rec)
+    assert np.allclose(EV['volumes'], volumes)
+    assert np.allclose(EV['pressures'], [1, 2, 0, 4])
+    assert EV['kpoints'] == [[8, 8, 8]] and INCAR == {'ENCUT':520}
+    assert len(EV['magmoms']) == 4
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from pymatgen.core import Structure
+from dfttk.analysis.quasiharmonic import Quasiharmonic
+
+
+POSCAR_STR = """fcc Al
+4.10
+0 .5 .5
+.5 0 .5
+.5 .5 0
+Al
+1
+direct
+0.000000 0.000000 0.000000 Al"""
+structure = Structure.from_str(POSCAR_STR, fmt='POSCAR')
+energies = [-3.62297814, -3.69619945, -3.73411839, -3.74537143, -3.73636044, -3.71218262, -3.676796, -3.63402384]
+volumes = [14.004168009146943, 14.827947688018714, 15.651725983766324, 16.47548996484071, 17.29925450808183, 18.12305110099911, 18.946820774727207, 19.754109316522513]
+vib_kwargs = {'gruneisen_T0': None, 'gruneisen_T1': 1.0}
+
+
+def _polyfit_optimizer(qha):
+    """G_opt and V_opt of each temperature by fitting the batch polynomial column by column"""
+    x = qha.volumes**(-1./3.)
+    G_opt, V_opt = [], []
+    for j in range(qha.G.shape[1]):
+        p = np.polynomial.Polynomial.fit(x, qha.G[:,j], qha.batch_order-1).convert()
+        roots = p.deriv().roots()
+        roots = roots[(abs(roots.imag) < 1.e-12) & (roots.real >= x.min()) & (roots.real <= x.max())].real
+        roots = roots[p.deriv(2)(roots) > 0.0]
+        xopt = roots[np.argmin(p(roots))]
+        G_opt.append(p(xopt))
+        V_opt.append(xopt**(-3.))
+    return np.array(G_opt), np.array(V_opt)
+
+
+def test_batch_optimizer():
+    qha_batch = Quasiharmonic(energies, volumes, structure, t_min=5, t_step=5, t_max=800, vib_kwargs=vib_kwargs, batch=True)
+    G_opt, V_opt = qha_batch.batch_optimizer()
+    assert np.isfinite(V_opt).all()
+    G_ref, V_ref = _polyfit_optimizer(qha_batch)
+    assert np.allclose(V_opt, V_ref, rtol=1.e-8, atol=0.0)
+    assert np.allclose(G_opt, G_ref, rtol=1.e-8, atol=0.0)
+    assert np.allclose(qha_batch.optimum_volumes, V_ref, rtol=1.e-8, atol=0.0)
+    assert np.allclose(qha_batch.gibbs_free_energy, G_ref, rtol=1.e-8, atol=0.0)
+
+
+def test_batch_optimizer_fallback():
+    qha = Quasiharmonic(energies, volumes, structure, t_min=5, t_step=50, t_max=800, vib_kwargs=vib_kwargs)
+    qha_batch = Quasiharmonic(energies, volumes, structure, t_min=5, t_step=50, t_max=800, vib_kwargs=vib_kwargs,
+        batch=True, batch_tol=0.0)
+    assert qha_batch.optimum_volumes == qha.optimum_volumes
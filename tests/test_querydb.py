@@ -0,0 +1,52 @@
+from dfttk.scripts import querydb
+
+
+class _FakeCollection():
+    def __init__(self):
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+
+    def index_information(self):
+        return self.indexes
+
+    def create_index(self, keys, name=None, background=True):
+        self.indexes[name] = {'key': keys}
+        return name
+
+    def find(self, query):
+        return self
+
+    def explain(self):
+        if len(self.indexes) > 1:
+            plan = {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}
+        else:
+            plan = {'stage': 'COLLSCAN'}
+        return {'queryPlanner': {'winningPlan': plan}}
+
+
+class _FakeVaspDb():
+    host, port, db_name = 'localhost', 27017, 'fake'
+
+    def __init__(self):
+        self.db = {c: _FakeCollection() for c in querydb.DFTTK_INDEXES}
+
+
+def test_ensure_indexes():
+    vasp_db = _FakeVaspDb()
+    nindexes = sum([len(v) for v in querydb.DFTTK_INDEXES.values()])
+    assert len(querydb.missing_indexes(vasp_db)) == nindexes
+    created = querydb.ensure_indexes(vasp_db)
+    assert len(created) == nindexes
+    assert ('tasks', 'metadata.tag_1_adopted_1') in created
+    assert querydb.missing_indexes(vasp_db) == []
+    assert querydb.ensure_indexes(vasp_db) == []
+
+
+def test_explain_queries():
+    vasp_db = _FakeVaspDb()
+    report = querydb.explain_queries(vasp_db, tag='abc')
+    assert all([r[3] for r in report])
+    assert report[0][1] == {'$and': [{'metadata.tag': 'abc'}, {'adopted': True}]}
+    querydb.ensure_indexes(vasp_db)
+    report = querydb.explain_queries(vasp_db, tag='abc')
+    assert not any([r[3] for r in report])
+    assert report[0][2] == ['FETCH', 'IXSCAN']
@@ -0,0 +1,99 @@
+import os
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+from dfttk.pythelec import FvibTable, FVIB_ELE_COLUMNS
+import dfttk.scripts.run_dfttk_ext as run_dfttk_ext
+
+
+def _touch(fname, text=""):
+    with open(fname, "w") as fp:
+        fp.write(text)
+
+
+def test_thelec_up_to_date(tmp_path):
+    phase = str(tmp_path / "Al_Fm-3m_225")
+    os.mkdir(phase)
+    assert not run_dfttk_ext.thelec_up_to_date(phase)
+    _touch(os.path.join(phase, "fvib_ele"))
+    _touch(os.path.join(phase, "readme"))
+    assert run_dfttk_ext.thelec_up_to_date(phase)
+    assert run_dfttk_ext.thelec_status(phase) == 'ok'
+    assert run_dfttk_ext.thelec_status(phase, start=datetime.now()-timedelta(minutes=1)) == 'ok'
+    #readme left from an earlier run
+    assert run_dfttk_ext.thelec_status(phase, start=datetime.now()+timedelta(minutes=1)) == 'nodata'
+    #thermodynamic file rewritten after the readme by an unfinished run
+    os.utime(os.path.join(phase, "readme"), (0, 0))
+    assert not run_dfttk_ext.thelec_up_to_date(phase)
+    os.utime(os.path.join(phase, "readme"), None)
+    _touch(os.path.join(phase, "ERROR"))
+    assert not run_dfttk_ext.thelec_up_to_date(phase)
+    assert run_dfttk_ext.thelec_status(phase) == 'error'
+
+
+def test_thfind_job(tmp_path, monkeypatch):
+    cwd = os.getcwd()
+    os.chdir(str(tmp_path))
+    try:
+        calls = []
+        def fake_thelec(args, vasp_db=None):
+            calls.append((args.metatag, args.phasename, args.jobs, vasp_db))
+            print("processing", args.phasename)
+            if args.phasename == "bad": raise ValueError("no data")
+            os.mkdir(args.phasename)
+            _touch(os.path.join(args.phasename, "readme"))
+        monkeypatch.setattr(run_dfttk_ext, "ext_thelec", fake_thelec)
+        args = argparse.Namespace(jobs=4, metatag=None, phasename=None, fvib_text=False)
+        summary = [run_dfttk_ext.thfind_job((args, "tag1", "good", None, "logs")),
+                   run_dfttk_ext.thfind_job((args, "tag2", "bad", None, "logs"))]
+        assert calls == [("tag1", "good", 1, None), ("tag2", "bad", 1, None)]
+        assert args.jobs == 4 and args.metatag is None
+        assert [s[2] for s in summary] == ['ok', 'failed']
+        assert summary[1][4] == "ValueError: no data"
+        with open(os.path.join("logs", "bad.log")) as fp:
+            log = fp.read()
+        assert "processing bad" in log and "Traceback" in log
+        run_dfttk_ext.write_thfind_summary(summary)
+        with open("thfind_summary.txt") as fp:
+            lines = fp.readlines()
+        assert "2 phases, 1 failed" in lines[0]
+        assert lines[3].split()[0:1] == ['failed']
+    finally:
+        os.chdir(cwd)
+
+
+def test_thfind_run(tmp_path, monkeypatch):
+    cwd = os.getcwd()
+    os.chdir(str(tmp_path))
+    try:
+        def fake_thelec(args, vasp_db=None):
+            if args.phasename == "exit": raise SystemExit()
+        monkeypatch.setattr(run_dfttk_ext, "ext_thelec", fake_thelec)
+        #the readme from an earlier run is not taken as the result of this run
+        os.mkdir("stale")
+        _touch(os.path.join("stale", "readme"))
+        os.utime(os.path.join("stale", "readme"), (0, 0))
+        args = argparse.Namespace(jobs=1, metatag=None, phasename="stale", fvib_text=False)
+        assert run_dfttk_ext.thfind_run(args, "tag1", "stale")[2] == 'nodata'
+        args.phasename = "exit"
+        res = run_dfttk_ext.thfind_run(args, "tag2", "exit")
+        assert res[2] == 'failed' and res[4].startswith("SystemExit")
+    finally:
+        os.chdir(cwd)
+
+
+def test_thelec_fvib_text(tmp_path):
+    phase = str(tmp_path / "Al_Fm-3m_225")
+    os.mkdir(phase)
+    rows = np.linspace(1.0, 2.0, 20*len(FVIB_ELE_COLUMNS)).reshape(20, -1)
+    with FvibTable(os.path.join(phase, "fvib_ele"), FVIB_ELE_COLUMNS, fmt='npz') as fvib:
+        fvib.write('#Found quasiharmonic mode : phonon\n')
+        for row in rows: fvib.add_row(*row)
+    parser = argparse.ArgumentParser()
+    run_dfttk_ext.shared_aguments(parser)
+    args = parser.parse_args(["-fvibtext", "-pn", phase])
+    run_dfttk_ext.ext_thelec(args)
+    text = os.path.join(phase, "fvib_ele")
+    assert np.array_equal(np.loadtxt(text), rows)
+    assert np.array_equal(np.loadtxt(text+'.csv', delimiter=','), rows)
+    assert os.path.exists(text+'_sm.csv')
@@ -8,10 +8,10 @@ sublattice models and symmetry from user-input.
 
 import numpy as np
 import pytest
-from dfttk.structure_builders.sqs_db import lat_in_to_sqs
+from dfttk.structure_builders.sqs_db import lat_in_to_sqs, SQSDatabase, SQSDatabaseATAT, get_structures_from_database
 from pymatgen.core import Lattice, Structure
 
-from dfttk.structure_builders.sqs import AbstractSQS, enumerate_sqs
+from dfttk.structure_builders.sqs import AbstractSQS, enumerate_sqs, iter_sqs
 from dfttk import PRLStructure
 
 ATAT_FCC_A1_LEV3_LATTICE_IN = """1.000000 0.000000 0.000000
@@ -327,6 +327,86 @@ def test_multiple_sqs_list_from_database():
     raise NotImplementedError
 
 
+def test_sqs_database_index(tmp_path):
+    """The SQS database should be indexed once and parsed again only for the modified files"""
+    import json
+    import os
+    for name, lattice_in in [('L12', ATAT_FCC_L12_LATTICE_IN), ('B1', ATAT_ROCKSALT_B1_LATTICE_IN),
+                             ('A1', ATAT_FCC_A1_LEV3_LATTICE_IN)]:
+        (tmp_path / name).mkdir()
+        with open(str(tmp_path / name / 'sqs.json'), 'w') as fp:
+            json.dump(lat_in_to_sqs(lattice_in).as_dict(), fp)
+    db = SQSDatabase(str(tmp_path))
+    assert db.nparsed == 3 and len(db) == 3
+    assert len(db.as_tinydb()) == 3
+    results = get_structures_from_database(db, 'Pm-3m', [['Al', 'Ni'], ['Fe']], [1, 3])
+    assert [r['sublattice_site_ratios'] for r in results] == [[[1, 1], [6]]]
+    assert get_structures_from_database(db, 'Pm-3m', [['Al'], ['Fe']], [1, 1]) == []
+    #same reduced site ratios but not a multiple
+    assert get_structures_from_database(db, 'Pm-3m', [['Al', 'Ni'], ['Fe']], [3, 9]) == []
+    assert len(get_structures_from_database(db, 'Fm-3m', [['Al', 'Ni'], ['Fe']], [1, 1])) == 1
+    assert len(get_structures_from_database(db.as_tinydb(), 'Pm-3m', [['Al', 'Ni'], ['Fe']], [1, 3])) == 1
+    assert len(SQSDatabase(str(tmp_path), name_constraint='l12')) == 1
+
+    db = SQSDatabase(str(tmp_path))
+    assert db.nparsed == 0 and len(db) == 3
+    fname = str(tmp_path / 'L12' / 'sqs.json')
+    with open(fname) as fp:
+        d = json.load(fp)
+    d['symmetry']['symbol'] = 'P1'
+    with open(fname, 'w') as fp:
+        json.dump(d, fp, indent=1)
+    os.remove(str(tmp_path / 'B1' / 'sqs.json'))
+    db = SQSDatabase(str(tmp_path))
+    assert db.nparsed == 1 and len(db) == 2
+    assert len(get_structures_from_database(db, 'P1', [['Al', 'Ni'], ['Fe']], [1, 3])) == 1
+
+
+def test_sqs_database_read_only(tmp_path, monkeypatch):
+    """A read only SQS database should be parsed without the index instead of failing"""
+    import json
+    import os
+    import sqlite3
+    sqsdb = tmp_path / 'sqsdb'
+    atatdb = tmp_path / 'atat'
+    for name, lattice_in in [('L12', ATAT_FCC_L12_LATTICE_IN), ('B1', ATAT_ROCKSALT_B1_LATTICE_IN)]:
+        (sqsdb / name).mkdir(parents=True)
+        with open(str(sqsdb / name / 'sqs.json'), 'w') as fp:
+            json.dump(lat_in_to_sqs(lattice_in).as_dict(), fp)
+        (atatdb / (name+'_proto') / 'sqsdb_lev=0_a=1').mkdir(parents=True)
+        with open(str(atatdb / (name+'_proto') / 'sqsdb_lev=0_a=1' / 'bestsqs.out'), 'w') as fp:
+            fp.write(lattice_in)
+    #an index out of date (L12 only) in the read only database
+    (sqsdb / 'B1' / 'sqs.json').rename(sqsdb / 'sqs.json.bak')
+    assert len(SQSDatabase(str(sqsdb))) == 1
+    (sqsdb / 'sqs.json.bak').rename(sqsdb / 'B1' / 'sqs.json')
+    index_file = str(sqsdb / '.sqs_index.sqlite')
+    st = os.stat(index_file)
+
+    #chmod does not restrict root, the SQLite files are opened read only instead
+    connect = sqlite3.connect
+    def connect_read_only(database, *args, **kwargs):
+        if database == ':memory:':
+            return connect(database, *args, **kwargs)
+        return connect('file:{}?mode=ro'.format(database), *args, uri=True, **kwargs)
+    monkeypatch.setattr(sqlite3, 'connect', connect_read_only)
+    os.chmod(str(sqsdb), 0o555)
+    os.chmod(str(tmp_path), 0o555)
+    try:
+        db = SQSDatabase(str(sqsdb))
+        assert db.nparsed == 2 and len(db) == 2
+        assert len(get_structures_from_database(db, 'Pm-3m', [['Al', 'Ni'], ['Fe']], [1, 3])) == 1
+        assert (os.stat(index_file).st_mtime_ns, os.stat(index_file).st_size) == (st.st_mtime_ns, st.st_size)
+        #no index file at all
+        db = SQSDatabaseATAT(str(atatdb), db_save_path=str(tmp_path))
+        assert db.nparsed == 2 and len(db) == 2
+        assert [d['prototype'] for d in db] == [['B1', 'proto'], ['L12', 'proto']]
+        assert not os.path.exists(str(tmp_path / 'ATAT_SQSDB.sqlite'))
+    finally:
+        os.chmod(str(tmp_path), 0o755)
+        os.chmod(str(sqsdb), 0o755)
+
+
 def test_abstract_sqs_is_properly_substituted_with_sublattice_model():
     """Test that an abstract SQS can correctly be make concrete."""
     structure = lat_in_to_sqs(ATAT_FCC_L12_LATTICE_IN)
@@ -393,6 +473,23 @@ def test_enumerating_sqs_with_lower_order_subl_raises():
     structures = enumerate_sqs(structure, [['Fe','Ni']])
     assert len(structures) == 4
 
+def test_iter_sqs_is_lazy_and_unique():
+    """iter_sqs should yield the unique structures of enumerate_sqs lazily in the same order"""
+    import types
+    structure = lat_in_to_sqs(ATAT_ROCKSALT_B1_LATTICE_IN)
+    subl_model = [['Al', 'Ni', 'Fe'], ['Fe', 'Ni', 'Cr']]
+    sqs_iter = iter_sqs(structure, subl_model, scale_volume=False)
+    assert isinstance(sqs_iter, types.GeneratorType)
+    structures = enumerate_sqs(structure, subl_model, scale_volume=False)
+    configs = [(s.sublattice_configuration, s.sublattice_occupancies) for s in sqs_iter]
+    assert configs == [(s.sublattice_configuration, s.sublattice_occupancies) for s in structures]
+    assert len(set([str(c) for c in configs])) == 36
+    assert len(enumerate_sqs(structure, subl_model, scale_volume=False, limit=5)) == 5
+
+    structure = lat_in_to_sqs(ATAT_FCC_A1_LEV3_LATTICE_IN)
+    structures = enumerate_sqs(structure, [['Fe', 'Ni', 'Cr', 'Al']], scale_volume=False)
+    assert len(structures) == 20
+
 def test_sqs_finds_correct_endmember_symmetry():
     """SQS shouldd correctly find endmember symmetry."""
     fcc_l12 = lat_in_to_sqs(ATAT_FCC_L12_LATTICE_IN)
@@ -1,5 +1,9 @@
 #!python
+import os
+import math
+import itertools
 import pytest
+import numpy as np
 
 import dfttk.utils as dfttkutils
 from dfttk.input_sets import RelaxSet
@@ -32,6 +36,9 @@ direct
 0.000000 0.500000 0.626658 O
 0.500000 0.000000 0.626658 O"""
 
+EXAMPLE_VASPRUN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dfttk_example", "dfttk_example",
+    "output", "AlNi3_P-1_2PBE", "Yphon", "V165.113197", "vasprun.xml.gz")
+
 try:
     API_KEY = SETTINGS["PMG_MAPI_KEY"]
     PMG_VASP_PSP_DIR = SETTINGS["PMG_VASP_PSP_DIR"]
@@ -115,4 +122,223 @@ def test_supercell_scaling_by_atom_lat_vol():
                                       upper_search_limit=upper_search_limit, verbose=False)
     print(optimal_sc_shape)
 
+@pytest.mark.parametrize("target_size, target_shape", [(8, 'sc'), (20, 'sc'), (16, 'fcc')])
+def test_find_optimal_cell_shape_in_range(target_size, target_shape):
+    from pymatgen.core import Lattice
+    cell = Lattice.from_parameters(2.9, 4.1, 5.3, 80, 95, 100).matrix
+    min_size, max_size = int(target_size*0.8), math.ceil(target_size*1.2)
+    starting_P = dfttkutils.find_optimal_cell_shape_in_range(cell, target_size, target_shape)
+    #the sequential search
+    best_score, optimal_P = 1e6, None
+    dPlist = list(itertools.product(range(-1, 2), repeat=9))
+    dPlist.remove((0,)*9)
+    for dP in [(0,)*9] + dPlist:
+        P = starting_P + np.array(dP).reshape(3, 3)
+        size = np.around(np.linalg.det(P))
+        if size < min_size or size > max_size: continue
+        norm_cell = dfttkutils.get_norm_cell(cell, size, target_shape=target_shape)
+        score = dfttkutils.cell_shape_deviation(np.dot(P, norm_cell), target_shape)[0]
+        if score < best_score: best_score, optimal_P = score, P
+    P = dfttkutils.find_optimal_cell_shape_in_range(cell, target_size, target_shape, optimize_sc=True,
+        lower_limit=-1, upper_limit=1)
+    assert(np.array_equal(P, optimal_P))
+    Ps = np.random.RandomState(0).randint(-3, 4, size=(100, 3, 3))
+    assert(np.array_equal(dfttkutils.int_det3(Ps), np.around(np.linalg.det(Ps))))
+
+def _brute_force_cell_shape(cell, target_size, target_shape, lower_limit=-1, upper_limit=1):
+    """the search of the original find_optimal_cell_shape_in_range, scoring the candidates one by one by ase"""
+    try:
+        from ase.build.supercells import eval_length_deviation
+        score_cell = lambda c: eval_length_deviation(c, target_shape=target_shape)
+    except ImportError:
+        from ase.build import get_deviation_from_optimal_cell_shape
+        score_cell = lambda c: get_deviation_from_optimal_cell_shape(c, target_shape=target_shape, norm=1.0)
+    min_size, max_size = int(target_size*0.8), math.ceil(target_size*1.2)
+    target_metric = np.eye(3) if target_shape == 'sc' else 0.5*np.array([[0, 1, 1], [1, 0, 1], [1, 1, 0]], dtype=float)
+    norm = (target_size*np.linalg.det(cell)/np.linalg.det(target_metric))**(-1.0/3)
+    starting_P = np.array(np.around(np.dot(target_metric, np.linalg.inv(norm*cell)), 0), dtype=int)
+    best_score, optimal_P = 1e6, None
+    dPlist = list(itertools.product(range(lower_limit, upper_limit + 1), repeat=9))
+    dPlist.remove((0,)*9)
+    for dP in [(0,)*9] + dPlist:
+        P = starting_P + np.array(dP, dtype=int).reshape(3, 3)
+        size = np.around(np.linalg.det(P))
+        if size < min_size or size > max_size: continue
+        norm_new = dfttkutils.get_norm_cell(cell, size, target_shape=target_shape)
+        score = score_cell(np.dot(P, norm_new))
+        if score < best_score: best_score, optimal_P = score, P
+        if best_score < 1e-5: break
+    return optimal_P
+
+@pytest.mark.parametrize("lattice, target_size, target_shape", [
+    ([[0, 2.02, 2.02], [2.02, 0, 2.02], [2.02, 2.02, 0]], 8, 'sc'),      #fcc Al primitive
+    ([[-1.43, 1.43, 1.43], [1.43, -1.43, 1.43], [1.43, 1.43, -1.43]], 16, 'fcc'), #bcc Fe primitive
+    ([[3.21, 0, 0], [-1.605, 2.78, 0], [0, 0, 5.21]], 27, 'sc'),         #hcp Mg
+    ([[2.0, 0, 0], [0, 2.0, 0], [0, 0, 8.0]], 12, 'sc'),                 #Ti1 Pb1 O3 of POSCAR_scalling_t1
+    ([[5.1, 0, 0], [0, 5.9, 0], [-1.73, 0, 7.21]], 32, 'fcc')])          #monoclinic cell
+def test_find_optimal_cell_shape_brute_force(lattice, target_size, target_shape):
+    cell = np.array(lattice)
+    P = dfttkutils.find_optimal_cell_shape_in_range(cell, target_size, target_shape, optimize_sc=True,
+        lower_limit=-1, upper_limit=1)
+    assert(np.array_equal(P, _brute_force_cell_shape(cell, target_size, target_shape)))
+
+@pytest.mark.parametrize("target_shape, target_metric", [('sc', np.eye(3)),
+    ('fcc', 0.5*np.array([[0, 1, 1], [1, 0, 1], [1, 1, 0]]))])
+def test_cell_shape_deviation_ase322(monkeypatch, target_shape, target_metric):
+    #without eval_length_deviation, the score is the norm=1.0 one of ase<=3.22
+    monkeypatch.setattr(dfttkutils, 'eval_length_deviation', None)
+    np.random.seed(0)
+    cells = np.random.randn(7, 3, 3)
+    scores = dfttkutils.cell_shape_deviation(cells, target_shape)
+    assert(np.allclose(scores, [np.linalg.norm(c - target_metric) for c in cells], rtol=1e-12, atol=0))
+
+@pytest.mark.parametrize("dtype, compression", [('float64', 'gzip'), ('float64', None), ('float32', 'gzip')])
+def test_encode_force_constants(dtype, compression):
+    np.random.seed(0)
+    force_constants = np.random.randn(4, 4, 3, 3)
+    d = dfttkutils.encode_force_constants(force_constants, dtype=dtype, compression=compression)
+    assert(d['dtype'] == np.dtype(dtype).newbyteorder('<').str)
+    assert(d['shape'] == [4, 4, 3, 3])
+    fc = dfttkutils.decode_force_constants(d)
+    assert(fc.dtype == np.float64)
+    assert(np.allclose(fc, force_constants, rtol=0, atol=1.e-6 if dtype=='float32' else 0))
+    #documents written before the compact encoding hold nested lists
+    assert(np.array_equal(dfttkutils.decode_force_constants(force_constants.tolist()), force_constants))
+
+def test_encode_force_constants_zstd(monkeypatch):
+    np.random.seed(0)
+    force_constants = np.random.randn(4, 4, 3, 3)
+    #gzip by default, whatever is installed, so that any host can read the stored data
+    d = dfttkutils.encode_force_constants(force_constants)
+    assert(d['compression'] == 'gzip')
+    zstd = pytest.importorskip("zstandard")
+    d = dfttkutils.encode_force_constants(force_constants, compression='zstd')
+    assert(d['compression'] == 'zstd')
+    assert(np.frombuffer(zstd.ZstdDecompressor().decompress(d['data']), dtype='<f8').size == force_constants.size)
+    assert(np.array_equal(dfttkutils.decode_force_constants(d), force_constants))
+    monkeypatch.setattr(dfttkutils, 'zstd', None)
+    with pytest.warns(UserWarning):
+        d = dfttkutils.encode_force_constants(force_constants, compression='zstd')
+    assert(d['compression'] == 'gzip')
+    assert(np.array_equal(dfttkutils.decode_force_constants(d), force_constants))
+
 #test_supercell_scaling_by_target_atoms()
+
+def test_metadata_filter():
+    assert(dfttkutils.metadata_filter({'tag': 'abc'}) == {'metadata.tag': 'abc', 'metadata': {'tag': 'abc'}})
+    assert(dfttkutils.metadata_filter({'x': 1}) == {'metadata': {'x': 1}})
+
+OUTCAR_MAG = """ magnetization (x)
+
+# of ion       s       p       d       tot
+------------------------------------------
+    1        0.010   0.020   1.000   1.030
+    2       -0.010  -0.020  -1.000  -1.030
+--------------------------------------------------
+tot          0.000   0.000   0.000   0.000
+
+ free  energy   TOTEN  =       -16.0 eV
+ magnetization (x)
+
+# of ion       s       p       d       tot
+------------------------------------------
+    1        0.010   0.020   2.000   2.030
+    2       -0.010  -0.020  -2.000  -2.030
+--------------------------------------------------
+tot          0.000   0.000   0.000   0.000
+
+ total amount of memory used by VASP MPI-rank0   100. kBytes
+"""
+
+VASPRUN_STEPS = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<modeling>
+ <calculation>
+  <scstep><energy><i name="e_fr_energy">-9.0</i><i name="e_wo_entrp">-9.0</i><i name="e_0_energy">-9.0</i></energy></scstep>
+  <energy><i name="e_fr_energy">-10.0</i><i name="e_wo_entrp">-10.2</i><i name="e_0_energy">-10.1</i></energy>
+ </calculation>
+ <calculation>
+  <scstep><energy><i name="e_fr_energy">-11.0</i><i name="e_wo_entrp">-11.0</i><i name="e_0_energy">-11.0</i></energy></scstep>
+  <scstep><energy><i name="e_fr_energy">-12.0</i><i name="e_wo_entrp">-12.0</i><i name="e_0_energy">-12.05</i></energy></scstep>
+  <energy><i name="e_fr_energy">-12.0</i><i name="e_wo_entrp">-12.2</i><i name="e_0_energy">-12.05</i></energy>
+  <dos><total><array><set><r>0 0</r></set></array></total></dos>
+ </calculation>
+</modeling>
+"""
+
+def test_read_vasp_outputs(tmp_path):
+    with open(str(tmp_path / "OUTCAR"), "w") as fp:
+        fp.write(OUTCAR_MAG)
+    assert(dfttkutils.read_outcar_magnetization(str(tmp_path / "OUTCAR")) == [2.03, -2.03])
+    with open(str(tmp_path / "vasprun.xml"), "w") as fp:
+        fp.write(VASPRUN_STEPS)
+    energies = dfttkutils.read_vasprun_energies(str(tmp_path / "vasprun.xml"))
+    assert(energies["nionic_steps"] == 2)
+    assert(energies["initial"]["e_wo_entrp"] == -10.2)
+    assert(energies["final_energy"] == -12.05)
+    #truncated by an unfinished run
+    with open(str(tmp_path / "vasprun.xml"), "w") as fp:
+        fp.write(VASPRUN_STEPS[0:VASPRUN_STEPS.index("<dos>")])
+    with pytest.raises(ValueError, match="incomplete after 1 ionic steps"):
+        dfttkutils.read_vasprun_energies(str(tmp_path / "vasprun.xml"))
+
+@pytest.mark.skipif(not os.path.exists(EXAMPLE_VASPRUN), reason="dfttk_example required")
+def test_read_vasprun_tdos():
+    from pymatgen.io.vasp.outputs import Vasprun
+    from pymatgen.electronic_structure.core import Spin
+    ref = Vasprun(EXAMPLE_VASPRUN, parse_dos=True, parse_eigen=False, parse_projected_eigen=False,
+        parse_potcar_file=False).tdos
+    efermi, energies, densities = dfttkutils.read_vasprun_tdos(EXAMPLE_VASPRUN)
+    assert(efermi == ref.efermi)
+    assert(np.array_equal(energies, ref.energies))
+    assert(densities.shape == (2, len(ref.energies)))
+    assert(np.array_equal(densities[0], ref.densities[Spin.up]))
+    assert(np.array_equal(densities[1], ref.densities[Spin.down]))
+
+@pytest.mark.skipif(not os.path.exists(EXAMPLE_VASPRUN), reason="dfttk_example required")
+def test_read_vasprun_energies_pymatgen(tmp_path):
+    import gzip
+    from pymatgen.io.vasp.outputs import Vasprun
+    #a relaxation of three ionic steps made of the static example, whose last e_0_energy is 0 (VASP bug)
+    with gzip.open(EXAMPLE_VASPRUN, 'rt') as fp:
+        xml = fp.read()
+    i0, i1 = xml.index('<calculation>'), xml.index('</calculation>')+len('</calculation>')
+    steps = [xml[i0:i1].replace('-87.47673330', e) for e in ('-87.40000000', '-87.45000000')]
+    relax = str(tmp_path / "vasprun.xml")
+    with open(relax, 'w') as fp:
+        fp.write(xml[:i0] + '\n'.join(steps) + '\n' + xml[i0:])
+    for fname in (EXAMPLE_VASPRUN, relax):
+        ref = Vasprun(fname, parse_dos=False, parse_eigen=False, parse_projected_eigen=False,
+            parse_potcar_file=False)
+        energies = dfttkutils.read_vasprun_energies(fname)
+        assert(energies["nionic_steps"] == len(ref.ionic_steps))
+        assert(energies["final_energy"] == ref.final_energy)
+        for key in ("e_fr_energy", "e_wo_entrp", "e_0_energy"):
+            assert(energies["initial"][key] == ref.ionic_steps[0][key])
+            assert(energies["final"][key] == ref.ionic_steps[-1][key])
+    assert(energies["nionic_steps"] == 3)
+    assert(energies["initial"]["e_fr_energy"] == -87.4)
+
+def test_read_outcar_magnetization_pymatgen(tmp_path):
+    from pymatgen.io.vasp.outputs import Outcar
+    #the lines pymatgen Outcar needs besides the magnetization
+    header = ("   IBRION =      2    ionic relax\n total plane-waves  NPLWV =   32768\n\n\n\n" + "-"*104 + "\n\n\n"
+        " k-point     1 :       0.0000    0.0000    0.0000  plane waves:    4096\n\n"
+        " maximum and minimum number of plane-waves per node :      4096     4096\n\n")
+    single = OUTCAR_MAG.split(" total amount")[0].replace("    2       -0.010  -0.020  -2.000  -2.030\n", "")
+    for i, body in enumerate((OUTCAR_MAG, single, " free  energy   TOTEN  =       -16.0 eV\n")):
+        outcar = str(tmp_path / "OUTCAR{}".format(i))
+        with open(outcar, "w") as fp:
+            fp.write(header + body)
+        ref = [m["tot"] for m in Outcar(outcar).magnetization]
+        assert(len(ref) == 2-i)
+        assert(dfttkutils.read_outcar_magnetization(outcar) == ref)
+
+def test_bond_distance_change():
+    from pymatgen.core import Lattice
+    from dfttk.analysis.relaxing import get_bond_distance_change
+    np.random.seed(0)
+    coords = np.random.rand(11, 3)
+    initial = Structure(Lattice.from_parameters(5, 6, 7, 80, 90, 100), ['Fe']*11, coords)
+    final = Structure(Lattice.from_parameters(5.1, 6, 6.9, 81, 90, 100), ['Fe']*11, coords + 0.01*np.random.rand(11, 3))
+    ref = np.linalg.norm((initial.distance_matrix - final.distance_matrix)/2)/len(initial)
+    assert(get_bond_distance_change(initial, final, block_size=4) == pytest.approx(ref, rel=1.e-12))
@@ -0,0 +1,87 @@
+import os
+import time
+import dfttk.yphoncache as yphoncache
+from dfttk.yphoncache import yphon_cache_key, yphon_cache_get, yphon_cache_put, yphon_cache_info, \
+    yphon_cache_prune, run_yphon
+
+
+def _write(fname, text):
+    with open(fname, 'w') as fp:
+        fp.write(text)
+
+
+def test_yphon_cache(tmp_path):
+    root = str(tmp_path / "cache")
+    for phase in ("phase1", "phase2"):
+        os.makedirs(str(tmp_path / phase))
+        _write(str(tmp_path / phase / "superfij.out"), "1.0 2.0\n3.0 4.0\n")
+    sfij1 = str(tmp_path / "phase1" / "superfij.out")
+    sfij2 = str(tmp_path / "phase2" / "superfij.out")
+    key = yphon_cache_key("-DebCut 0.5", inputs=[sfij1])
+    #the key depends only on the content and the flags
+    assert key == yphon_cache_key("-DebCut  0.5", inputs=[sfij2])
+    assert key != yphon_cache_key("-DebCut 0.5 -thr2 0.001", inputs=[sfij1])
+
+    vdos1 = str(tmp_path / "phase1" / "vdos.out")
+    vdos2 = str(tmp_path / "phase2" / "vdos.out")
+    assert not yphon_cache_get(key, dest=vdos2, root=root)
+    _write(vdos1, "0.0 0.0\n1.0 0.5\n")
+    yphon_cache_put(key, src=vdos1, root=root)
+    assert yphon_cache_get(key, dest=vdos2, root=root)
+    with open(vdos2) as fp:
+        assert fp.read() == "0.0 0.0\n1.0 0.5\n"
+    #a hit does not call Yphon
+    os.remove(vdos2)
+    assert run_yphon("-DebCut 0.5", voldir=str(tmp_path / "phase2"), root=root)
+    assert os.path.exists(vdos2)
+
+    _write(sfij2, "1.0 2.0\n3.0 5.0\n")
+    key2 = yphon_cache_key("-DebCut 0.5", inputs=[sfij2])
+    assert key2 != key
+    time.sleep(0.01)
+    yphon_cache_put(key2, src=vdos1, root=root)
+    _, nentries, size = yphon_cache_info(root=root)
+    assert nentries == 2
+    #the least recently used entry is evicted first
+    os.utime(os.path.join(root, key[0:2], key+".vdos.gz"), (0, 0))
+    assert yphon_cache_prune(size-1, root=root) == 1
+    assert not yphon_cache_get(key, dest=vdos2, root=root)
+    assert yphon_cache_get(key2, dest=vdos2, root=root)
+    assert yphon_cache_prune(0, root=root) == 1
+    assert yphon_cache_info(root=root)[1] == 0
+
+
+def test_yphon_cache_executable(tmp_path, monkeypatch):
+    _write(str(tmp_path / "superfij.out"), "1.0 2.0\n3.0 4.0\n")
+    sfij = str(tmp_path / "superfij.out")
+    bindir = tmp_path / "bin"
+    os.mkdir(str(bindir))
+    exe = str(bindir / "Yphon")
+    _write(exe, "#!/bin/sh\n")
+    os.chmod(exe, 0o755)
+    monkeypatch.setenv("PATH", str(bindir))
+    key = yphon_cache_key("-DebCut 0.5", inputs=[sfij])
+    assert key == yphon_cache_key("-DebCut 0.5", inputs=[sfij])
+    #a rebuilt Yphon
+    _write(exe, "#!/bin/sh\nexit 0\n")
+    assert key != yphon_cache_key("-DebCut 0.5", inputs=[sfij])
+    assert yphon_cache_key("-DebCut 0.5", inputs=[sfij], executable=None) != key
+
+
+def test_yphon_cache_usage(tmp_path, monkeypatch):
+    root = str(tmp_path / "cache")
+    vdos = str(tmp_path / "vdos.out")
+    _write(vdos, "0.0 0.0\n1.0 0.5\n")
+    walks = []
+    entries = yphoncache.yphon_cache_entries
+    monkeypatch.setattr(yphoncache, "yphon_cache_entries", lambda root=None: walks.append(root) or entries(root=root))
+    #the first put counts the entries, the next ones only update the recorded size
+    for i in range(3):
+        yphon_cache_put("{:02d}".format(i)*32, src=vdos, root=root, max_size=1<<20)
+    assert len(walks) == 1
+    size = yphon_cache_info(root=root)[2]
+    assert yphoncache._read_cache_usage(root=root) == size
+    #over the limit, the oldest entries are evicted
+    yphon_cache_put("03"*32, src=vdos, root=root, max_size=size)
+    assert yphon_cache_info(root=root)[1] == 3
+    assert yphoncache._read_cache_usage(root=root) == yphon_cache_info(root=root)[2]
@@ -0,0 +1,54 @@
+import os
+import numpy as np
+from dfttk.analysis import ywplot
+from dfttk.analysis.ywplot import ThermoplotQueue
+
+
+def test_thermoplot_queue(tmp_path):
+    cwd = os.getcwd()
+    folder = str(tmp_path / "figures")
+    os.mkdir(folder)
+    T = list(np.arange(0, 1000, 10.))
+    S = list(np.log(1+np.arange(0, 1000, 10.)))
+    for jobs in (1, 2):
+        figs = ThermoplotQueue(jobs=jobs)
+        figs.add(folder, "Entropy (J/mol-atom K)", T, S, yzero=0.0)
+        figs.add(folder, "Entropy (J/mol-atom K)", T, S, yzero=0.0, xlim=100)
+        res = figs.render()
+        assert res == [("Entropy (J/mol-atom K)", "Entropy.png"), ("Entropy (J/mol-atom K)", "Entropy_100.png")]
+        assert os.getcwd() == cwd
+        assert ywplot.figures["Entropy (J/mol-atom K)"] == os.path.join("figures", "Entropy_100.png")
+        mtime = os.path.getmtime(os.path.join(folder, "Entropy.png"))
+        #unchanged data and style are not rendered again
+        os.utime(os.path.join(folder, "Entropy.png"), (0, 0))
+        figs.add(folder, "Entropy (J/mol-atom K)", T, S, yzero=0.0)
+        assert figs.render() == res[0:1]
+        assert os.path.getmtime(os.path.join(folder, "Entropy.png")) == 0
+        figs.add(folder, "Entropy (J/mol-atom K)", T, list(2*np.array(S)), yzero=0.0)
+        figs.render()
+        assert os.path.getmtime(os.path.join(folder, "Entropy.png")) > 0
+        #the previous figure in the same file is forgotten
+        figs.add(folder, "Entropy (J/mol-atom K)", T, S, yzero=0.0)
+        figs.render()
+        assert os.path.getmtime(os.path.join(folder, "Entropy.png")) > 0
+        os.remove(os.path.join(folder, ywplot.THERMOPLOT_CACHE))
+
+
+def test_thermoplot_queue_failure(tmp_path):
+    folder = str(tmp_path / "figures")
+    os.mkdir(folder)
+    T = list(np.arange(0, 1000, 10.))
+    S = list(np.log(1+np.arange(0, 1000, 10.)))
+    for jobs in (1, 2):
+        figs = ThermoplotQueue(jobs=jobs)
+        #x and y of different lengths
+        figs.add(folder, "Entropy (J/mol-atom K)", T, S[0:-3], yzero=0.0)
+        figs.add(folder, "Entropy (J/mol-atom K)", T, S, yzero=0.0, xlim=100)
+        res = figs.render()
+        assert res == [("Entropy (J/mol-atom K)", None), ("Entropy (J/mol-atom K)", "Entropy_100.png")]
+        assert len(figs.failed) == 1 and figs.failed[0][0] == "Entropy (J/mol-atom K)"
+        assert os.path.exists(os.path.join(folder, "Entropy_100.png"))
+        #the successful figure is cached
+        figs.add(folder, "Entropy (J/mol-atom K)", T, S, yzero=0.0, xlim=100)
+        assert figs.render() == res[1:2] and figs.failed == []
+        os.remove(os.path.join(folder, ywplot.THERMOPLOT_CACHE))